@@ -26,10 +26,17 @@
 __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
+from .client import MedusaClient
 from .medusa import (Medusa,
                      MedusaError,
                      main as medusa)
+from .server import MedusaServer
+from .streams import MedusaReader, MedusaWriter
 
 __all__ = ['Medusa',
+           'MedusaClient',
            'MedusaError',
+           'MedusaReader',
+           'MedusaServer',
+           'MedusaWriter',
            'medusa']
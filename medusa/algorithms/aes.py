@@ -27,15 +27,38 @@ __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
 import binascii
+import hmac
+import json
 import os
-from hashlib import pbkdf2_hmac
+import threading
+import time
+from collections import OrderedDict
+from hashlib import pbkdf2_hmac, scrypt, sha256
 from Crypto.Cipher import AES
 from Crypto.Util import Counter
 
 from .common import Algorithm
 
 
-def int_to_bytes(i, signed=False):
+SALT_SIZE = 16
+
+# key derivation functions of the passwords, and their parameters:
+# "pbkdf2:<iterations>" (PBKDF2-SHA256) or "scrypt:<n>:<r>:<p>"
+KDFS = {'pbkdf2': ['iterations'], 'scrypt': ['n', 'r', 'p']}
+DEFAULT_KDF = 'pbkdf2:100000'
+
+# derived keys memoized by `cached_derive_key_from_pwd` (least recently used
+# first), and the per-process key of their hashes
+KEY_CACHE_SIZE = 64
+_KEY_CACHE = OrderedDict()
+_KEY_CACHE_LOCK = threading.Lock()
+_KEY_CACHE_SECRET = os.urandom(32)
+
+# time a derivation should take, for the calibration (in seconds)
+KDF_TARGET_TIME = 0.25
+
+
+def int_to_bytes(i, signed=False, length=None):
     '''Converts an int to hex bytes.
 
     Parameters
@@ -44,13 +67,16 @@ def int_to_bytes(i, signed=False):
         Integer to convert.
     signed : bool
         Whether or not the integer is signed.
+    length : int, optional
+        Number of bytes of the result (the minimal number of bytes if None).
 
     Returns
     -------
     bytes
         Converted result.
     '''
-    length = ((i + ((i * signed) < 0)).bit_length() + 7 + signed) // 8
+    if length is None:
+        length = ((i + ((i * signed) < 0)).bit_length() + 7 + signed) // 8
     return i.to_bytes(length, byteorder='big', signed=signed)
 
 
@@ -72,34 +98,153 @@ def bytes_to_int(b, signed=False):
     return int.from_bytes(b, byteorder='big', signed=signed)
 
 
-def derive_key_from_pwd(password, salt):
+def parse_kdf(kdf):
+    '''Parses the description of a key derivation function (see `KDFS`).
+
+    Parameters
+    ----------
+    kdf : str
+        Description of the function and its parameters (e.g.
+        "pbkdf2:100000" or "scrypt:16384:8:1").
+
+    Returns
+    -------
+    (str, list(int))
+        Name of the function and its parameters.
+
+    Raises
+    ------
+    ValueError
+        If the description is invalid.
+    '''
+    name, *values = str(kdf).split(':')
+    try:
+        values = [int(v) for v in values]
+    except ValueError:
+        values = None
+    if name not in KDFS or values is None or len(values) != len(KDFS[name]) \
+            or any(v < 1 for v in values) \
+            or (name == 'scrypt' and (values[0] < 2 or values[0] & (values[0] - 1))):
+        raise ValueError('Invalid key derivation: "{}" (expected: {}).'.format(
+            kdf, ', '.join('{}:<{}>'.format(k, '>:<'.join(v))
+                           for k, v in KDFS.items())))
+    return name, values
+
+
+def derive_key_from_pwd(password, salt, kdf=DEFAULT_KDF):
     '''Creates a bytes key from a string password (with a repeatable but secure
-    process using PBKDF2).
+    process using PBKDF2 or scrypt).
 
     Parameters
     ----------
     password : str
         Password to derive.
+    salt : bytes
+        Salt of the derivation.
+    kdf : str, optional
+        Key derivation function and its parameters (see `parse_kdf`)
+        (PBKDF2-SHA256 with 100,000 iterations by default).
 
     Returns
     -------
     bytes
         Newly created key.
     '''
-    key = pbkdf2_hmac('sha256', password.encode(), salt, 100000, dklen=32)
+    name, values = parse_kdf(kdf)
+    if name == 'scrypt':
+        n, r, p = values
+        # (the memory scrypt needs, with some margin)
+        key = scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                     maxmem=256 * n * r * p + 1024 * 1024, dklen=32)
+    else:
+        key = pbkdf2_hmac('sha256', password.encode(), salt, values[0],
+                          dklen=32)
     return key
 
 
+def cached_derive_key_from_pwd(password, salt, kdf=DEFAULT_KDF):
+    '''Same as `derive_key_from_pwd` but memoized, so that processing many
+    contents with the same password and salt only derives the key once (the
+    last `KEY_CACHE_SIZE` keys are kept, by a keyed hash of their password,
+    salt and derivation, so that no password stays in memory).'''
+    digest = hmac.new(_KEY_CACHE_SECRET,
+                      json.dumps([password, repr(salt), kdf]).encode(),
+                      sha256).digest()
+    with _KEY_CACHE_LOCK:
+        key = _KEY_CACHE.get(digest)
+        if key is not None:
+            _KEY_CACHE.move_to_end(digest)
+            return key
+    key = derive_key_from_pwd(password, salt, kdf)
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE[digest] = key
+        while len(_KEY_CACHE) > KEY_CACHE_SIZE:
+            _KEY_CACHE.popitem(last=False)
+    return key
+
+
+def calibrate_kdf(name='pbkdf2', target=KDF_TARGET_TIME, r=8, p=1):
+    '''Finds the parameters of a key derivation function for which a
+    derivation takes about a target time on this machine.
+
+    Parameters
+    ----------
+    name : str, optional
+        Key derivation function (see `KDFS`) ("pbkdf2" by default).
+    target : float, optional
+        Time a derivation should take, in seconds (0.25s by default).
+    r : int, optional
+        Block size, for scrypt (8 by default).
+    p : int, optional
+        Parallelization, for scrypt (1 by default).
+
+    Returns
+    -------
+    (str, float)
+        Description of the function and its parameters (see `parse_kdf`), and
+        the measured time of a derivation.
+    '''
+    if name not in KDFS:
+        raise ValueError('Unknown key derivation: "{}".'.format(name))
+
+    def _time(kdf):
+        start = time.perf_counter()
+        derive_key_from_pwd('calibration', bytes(SALT_SIZE), kdf)
+        return time.perf_counter() - start
+
+    if name == 'scrypt':
+        # (the cost doubles with n, the closest power of 2 is kept)
+        n = 1024
+        elapsed = _time('scrypt:{}:{}:{}'.format(n, r, p))
+        while elapsed < target / 1.5:
+            n *= 2
+            elapsed = _time('scrypt:{}:{}:{}'.format(n, r, p))
+        kdf = 'scrypt:{}:{}:{}'.format(n, r, p)
+        return kdf, elapsed
+
+    # (the cost is linear in the number of iterations)
+    iterations = 10000
+    elapsed = _time('pbkdf2:{}'.format(iterations))
+    while elapsed < target / 10:
+        iterations *= 10
+        elapsed = _time('pbkdf2:{}'.format(iterations))
+    kdf = 'pbkdf2:{}'.format(max(1000, int(iterations * target / elapsed)))
+    return kdf, _time(kdf)
+
+
 class Aes(Algorithm):
 
     _name = 'aes'
+    _binary = True
+    _segmentable = True
+    _envelope = True
 
     def __init__(self):
         super().__init__()
 
         # set context
         self.iv_int = bytes_to_int(os.urandom(16))
-        self.salt = os.urandom(16)
+        self.salt = os.urandom(SALT_SIZE)
         self.ctx['iv'] = self.iv_int
         self.ctx['salt'] = bytes_to_int(self.salt)
 
@@ -112,11 +257,17 @@ class Aes(Algorithm):
         if 'iv' in params:
             params['iv'] = int(params['iv'])
         if 'salt' in params:
-            params['salt'] = int_to_bytes(int(params['salt']))
+            # (salts keep their leading zero bytes)
+            params['salt'] = int_to_bytes(int(params['salt']), length=SALT_SIZE)
 
     def check_secure(self, params, action=None):
         if len(params['password']) == 0:
             return False, '"password" cannot be empty'
+        if params.get('kdf') is not None:
+            try:
+                parse_kdf(params['kdf'])
+            except ValueError as e:
+                return False, str(e)
         if action == 'decode':
             if len(str(params['iv'])) == 0:
                 return False, '"iv" cannot be empty'
@@ -124,18 +275,58 @@ class Aes(Algorithm):
                 return False, '"salt" cannot be empty'
         return True, None
 
-    def encode(self, content, params):
-        ctr = Counter.new(AES.block_size * 8, initial_value=self.iv_int)
-        key = derive_key_from_pwd(params['password'], self.salt)
+    def set_context(self, ctx):
+        super().set_context(ctx)
+        self.iv_int = int(self.ctx['iv'])
+        self.salt = int_to_bytes(int(self.ctx['salt']), length=SALT_SIZE)
+
+    def new_context(self):
+        # a fresh IV is enough to get a distinct keystream while keeping the
+        # (costly) derived key reusable
+        return {'iv': bytes_to_int(os.urandom(16))}
+
+    @staticmethod
+    def _cipher(key, iv, offset=0):
+        '''Creates a CTR cipher positioned at a given byte offset of the stream.'''
+        ctr = Counter.new(AES.block_size * 8,
+                          initial_value=(iv + offset // AES.block_size)
+                          % (1 << AES.block_size * 8))
         aes = AES.new(key, AES.MODE_CTR, counter=ctr)
+        if offset % AES.block_size > 0:
+            # skip the beginning of the keystream block
+            aes.encrypt(bytes(offset % AES.block_size))
+        return aes
+
+    @staticmethod
+    def _key(params, salt):
+        # (a data key given with the params is used directly, see `envelope`)
+        if 'data_key' in params:
+            return params['data_key']
+        return cached_derive_key_from_pwd(params['password'], salt,
+                                          params.get('kdf') or DEFAULT_KDF)
+
+    def key_material(self, params):
+        # (the derived key, so that the password is never used directly)
+        return self._key(params, params.get('salt', self.salt))
+
+    def encode_segment(self, content, params, offset):
+        iv = params.get('iv', self.iv_int)
+        key = self._key(params, params.get('salt', self.salt))
+        aes = self._cipher(key, iv, offset)
         if isinstance(content, str):
             content = content.encode()
         encoded = aes.encrypt(content)
         return encoded
 
-    def decode(self, content, params):
-        ctr = Counter.new(AES.block_size * 8, initial_value=params['iv'])
-        key = derive_key_from_pwd(params['password'], params['salt'])
-        aes = AES.new(key, AES.MODE_CTR, counter=ctr)
-        decoded = aes.decrypt(content)
+    def decode_segment(self, content, params, offset):
+        key = self._key(params, params.get('salt'))
+        aes = self._cipher(key, params['iv'], offset)
+        # (in CTR mode, decrypting is applying the same keystream again)
+        decoded = aes.encrypt(content)
         return decoded
+
+    def encode(self, content, params):
+        return self.encode_segment(content, params, 0)
+
+    def decode(self, content, params):
+        return self.decode_segment(content, params, 0)
@@ -26,12 +26,13 @@
 __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
-from .common import Algorithm, ALPHABET
+from .common import Algorithm, shift_content
 
 
 class Caesar(Algorithm):
 
     _name = 'caesar'
+    _segmentable = True
 
     @staticmethod
     def get_params():
@@ -46,11 +47,14 @@ class Caesar(Algorithm):
         return True, None
 
     def encode(self, content, params):
-        shift = params['shift']
-        return ''.join([ALPHABET[(ALPHABET.index(c) + shift) % len(ALPHABET)]
-                        for c in content])
+        return shift_content(content, params['shift'])
 
     def decode(self, content, params):
-        shift = params['shift']
-        return ''.join([ALPHABET[(ALPHABET.index(c) - shift) % len(ALPHABET)]
-                        for c in content])
+        return shift_content(content, -params['shift'])
+
+    def encode_segment(self, content, params, offset):
+        # each character is shifted independently of its position
+        return self.encode(content, params)
+
+    def decode_segment(self, content, params, offset):
+        return self.decode(content, params)
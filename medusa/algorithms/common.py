@@ -27,14 +27,58 @@ __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
 ALPHABET = [chr(x) for x in range(256)]
+# translation tables that shift the characters of the alphabet (as latin-1
+# bytes) by a given amount, to process whole contents with `bytes.translate`
+SHIFT_TABLES = [bytes((x + shift) % len(ALPHABET) for x in range(len(ALPHABET)))
+                for shift in range(len(ALPHABET))]
+
+
+def shift_content(content, shift):
+    '''Shifts all the characters of a content in the alphabet at once.
+
+    Parameters
+    ----------
+    content : str
+        Content to shift (characters out of the alphabet raise a
+        `UnicodeEncodeError`).
+    shift : int
+        Shift to apply.
+
+    Returns
+    -------
+    str
+        Shifted content.
+    '''
+    table = SHIFT_TABLES[shift % len(ALPHABET)]
+    return content.encode('latin-1').translate(table).decode('latin-1')
 
 
 class Algorithm(object):
 
     _name = ''
+    # whether the processing of a content can start at any offset (see
+    # `encode_segment`), so that segments can be processed independently
+    _segmentable = False
+    # whether the algorithm works on bytes rather than on characters
+    _binary = False
+    # maximum size of a content the algorithm can process at once (if any)
+    _max_content_size = None
+    # whether contents can be encrypted under a random data key given with
+    # the params (see `envelope`)
+    _envelope = False
+    # whether the encoded contents are hexadecimal text (they are stored as
+    # raw bytes in the header format, see `pipeline.StreamEncoder`)
+    _hexlified = False
+    # context values that are secrets (they are never written to disk, see
+    # `Medusa.public_context`)
+    _secret_ctx = []
 
     def __init__(self):
-        '''Creates a new instance of this algorithm.'''
+        '''Creates a new instance of this algorithm. Instances are meant to be
+        shared (e.g. by the threads of a server): their configuration and
+        default context are set once, and each processing call gets all it
+        needs through its params, so the processing functions never modify
+        the instance.'''
         self.ctx = {}
 
     @staticmethod
@@ -85,6 +129,48 @@ class Algorithm(object):
         '''
         return self.ctx
 
+    def set_context(self, ctx):
+        '''Restores a context previously returned by `get_ctx` as the default
+        context of the instance (not to be called while the instance is used
+        by other threads: pass the context with the params instead).
+
+        Parameters
+        ----------
+        ctx : dict
+            Context dict.
+        '''
+        self.ctx.update(ctx)
+
+    def new_context(self):
+        '''Creates a fresh context for one processing call (e.g. a new random
+        nonce), to pass along with the params so that successive calls do not
+        share it.
+
+        Returns
+        -------
+        dict
+            Per-call context (empty by default).
+        '''
+        return {}
+
+    def key_material(self, params):
+        '''Returns the secret key the params stand for, to derive other keys
+        from (e.g. the chunk ids key of a deduplicated store, see
+        `ChunkStore.index_key`). By default, the params themselves (for the
+        algorithms without a key derivation).
+
+        Parameters
+        ----------
+        params : dict
+            Processing context (already transformed).
+
+        Returns
+        -------
+        bytes
+            Key material.
+        '''
+        return repr(sorted((k, repr(v)) for k, v in params.items())).encode()
+
     def encode(self, content, params):
         '''Encodes a string using this algorithm.
 
@@ -118,3 +204,107 @@ class Algorithm(object):
             Decoded content.
         '''
         raise NotImplementedError('Must provide a specific decoding function.')
+
+    def encode_segment(self, content, params, offset):
+        '''Encodes a segment of a larger content, as if the previous `offset`
+        characters had already been encoded (only for segmentable algorithms).
+
+        Parameters
+        ----------
+        content : str
+            Segment to encode.
+        params : dict
+            Processing context.
+        offset : int
+            Position of the segment in the whole content.
+
+        Returns
+        -------
+        str
+            Encoded segment.
+        '''
+        if offset == 0:
+            return self.encode(content, params)
+        raise NotImplementedError('Algorithm "{}" cannot process segments.'
+                                  .format(self._name))
+
+    def decode_segment(self, content, params, offset):
+        '''Decodes a segment of a larger content, as if the previous `offset`
+        characters had already been decoded (only for segmentable algorithms).
+
+        Parameters
+        ----------
+        content : str
+            Segment to decode.
+        params : dict
+            Processing context.
+        offset : int
+            Position of the segment in the whole content.
+
+        Returns
+        -------
+        str
+            Decoded segment.
+        '''
+        if offset == 0:
+            return self.decode(content, params)
+        raise NotImplementedError('Algorithm "{}" cannot process segments.'
+                                  .format(self._name))
+
+    def _batch(self, contents, params, offset, process, process_segment):
+        if not self._segmentable:
+            return [process(content, params) for content in contents]
+        if len(contents) == 0:
+            return []
+        # consecutive records are processed as one segment, then cut back
+        # (segmentable algorithms keep the length of the content)
+        res = process_segment(contents[0][:0].join(contents), params, offset)
+        batch, position = [], 0
+        for content in contents:
+            batch.append(res[position:position + len(content)])
+            position += len(content)
+        return batch
+
+    def encode_batch(self, contents, params, offset=0):
+        '''Encodes a batch of records. For segmentable algorithms, the records
+        are consecutive segments of a larger content that starts at `offset`,
+        and they are encoded in one pass (so that each record can be decoded
+        on its own with `decode_segment`); otherwise, each record is encoded
+        independently.
+
+        Parameters
+        ----------
+        contents : list(str)
+            Records to encode.
+        params : dict
+            Processing context.
+        offset : int, optional
+            Position of the first record in the whole content (0 by default).
+
+        Returns
+        -------
+        list(str)
+            Encoded records.
+        '''
+        return self._batch(contents, params, offset, self.encode,
+                           self.encode_segment)
+
+    def decode_batch(self, contents, params, offset=0):
+        '''Decodes a batch of records encoded with `encode_batch`.
+
+        Parameters
+        ----------
+        contents : list(str)
+            Records to decode.
+        params : dict
+            Processing context.
+        offset : int, optional
+            Position of the first record in the whole content (0 by default).
+
+        Returns
+        -------
+        list(str)
+            Decoded records.
+        '''
+        return self._batch(contents, params, offset, self.decode,
+                           self.decode_segment)
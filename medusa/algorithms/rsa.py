@@ -31,12 +31,37 @@ import Crypto
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
 
+from functools import lru_cache
+
 from .common import Algorithm
 
 
+@lru_cache(maxsize=32)
+def construct_key(*components):
+    '''Builds an RSA key from its components (memoized, since checking the
+    components is costly).
+
+    Parameters
+    ----------
+    components : int
+        Modulus and public exponent (and private exponent, for a private key).
+
+    Returns
+    -------
+    RsaKey
+        Built key.
+    '''
+    return RSA.construct(components)
+
+
 class Rsa(Algorithm):
 
     _name = 'rsa'
+    _binary = True
+    _hexlified = True
+    _secret_ctx = ['d']
+    # (OAEP padding with SHA-1 on a 3072-bits modulus)
+    _max_content_size = 3072 // 8 - 2 * 20 - 2
 
     def __init__(self):
         super().__init__()
@@ -48,6 +73,11 @@ class Rsa(Algorithm):
         self.ctx['e'] = hex(pub_key.e)
         self.ctx['d'] = hex(self.keys.d)
 
+    def set_context(self, ctx):
+        super().set_context(ctx)
+        self.keys = construct_key(int(self.ctx['n'], 0), int(self.ctx['e'], 0),
+                                  int(self.ctx['d'], 0))
+
     @staticmethod
     def get_params():
         return {'decode': {'required': ['n', 'e', 'd']}}
@@ -64,7 +94,12 @@ class Rsa(Algorithm):
         return True, None
 
     def encode(self, content, params):
-        encryptor = PKCS1_OAEP.new(self.keys.publickey())
+        # (the public key of the context given with the params, if any)
+        if 'n' in params and 'e' in params:
+            pub_key = construct_key(params['n'], params['e'])
+        else:
+            pub_key = self.keys.publickey()
+        encryptor = PKCS1_OAEP.new(pub_key)
         if isinstance(content, str):
             content = content.encode()
         encoded = encryptor.encrypt(content)
@@ -72,8 +107,7 @@ class Rsa(Algorithm):
         return encoded
 
     def decode(self, content, params):
-        n, e, d = params['n'], params['e'], params['d']
-        keys = RSA.construct((n, e, d))
+        keys = construct_key(params['n'], params['e'], params['d'])
         decryptor = PKCS1_OAEP.new(keys)
         content = binascii.unhexlify(content)
         decoded = decryptor.decrypt(content)
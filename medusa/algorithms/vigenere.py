@@ -26,23 +26,73 @@
 __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
-from .common import Algorithm, ALPHABET
-
-ENCODE_TABLE = {
-    c: {c2: ALPHABET[(j + i) % len(ALPHABET)]
-        for j, c2 in enumerate(ALPHABET)}
-    for i, c in enumerate(ALPHABET)
-}
-DECODE_TABLE = {
-    c: {ALPHABET[(j + i) % len(ALPHABET)]: c2
-        for j, c2 in enumerate(ALPHABET)}
-    for i, c in enumerate(ALPHABET)
-}
+from functools import lru_cache
+
+from .common import Algorithm, SHIFT_TABLES
+
+
+@lru_cache(maxsize=32)
+def key_schedule(key, complement_key):
+    '''Computes the sequence of (key_rank, complement_key_rank) states the
+    cipher goes through. Since the next state only depends on the current one,
+    the sequence is eventually periodic: it is fully described by its states
+    until the first repetition and the index where the cycle starts.
+
+    Parameters
+    ----------
+    key : str
+        Vigenere key.
+    complement_key : str
+        Vigenere complement key.
+
+    Returns
+    -------
+    (list((int, int)), int)
+        States until the first repetition and start index of the cycle.
+    '''
+    states = []
+    seen = {}
+    key_rank, complement_key_rank = 0, 0
+    while (key_rank, complement_key_rank) not in seen:
+        seen[(key_rank, complement_key_rank)] = len(states)
+        states.append((key_rank, complement_key_rank))
+
+        last_key_rank = key_rank
+        k = complement_key[complement_key_rank]
+        key_rank = (key_rank + ord(k)) % len(key)
+        if key_rank <= last_key_rank:
+            complement_key_rank = (complement_key_rank + 1) \
+                % len(complement_key)
+    return states, seen[(key_rank, complement_key_rank)]
+
+
+@lru_cache(maxsize=32)
+def key_shifts(key, complement_key):
+    '''Computes the shifts the cipher applies in each state of its schedule
+    (see `key_schedule`): a character is shifted by the rank of the current
+    key character in the alphabet.
+
+    Parameters
+    ----------
+    key : str
+        Vigenere key.
+    complement_key : str
+        Vigenere complement key.
+
+    Returns
+    -------
+    (list(int), int)
+        Shifts of the states until the first repetition and start index of
+        the cycle.
+    '''
+    states, cycle_start = key_schedule(key, complement_key)
+    return [ord(key[key_rank]) for key_rank, _ in states], cycle_start
 
 
 class Vigenere(Algorithm):
 
     _name = 'vigenere'
+    _segmentable = True
 
     @staticmethod
     def get_params():
@@ -55,53 +105,38 @@ class Vigenere(Algorithm):
             return False, '"complement_key" cannot be empty'
         return True, None
 
+    def _process(self, content, params, sign, offset=0):
+        shifts, cycle_start = key_shifts(params['key'], params['complement_key'])
+        cycle_length = len(shifts) - cycle_start
+        # (as with the Caesar cipher, characters out of the alphabet raise a
+        # `UnicodeEncodeError`)
+        data = content.encode('latin-1')
+        processed = bytearray(data)
+
+        # positions before the cycle of the key schedule: one by one
+        n_before = min(len(data), max(0, cycle_start - offset))
+        for i in range(n_before):
+            processed[i] = SHIFT_TABLES[sign * shifts[offset + i]][data[i]]
+
+        # positions in the cycle: the characters that are a cycle apart are
+        # shifted by the same amount, so each of these slices is processed at
+        # once (instead of going through the content character by character)
+        for i in range(n_before, min(len(data), n_before + cycle_length)):
+            shift = shifts[cycle_start +
+                           (offset + i - cycle_start) % cycle_length]
+            processed[i::cycle_length] = \
+                data[i::cycle_length].translate(SHIFT_TABLES[sign * shift])
+
+        return processed.decode('latin-1')
+
     def encode(self, content, params):
-        key = params['key']
-        complement_key = params['complement_key']
-
-        key_rank = 0                # counter that goes through the characters of the key
-        complement_key_rank = 0     # counter that goes through the complement key
-        encoded = ''                # result content
-        # go through the characters of the content to code
-        for c in content:
-            # apply Vigenere method
-            row = ENCODE_TABLE[key[key_rank]]
-            encoded += row[c]
-
-            # access new character of the key
-            last_key_rank = key_rank
-            k = complement_key[complement_key_rank]
-            key_rank = (key_rank + ord(k)) % len(key)
-
-            # if back to beginning of key
-            if key_rank <= last_key_rank:
-                # access next character of complement key
-                complement_key_rank = (complement_key_rank + 1) \
-                    % len(complement_key)
-
-        return encoded
+        return self._process(content, params, 1)
 
     def decode(self, content, params):
-        key = params['key']
-        complement_key = params['complement_key']
-
-        key_rank = 0                # counter that goes through the characters of the key
-        complement_key_rank = 0     # counter that goes through the complement key
-        decoded = ''                # result content
-        # go through the characters of the content to decode
-        for c in content:
-            row = DECODE_TABLE[key[key_rank]]
-            decoded += row[c]
-
-            # access new character of the key
-            last_key_rank = key_rank
-            k = complement_key[complement_key_rank]
-            key_rank = (key_rank + ord(k)) % len(key)
-
-            # if back to beginning of key
-            if key_rank <= last_key_rank:
-                # access next character of complement key
-                complement_key_rank = (complement_key_rank + 1) \
-                    % len(complement_key)
-
-        return decoded
+        return self._process(content, params, -1)
+
+    def encode_segment(self, content, params, offset):
+        return self._process(content, params, 1, offset)
+
+    def decode_segment(self, content, params, offset):
+        return self._process(content, params, -1, offset)
@@ -0,0 +1,429 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import io
+import os
+import queue
+import threading
+
+from .scan import create_link
+
+# maximum number of chunks in flight between two threads
+PIPE_SIZE = 16
+# number of chunks read ahead of the processing
+READ_AHEAD = 4
+
+
+class Pipe(object):
+
+    def __init__(self, maxsize=PIPE_SIZE):
+        '''Bounded in-memory pipe between a producer thread (that writes
+        chunks) and a consumer thread (that reads them like a file), so that
+        both can work at the same time with a fixed memory use.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of chunks waiting in the pipe.
+        '''
+        self.queue = queue.Queue(maxsize)
+        self.buffer = bytearray()
+        self.eof = False
+        self.error = None
+        self.cancelled = False
+
+    def write(self, data):
+        '''Writes a chunk (blocks while the pipe is full).
+
+        Parameters
+        ----------
+        data : bytes or str
+            Chunk to write (str chunks are encoded in UTF-8).
+        '''
+        if isinstance(data, str):
+            data = data.encode()
+        if len(data) == 0:
+            return
+        while True:
+            if self.cancelled:
+                raise IOError('Pipe was cancelled by the reader.')
+            try:
+                self.queue.put(bytes(data), timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self, error=None):
+        '''Ends the stream (the reader gets the error, if any).
+
+        Parameters
+        ----------
+        error : Exception, optional
+            Error that stopped the producer.
+        '''
+        self.error = error
+        while True:
+            if self.cancelled:
+                return
+            try:
+                self.queue.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def cancel(self):
+        '''Stops reading (the writer fails on its next write).'''
+        self.cancelled = True
+
+    def read(self, size=-1):
+        '''Reads some data (like a file: an empty result means the end of the
+        stream).
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of bytes to read (everything if negative).
+
+        Returns
+        -------
+        bytes
+            Read data.
+        '''
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.queue.get()
+            if chunk is None:
+                self.eof = True
+                if self.error is not None:
+                    raise self.error
+            else:
+                self.buffer += chunk
+        if size < 0 or size >= len(self.buffer):
+            data = bytes(self.buffer)
+            del self.buffer[:]
+        else:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+        return data
+
+
+def run_producer(func, pipe):
+    '''Runs a function that writes to a pipe in a background thread (the pipe
+    is closed when the function returns or fails).
+
+    Parameters
+    ----------
+    func : callable
+        Function to run, given the pipe.
+    pipe : Pipe
+        Pipe to write to.
+
+    Returns
+    -------
+    threading.Thread
+        Started thread.
+    '''
+    def _run():
+        try:
+            func(pipe)
+        except Exception as e:
+            pipe.close(error=e)
+            return
+        pipe.close()
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+class WriteBehind(object):
+
+    def __init__(self, writer, maxsize=PIPE_SIZE):
+        '''Writes output files in a background thread, so that the disk writes
+        overlap with the processing of the next chunks. Files are written one
+        after the other, in the order they are opened.
+
+        Parameters
+        ----------
+        writer : OutputWriter
+            Writer to open the output files with (only used by the
+            background thread).
+        maxsize : int, optional
+            Maximum number of operations waiting to be written.
+        '''
+        self.writer = writer
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        f = None
+        while True:
+            op, arg = self.queue.get()
+            if op == 'stop':
+                break
+            if self.error is not None:
+                continue
+            try:
+                if op == 'open':
+                    f = self.writer.open(arg)
+                elif op == 'write':
+                    f.write(arg)
+                elif op == 'commit':
+                    f.commit()
+                    f = None
+                elif op == 'flush':
+                    self.writer.flush(arg)
+                elif op == 'link':
+                    create_link(*arg)
+            except Exception as e:
+                self.error = e
+                if f is not None:
+                    f.abort()
+                    f = None
+        if f is not None:
+            f.abort()
+
+    def _put(self, op, arg=None):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((op, arg))
+
+    def open(self, path):
+        '''Starts a new output file (the previous one must be committed).
+
+        Parameters
+        ----------
+        path : str
+            Final path of the file.
+        '''
+        self._put('open', path)
+
+    def write(self, data):
+        '''Writes some data to the current output file.
+
+        Parameters
+        ----------
+        data : bytes or str
+            Data to write.
+        '''
+        if len(data) > 0:
+            self._put('write', bytes(data) if isinstance(data, bytearray)
+                      else data)
+
+    def commit(self):
+        '''Completes the current output file.'''
+        self._put('commit')
+
+    def flush(self, dir_path=None):
+        '''Commits the pending files of the writer (see `OutputWriter.flush`).'''
+        self._put('flush', dir_path)
+
+    def link(self, root, rel_path, kind, target):
+        '''Creates a link, once the previous files are written (see
+        `scan.create_link`).'''
+        self._put('link', (root, rel_path, kind, target))
+
+    def close(self):
+        '''Waits for all the writes to be done (and raises the error that
+        stopped them, if any).'''
+        self.queue.put(('stop', None))
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class _ReadAheadFile(io.RawIOBase):
+
+    def __init__(self, source):
+        # file read ahead by a `ReadAhead`: its chunks are copied out of the
+        # buffers, that go back to the reading thread once consumed
+        self.source = source
+        self.chunk = None
+        self.position = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        self._checkClosed()
+        while self.chunk is None:
+            if self.eof:
+                return 0
+            item = self.source.queue.get()
+            if item is None:
+                self.eof = True
+            elif isinstance(item, Exception):
+                self.eof = True
+                raise item
+            else:
+                self.chunk, self.position = item, 0
+        buf, n = self.chunk
+        size = min(len(b), n - self.position)
+        b[:size] = memoryview(buf)[self.position:self.position + size]
+        self.position += size
+        if self.position == n:
+            self.source.free.put(buf)
+            self.chunk = None
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # (the rest of the file is skipped, up to the next one)
+            if self.chunk is not None:
+                self.source.free.put(self.chunk[0])
+                self.chunk = None
+            while not self.eof:
+                item = self.source.queue.get()
+                if item is None or isinstance(item, Exception):
+                    self.eof = True
+                else:
+                    self.source.free.put(item[0])
+        finally:
+            super().close()
+
+
+class ReadAhead(object):
+
+    def __init__(self, paths, chunk_size, depth=READ_AHEAD):
+        '''Reads files in a background thread, one after the other and chunk
+        by chunk, so that the disk reads overlap with the processing of the
+        previous chunks (and files). The chunks are read into a fixed set of
+        reusable buffers, so the memory use is bounded by the depth. The
+        files are then read in the same order with `next`.
+
+        Parameters
+        ----------
+        paths : list(str)
+            Paths of the files to read.
+        chunk_size : int
+            Size of the chunks to read.
+        depth : int, optional
+            Maximum number of chunks read ahead.
+        '''
+        self.paths = list(paths)
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(depth)
+        self.free = queue.Queue()
+        for _ in range(depth + 1):
+            self.free.put(bytearray(chunk_size))
+        self.cancelled = False
+        self.index = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for path in self.paths:
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    while True:
+                        buf = self.free.get()
+                        if buf is None or self.cancelled:
+                            return
+                        n = f.readinto(buf)
+                        if not n:
+                            self.free.put(buf)
+                            break
+                        self.queue.put((buf, n))
+                self.queue.put(None)
+            except OSError as e:
+                # (the error is raised when the file is read)
+                self.queue.put(e)
+
+    def next(self):
+        '''Gets the next file (to close once read, or to skip it).
+
+        Returns
+        -------
+        io.BufferedReader
+            File object.
+        '''
+        if self.index >= len(self.paths):
+            raise ValueError('No more files to read ahead.')
+        self.index += 1
+        return io.BufferedReader(_ReadAheadFile(self), self.chunk_size)
+
+    def close(self):
+        '''Stops reading (the files that were not read are dropped).'''
+        self.cancelled = True
+        self.free.put(None)
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+
+def safe_member_path(name):
+    '''Checks the path of an archive member, so that extracting it cannot
+    write outside of the output directory.
+
+    Parameters
+    ----------
+    name : str
+        Member path, relative to the archive root.
+
+    Returns
+    -------
+    str
+        Normalized relative path (or None if the path is unsafe).
+    '''
+    path = os.path.normpath(name)
+    if os.path.isabs(path) or path == os.pardir or \
+            path.startswith(os.pardir + os.sep) or path == os.curdir:
+        return None
+    return path
+
+
+def safe_link_target(path, target):
+    '''Checks the target of a symbolic link archive member, so that the link
+    cannot lead outside of the output directory.
+
+    Parameters
+    ----------
+    path : str
+        Normalized member path, relative to the archive root.
+    target : str
+        Target of the link, relative to the member folder.
+
+    Returns
+    -------
+    str
+        Normalized target path, relative to the archive root (or None if the
+        target is unsafe).
+    '''
+    if os.path.isabs(target):
+        return None
+    target = os.path.normpath(os.path.join(os.path.dirname(path), target))
+    if target == os.curdir:
+        return target
+    return safe_member_path(target)
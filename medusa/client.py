@@ -0,0 +1,247 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import base64
+import json
+import os
+import socket
+import struct
+import tempfile
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+
+def default_socket_path():
+    '''Returns the default path of the Medusa daemon socket (in the user's
+    runtime dir if there is one, else in the temp dir).
+
+    Returns
+    -------
+    str
+        Path to the Unix domain socket.
+    '''
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'medusa.sock')
+    return os.path.join(tempfile.gettempdir(),
+                        'medusa-{}.sock'.format(os.getuid()))
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def send_frame(sock, message):
+    '''Sends one message on a socket: a 4-bytes big-endian length followed by
+    the JSON-encoded message.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+    message : dict
+        Message to send.
+    '''
+    payload = json.dumps(message).encode()
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    '''Receives one message sent with `send_frame`.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+
+    Returns
+    -------
+    dict
+        Received message (or None if the peer closed the connection).
+    '''
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    size, = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError('Frame too large: {} bytes'.format(size))
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode())
+
+
+def pack_content(message, content, field='content'):
+    '''Stores some str or bytes content in a message (bytes are base64-encoded).'''
+    if isinstance(content, bytes):
+        message[field + '_b64'] = base64.b64encode(content).decode()
+    else:
+        message[field] = content
+    return message
+
+
+def unpack_content(message, field='content'):
+    '''Gets back some content stored in a message with `pack_content`.'''
+    if field + '_b64' in message:
+        return base64.b64decode(message[field + '_b64'])
+    return message.get(field)
+
+
+class MedusaClient(object):
+
+    def __init__(self, socket_path=None, timeout=None):
+        '''Thin client to send jobs to a Medusa daemon (see `medusa serve`).
+
+        Parameters
+        ----------
+        socket_path : str, optional
+            Path to the daemon's Unix domain socket (default location if None).
+        timeout : float, optional
+            Socket timeout, in seconds (no timeout by default).
+        '''
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._sock = None
+
+    def connect(self):
+        '''Opens the connection to the daemon (done automatically on the first
+        request).'''
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._sock = sock
+        return self
+
+    def close(self):
+        '''Closes the connection to the daemon.'''
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def request(self, message):
+        '''Sends a raw job to the daemon and waits for its response.
+
+        Parameters
+        ----------
+        message : dict
+            Job description.
+
+        Returns
+        -------
+        dict
+            Daemon response.
+        '''
+        self.connect()
+        send_frame(self._sock, message)
+        response = recv_frame(self._sock)
+        if response is None:
+            self.close()
+            raise ConnectionError('Medusa daemon closed the connection.')
+        if response.get('status') != 'ok':
+            raise RuntimeError(response.get('error', 'unknown error'))
+        return response
+
+    def _job(self, action, algo, params, content=None, input_path=None,
+             output_path=None, priority=0, extra=None):
+        message = dict(action=action, algo=algo, params=params,
+                       priority=priority, extra=extra or {})
+        if input_path is not None:
+            message['input'] = os.path.abspath(input_path)
+            message['output'] = os.path.abspath(output_path)
+        else:
+            pack_content(message, content)
+        return self.request(message)
+
+    def encode(self, algo, params, content, priority=0):
+        '''Encodes some content on the daemon.
+
+        Parameters
+        ----------
+        algo : str
+            Reference of the algorithm to use.
+        params : dict
+            Parameters to use in the algorithm.
+        content : str or bytes
+            Content to encode.
+        priority : int, optional
+            Job priority: higher priorities are run first (0 by default).
+
+        Returns
+        -------
+        (str or bytes, dict)
+            Encoded content and the context needed to decode it.
+        '''
+        response = self._job('encode', algo, params, content=content,
+                             priority=priority)
+        return unpack_content(response, 'result'), response['context']
+
+    def decode(self, algo, params, content, priority=0, **kwargs):
+        '''Decodes some content on the daemon (additional keyword args are
+        passed as decoding params, e.g. the context returned by `encode`).
+
+        Returns
+        -------
+        str
+            Decoded content.
+        '''
+        response = self._job('decode', algo, params, content=content,
+                             priority=priority, extra=kwargs)
+        return unpack_content(response, 'result')
+
+    def encode_file(self, algo, params, input_path, output_path, priority=0):
+        '''Encodes a file or directory on the daemon.
+
+        Returns
+        -------
+        dict
+            Context needed to decode the output.
+        '''
+        response = self._job('encode', algo, params, input_path=input_path,
+                             output_path=output_path, priority=priority)
+        return response['context']
+
+    def decode_file(self, algo, params, input_path, output_path, priority=0,
+                    **kwargs):
+        '''Decodes a file or directory on the daemon (additional keyword args
+        are passed as decoding params).'''
+        self._job('decode', algo, params, input_path=input_path,
+                  output_path=output_path, priority=priority, extra=kwargs)
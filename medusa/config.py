@@ -32,12 +32,56 @@ import re
 BASE_CONFIG = {
     'exclude': [],
     'zip': False,
-    'verbose': False
+    'verbose': False,
+    'workers': None,
+    'durability': 'none',
+    'journal': False,
+    'resume': False,
+    'dedup': False,
+    'compression': None,
+    'compression_level': None,
+    'params_fd': None,
+    'tar': False,
+    'work_dir': None,
+    'lease_ttl': 60.,
+    'reset_work_dir': False,
+    'max_memory': None,
+    'chunk_size': None,
+    'strategy': None,
+    'auto_tune': False,
+    'records': None,
+    'envelope': None,
+    'checksum': False,
+    'symlinks': 'follow',
+    'passthrough': False,
+    'read_rate': None,
+    'write_rate': None,
+    'cpu_limit': None,
+    'nice': None,
+    'ionice': None,
+    'control_file': None,
+    'kdf': None,
+    'recipients': None,
+    'private_key': None,
+    'output_encoding': 'raw',
+    'pipelined': False
 }
 
 CONFIG_PARAMS = {
-    'encode': ['input', 'output', 'algo', 'zip'],
-    'decode': ['input', 'output', 'algo']
+    'encode': ['input', 'output', 'algo', 'zip', 'workers', 'durability',
+               'journal', 'resume', 'dedup', 'compression',
+               'compression_level', 'tar', 'work_dir', 'lease_ttl',
+               'reset_work_dir', 'max_memory', 'chunk_size', 'strategy', 'auto_tune', 'records',
+               'envelope', 'checksum', 'symlinks', 'passthrough',
+               'read_rate', 'write_rate', 'cpu_limit', 'nice', 'ionice',
+               'control_file', 'kdf', 'recipients', 'private_key',
+               'output_encoding', 'pipelined'],
+    'decode': ['input', 'output', 'algo', 'workers', 'durability', 'journal',
+               'resume', 'tar', 'work_dir', 'lease_ttl', 'reset_work_dir',
+               'max_memory', 'chunk_size', 'strategy', 'auto_tune', 'records',
+               'envelope', 'symlinks', 'passthrough', 'read_rate',
+               'write_rate', 'cpu_limit', 'nice', 'ionice', 'control_file',
+               'kdf', 'private_key', 'pipelined']
 }
 
 
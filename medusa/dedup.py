@@ -0,0 +1,264 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import hashlib
+import hmac
+import os
+
+from .writers import OutputWriter
+
+CHUNKS_DIR = '.medusa-chunks'
+MANIFEST_MAGIC = 'MEDUSA-DEDUP 1'
+# label of the chunks index key (see `ChunkStore.index_key`)
+DEDUP_INFO = b'medusa-dedup'
+
+MIN_CHUNK_SIZE = 2 * 1024
+AVG_CHUNK_MASK = (1 << 13) - 1      # ~8KB chunks on average
+MAX_CHUNK_SIZE = 64 * 1024
+
+# fixed pseudo-random table for the Gear rolling hash (chunk boundaries must
+# be the same from one run to the other for the deduplication to work)
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big')
+        for i in range(256)]
+HASH_MASK = (1 << 64) - 1
+
+
+def chunk_boundaries(data, min_size=MIN_CHUNK_SIZE, mask=AVG_CHUNK_MASK,
+                     max_size=MAX_CHUNK_SIZE):
+    '''Splits some data into content-defined chunks: a chunk ends where the
+    Gear rolling hash of the previous bytes matches the mask, so identical
+    contents are cut identically even when shifted by insertions.
+
+    Parameters
+    ----------
+    data : bytes
+        Data to split.
+    min_size : int, optional
+        Minimum size of a chunk (except for the last one).
+    mask : int, optional
+        Mask of the hash bits that must be zero at a boundary (it sets the
+        average chunk size).
+    max_size : int, optional
+        Maximum size of a chunk.
+
+    Returns
+    -------
+    list((int, int))
+        Chunks (start, end) positions.
+    '''
+    boundaries = []
+    size = len(data)
+    start = 0
+    while start < size:
+        end = min(start + max_size, size)
+        h = 0
+        # no boundary can be found in the first bytes of a chunk: skip them
+        i = start + min_size
+        while i < end:
+            h = ((h << 1) + GEAR[data[i]]) & HASH_MASK
+            i += 1
+            if h & mask == 0:
+                end = i
+                break
+        boundaries.append((start, end))
+        start = end
+    return boundaries
+
+
+def hkdf(key, info, length=32):
+    '''Derives a subkey from some key material with HKDF-SHA256 (RFC 5869),
+    without salt.
+
+    Parameters
+    ----------
+    key : bytes
+        Input key material.
+    info : bytes
+        Label of the subkey (distinct labels give independent subkeys).
+    length : int, optional
+        Size of the subkey, in bytes (32 by default).
+
+    Returns
+    -------
+    bytes
+        Derived subkey.
+    '''
+    prk = hmac.new(bytes(hashlib.sha256().digest_size), key,
+                   hashlib.sha256).digest()
+    okm, block = b'', b''
+    for i in range(-(-length // len(prk))):
+        block = hmac.new(prk, block + info + bytes([i + 1]),
+                         hashlib.sha256).digest()
+        okm += block
+    return okm[:length]
+
+
+def is_manifest(content):
+    '''Checks if a content is a deduplicated file manifest.'''
+    if isinstance(content, bytes):
+        return content.startswith(MANIFEST_MAGIC.encode() + b'\n')
+    return content.startswith(MANIFEST_MAGIC + '\n')
+
+
+class ChunkStore(object):
+
+    def __init__(self, root, algo, durability='none'):
+        '''Store of encrypted, deduplicated chunks for a directory run. Each
+        unique chunk is encrypted once and stored under its id (a keyed hash
+        of its content); the processed files are replaced by manifests that
+        list the ids of their chunks.
+
+        Parameters
+        ----------
+        root : str
+            Root of the processed directory (the chunks are stored in its
+            `.medusa-chunks` subfolder).
+        algo : Algorithm
+            Algorithm used to encrypt or decrypt the chunks.
+        durability : str, optional
+            Durability policy for the chunk files (see `OutputWriter`).
+        '''
+        self.path = os.path.join(root, CHUNKS_DIR)
+        self.algo = algo
+        self.writer = OutputWriter(durability=durability)
+        self._known = None
+
+    def _chunk_path(self, chunk_id):
+        return os.path.join(self.path, chunk_id[:2], chunk_id)
+
+    def _load_index(self):
+        # the index of the stored chunks is rebuilt from the store itself, so
+        # that a store can be extended by later (or resumed) runs
+        self._known = set()
+        if os.path.exists(self.path):
+            for shard in os.listdir(self.path):
+                shard_path = os.path.join(self.path, shard)
+                if os.path.isdir(shard_path):
+                    self._known.update(f for f in os.listdir(shard_path)
+                                       if not f.startswith('.'))
+
+    def index_key(self, params):
+        '''Derives the key of the chunks index (that the chunk ids are keyed
+        hashes with) from the key of the processing params, so that chunk ids
+        reveal nothing about contents without the keys, and chunks encrypted
+        with other keys are never reused. It is derived from the key the
+        algorithm derives (e.g. with PBKDF2 or scrypt for AES, see
+        `Algorithm.key_material`), never from the password itself, so that the
+        store cannot be used to test passwords faster than the key
+        derivation allows.'''
+        return hkdf(self.algo.key_material(params), DEDUP_INFO)
+
+    def _chunk_params(self, params, chunk_id):
+        if self.algo._binary:
+            # convergent encryption: the nonce is derived from the chunk id, so
+            # identical chunks give identical ciphertexts without ever reusing
+            # a keystream on different contents
+            params = dict(params, iv=int(chunk_id[:32], 16))
+        return params
+
+    def _encode_chunk(self, chunk, params):
+        if self.algo._binary:
+            return self.algo.encode(chunk, params)
+        return self.algo.encode(chunk.decode('latin-1'), params) \
+            .encode('latin-1')
+
+    def _decode_chunk(self, chunk, params):
+        if self.algo._binary:
+            return self.algo.decode(chunk, params)
+        return self.algo.decode(chunk.decode('latin-1'), params) \
+            .encode('latin-1')
+
+    def put(self, data, params):
+        '''Stores a file content: its new chunks are encrypted and written to the
+        store.
+
+        Parameters
+        ----------
+        data : bytes
+            Content to store.
+        params : dict
+            Processing context (already transformed).
+
+        Returns
+        -------
+        str
+            Manifest of the content.
+        '''
+        if self._known is None:
+            self._load_index()
+        key = self.index_key(params)
+        ids = []
+        for start, end in chunk_boundaries(data):
+            chunk = data[start:end]
+            chunk_id = hmac.new(key, chunk, hashlib.sha256).hexdigest()
+            if chunk_id not in self._known:
+                encoded = self._encode_chunk(
+                    chunk, self._chunk_params(params, chunk_id))
+                os.makedirs(os.path.dirname(self._chunk_path(chunk_id)),
+                            exist_ok=True)
+                with self.writer.open(self._chunk_path(chunk_id)) as FILE:
+                    FILE.write(encoded)
+                self._known.add(chunk_id)
+            ids.append(chunk_id)
+        return '\n'.join([MANIFEST_MAGIC, str(len(data))] + ids) + '\n'
+
+    def get(self, manifest, params):
+        '''Reads back a file content from its manifest.
+
+        Parameters
+        ----------
+        manifest : str or bytes
+            Manifest of the content.
+        params : dict
+            Processing context (already transformed).
+
+        Returns
+        -------
+        bytes
+            Decrypted content.
+        '''
+        if isinstance(manifest, bytes):
+            manifest = manifest.decode()
+        lines = manifest.split('\n')
+        size = int(lines[1])
+        data = bytearray()
+        for chunk_id in lines[2:]:
+            if len(chunk_id) == 0:
+                continue
+            with open(self._chunk_path(chunk_id), 'rb') as FILE:
+                chunk = FILE.read()
+            data += self._decode_chunk(chunk,
+                                       self._chunk_params(params, chunk_id))
+        if len(data) != size:
+            raise ValueError('Corrupted deduplicated content: expected {} bytes, '
+                             'got {}.'.format(size, len(data)))
+        return bytes(data)
+
+    def flush(self):
+        '''Commits the pending chunk files (see `OutputWriter.flush`).'''
+        self.writer.flush()
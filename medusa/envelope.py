@@ -0,0 +1,308 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import binascii
+import hashlib
+import os
+from Crypto.Cipher import AES, PKCS1_OAEP
+from Crypto.PublicKey import RSA
+
+from .algorithms.aes import (DEFAULT_KDF, SALT_SIZE,
+                             cached_derive_key_from_pwd)
+from .algorithms.rsa import construct_key
+
+ENVELOPE_KINDS = ['password', 'rsa']
+# params needed to wrap (encode) or unwrap (decode) data keys
+ENVELOPE_PARAMS = {
+    'password': {'common': {'required': ['password']}},
+    'rsa': {'encode': {'required': ['n', 'e']},
+            'decode': {'required': ['n', 'e', 'd']}},
+}
+# (with a list of recipients, the data keys are wrapped with their public
+# keys, so only a private key is needed, to decode)
+RECIPIENTS_PARAMS = {'decode': {'required': ['n', 'e', 'd']}}
+DATA_KEY_SIZE = 32
+NONCE_SIZE = 12
+# envelope headers are padded to this size, so that rekeying rewrites them in
+# place (a wrapped RSA-3072 key takes less than half of it)
+HEADER_SIZE = 2048
+# room taken in the headers by each recipient, besides its wrapped key
+RECIPIENT_SIZE = 128
+
+
+def check_secure(kind, params, action=None):
+    '''Checks if the params are secured enough to wrap or unwrap data keys.
+
+    Parameters
+    ----------
+    kind : str
+        Kind of envelope: "password" or "rsa".
+    params : dict
+        Processing context.
+    action : str, optional
+        Action to perform, can be: "encode" or "decode".
+
+    Returns
+    -------
+    (bool, str)
+        Whether or not the params are valid and error message to warn the user.
+    '''
+    if kind == 'password' and len(params['password']) == 0:
+        return False, '"password" cannot be empty'
+    return True, None
+
+
+def new_salt():
+    '''Creates a salt for the password key-encryption keys (a run uses one
+    salt for all its files, so that the key is only derived once).'''
+    return os.urandom(SALT_SIZE)
+
+
+def new_data_key():
+    '''Creates a random data key.'''
+    return os.urandom(DATA_KEY_SIZE)
+
+
+def header_size(recipients=None):
+    '''Gets the size of the envelope headers: the base size, plus the room
+    for the data key wrapped for each recipient (if any).
+
+    Parameters
+    ----------
+    recipients : list(tuple(int, int)), optional
+        Public keys (modulus and exponent) of the recipients.
+
+    Returns
+    -------
+    int
+        Header size (in bytes).
+    '''
+    if not recipients:
+        return HEADER_SIZE
+    return HEADER_SIZE + sum(RECIPIENT_SIZE + 2 * ((n.bit_length() + 7) // 8)
+                             for n, _ in recipients)
+
+
+def load_public_key(key):
+    '''Loads the RSA public key of a recipient.
+
+    Parameters
+    ----------
+    key : str or tuple(int, int)
+        Path to a PEM (or DER) key file, PEM-encoded key, or modulus and
+        exponent of the key (a private key gives its public part).
+
+    Returns
+    -------
+    tuple(int, int)
+        Modulus and exponent of the public key.
+    '''
+    if isinstance(key, (tuple, list)):
+        n, e = key
+        return (int(n, 0) if isinstance(n, str) else n,
+                int(e, 0) if isinstance(e, str) else e)
+    if os.path.isfile(key):
+        with open(key, 'rb') as FILE:
+            key = FILE.read()
+    try:
+        rsa_key = RSA.import_key(key)
+    except (ValueError, IndexError, TypeError):
+        raise ValueError('Invalid RSA public key.')
+    return (rsa_key.n, rsa_key.e)
+
+
+def load_private_key(path):
+    '''Loads an RSA private key file (PEM or DER) as params to unwrap data
+    keys with.
+
+    Parameters
+    ----------
+    path : str
+        Path to the key file.
+
+    Returns
+    -------
+    dict
+        "n", "e" and "d" components of the key (hexadecimal strings).
+    '''
+    with open(path, 'rb') as FILE:
+        try:
+            rsa_key = RSA.import_key(FILE.read())
+        except (ValueError, IndexError, TypeError):
+            raise ValueError('Invalid RSA private key: "{}".'.format(path))
+    if not rsa_key.has_private():
+        raise ValueError('Not an RSA private key: "{}".'.format(path))
+    return {'n': hex(rsa_key.n), 'e': hex(rsa_key.e), 'd': hex(rsa_key.d)}
+
+
+def key_id(n, e):
+    '''Gets the identifier of an RSA public key (the start of the SHA-256
+    of its components), to find the data key wrapped for it in a header.'''
+    return hashlib.sha256('{:x}:{:x}'.format(n, e).encode()).hexdigest()[:16]
+
+
+def _rsa_key(params, private=False):
+    components = [params['n'], params['e']] + ([params['d']] if private else [])
+    return construct_key(*[int(c, 0) if isinstance(c, str) else c
+                           for c in components])
+
+
+def wrap_key(kind, data_key, params, salt=None):
+    '''Wraps (encrypts) a data key: with a key derived from the password
+    (AES-GCM), or with an RSA public key (OAEP).
+
+    Parameters
+    ----------
+    kind : str
+        Kind of envelope: "password" or "rsa".
+    data_key : bytes
+        Data key to wrap.
+    params : dict
+        Processing context (with the password, or the "n" and "e" components
+        of the RSA public key).
+    salt : bytes, optional
+        Salt of the password key derivation (a new one if None).
+
+    Returns
+    -------
+    dict
+        Wrapped key, to record in the header of the output.
+    '''
+    if kind == 'rsa':
+        wrapped = PKCS1_OAEP.new(_rsa_key(params)).encrypt(data_key)
+        return {'wrap': 'rsa', 'key': binascii.hexlify(wrapped).decode()}
+    if salt is None:
+        salt = new_salt()
+    kdf = params.get('kdf') or DEFAULT_KDF
+    kek = cached_derive_key_from_pwd(params['password'], salt, kdf)
+    nonce = os.urandom(NONCE_SIZE)
+    wrapped, tag = AES.new(kek, AES.MODE_GCM, nonce=nonce) \
+        .encrypt_and_digest(data_key)
+    return {'wrap': 'password', 'kdf': kdf,
+            'salt': binascii.hexlify(salt).decode(),
+            'nonce': binascii.hexlify(nonce).decode(),
+            'key': binascii.hexlify(wrapped + tag).decode()}
+
+
+def wrap_keys(kind, data_key, params, salt=None, recipients=None):
+    '''Wraps a data key into the metadata of an envelope header: once for
+    each recipient (with its RSA public key), or with `wrap_key`.
+
+    Parameters
+    ----------
+    kind : str
+        Kind of envelope: "password" or "rsa".
+    data_key : bytes
+        Data key to wrap.
+    params : dict
+        Processing context (see `wrap_key`, unused with recipients).
+    salt : bytes, optional
+        Salt of the password key derivation (a new one if None).
+    recipients : list(tuple(int, int)), optional
+        Public keys (modulus and exponent) of the recipients.
+
+    Returns
+    -------
+    dict
+        Metadata to record in the header of the output.
+    '''
+    if not recipients:
+        return {'key': wrap_key(kind, data_key, params, salt=salt)}
+    keys = []
+    for n, e in recipients:
+        wrapped = PKCS1_OAEP.new(construct_key(n, e)).encrypt(data_key)
+        keys.append({'wrap': 'rsa', 'id': key_id(n, e),
+                     'key': binascii.hexlify(wrapped).decode()})
+    return {'keys': keys}
+
+
+def unwrap_key(wrapped, params):
+    '''Unwraps a data key wrapped with `wrap_key`.
+
+    Parameters
+    ----------
+    wrapped : dict
+        Wrapped key (from the header of an output).
+    params : dict
+        Processing context (with the password, or the components of the RSA
+        private key).
+
+    Returns
+    -------
+    bytes
+        Data key.
+    '''
+    key = binascii.unhexlify(wrapped['key'])
+    try:
+        if wrapped['wrap'] == 'rsa':
+            return PKCS1_OAEP.new(_rsa_key(params, private=True)).decrypt(key)
+        if 'password' not in params:
+            raise KeyError('password')
+        kek = cached_derive_key_from_pwd(params['password'],
+                                         binascii.unhexlify(wrapped['salt']),
+                                         wrapped.get('kdf', DEFAULT_KDF))
+        return AES.new(kek, AES.MODE_GCM,
+                       nonce=binascii.unhexlify(wrapped['nonce'])) \
+            .decrypt_and_verify(key[:-16], key[-16:])
+    except (KeyError, ValueError):
+        raise ValueError('Cannot unwrap the data key (wrapped with: "{}"): '
+                         'invalid key.'.format(wrapped['wrap']))
+
+
+def unwrap_keys(meta, params):
+    '''Unwraps the data key of the metadata of an envelope header (see
+    `wrap_keys`): with recipients, the one wrapped for the RSA key of the
+    params is used.
+
+    Parameters
+    ----------
+    meta : dict
+        Metadata of the header.
+    params : dict
+        Processing context (see `unwrap_key`).
+
+    Returns
+    -------
+    bytes
+        Data key.
+    '''
+    if 'keys' in meta:
+        try:
+            rsa_key = _rsa_key(params)
+        except (KeyError, ValueError):
+            raise ValueError('Cannot unwrap the data key: the content has '
+                             'recipients, an RSA private key is needed.')
+        kid = key_id(rsa_key.n, rsa_key.e)
+        for wrapped in meta['keys']:
+            if wrapped.get('id') == kid:
+                return unwrap_key(wrapped, params)
+        raise ValueError('Cannot unwrap the data key: the RSA key is not one '
+                         'of the recipients.')
+    if 'key' not in meta:
+        raise ValueError('Content has no envelope data key.')
+    return unwrap_key(meta['key'], params)
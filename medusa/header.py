@@ -0,0 +1,100 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import json
+import struct
+
+MAGIC = b'MEDUSA\x00\x01'
+LENGTH = struct.Struct('>I')
+
+
+def pack_header(meta, size=None):
+    '''Builds the header of a Medusa output: a magic string followed by the
+    (length-prefixed) JSON-encoded metadata needed to decode it.
+
+    Parameters
+    ----------
+    meta : dict
+        Output metadata (algorithm, codec...).
+    size : int, optional
+        If given, the metadata is padded with whitespace so that the header
+        has this size (if it fits), so that it can later be rewritten in
+        place with other metadata.
+
+    Returns
+    -------
+    bytes
+        Header to write before the content.
+    '''
+    payload = json.dumps(meta, sort_keys=True).encode()
+    if size is not None:
+        payload = payload.ljust(size - len(MAGIC) - LENGTH.size)
+    return MAGIC + LENGTH.pack(len(payload)) + payload
+
+
+def has_header(f):
+    '''Checks if a stream starts with a Medusa header (without consuming it).
+
+    Parameters
+    ----------
+    f : io.BufferedReader
+        Binary stream to check.
+
+    Returns
+    -------
+    bool
+        Whether or not there is a header.
+    '''
+    return f.peek(len(MAGIC))[:len(MAGIC)] == MAGIC
+
+
+def read_header(f):
+    '''Reads the header of a Medusa output, if there is one.
+
+    Parameters
+    ----------
+    f : io.BufferedReader
+        Binary stream, positioned at the start of the output (it is left at
+        the start of the content).
+
+    Returns
+    -------
+    dict
+        Output metadata (or None if the stream has no header).
+    '''
+    if not has_header(f):
+        return None
+    f.read(len(MAGIC))
+    data = f.read(LENGTH.size)
+    if len(data) != LENGTH.size:
+        raise ValueError('Truncated Medusa header.')
+    length, = LENGTH.unpack(data)
+    payload = f.read(length)
+    if len(payload) != length:
+        raise ValueError('Truncated Medusa header.')
+    return json.loads(payload.decode())
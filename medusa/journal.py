@@ -0,0 +1,171 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import hashlib
+import json
+import os
+
+JOURNAL_NAME = '.medusa-journal'
+
+
+def file_digest(path, buffer_size=1 << 20):
+    '''Computes the SHA-256 of a file content (to check that a completed
+    output is still the one recorded in a journal).
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    buffer_size : int, optional
+        Size of the reads.
+
+    Returns
+    -------
+    str
+        Hex digest (None if the file does not exist).
+    '''
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as FILE:
+        for chunk in iter(lambda: FILE.read(buffer_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Journal(object):
+
+    def __init__(self, path, durable=False):
+        '''Append-only checkpoint journal of a directory run: it records the
+        run context (without its secrets) and each completed output (relative
+        path and SHA-256 of its content), so that an interrupted run can be
+        resumed.
+
+        Parameters
+        ----------
+        path : str
+            Path to the journal file.
+        durable : bool, optional
+            If true, each record is fsynced (false by default).
+        '''
+        self.path = path
+        self.durable = durable
+        self._file = None
+
+    def load(self):
+        '''Reads back the journal (an incomplete last record, e.g. if the run was
+        killed while writing it, is ignored).
+
+        Returns
+        -------
+        (dict, dict)
+            Run context and completed outputs (relative path -> hash).
+        '''
+        context, done = {}, {}
+        if not os.path.exists(self.path):
+            return context, done
+        for record, _ in self._records():
+            if 'context' in record:
+                context = record['context']
+            else:
+                done[record['path']] = record['sha256']
+        return context, done
+
+    def _records(self):
+        # (the complete records, with the offset of their end)
+        offset = 0
+        with open(self.path, 'rb') as FILE:
+            for line in FILE:
+                if not line.endswith(b'\n'):
+                    return
+                try:
+                    record = json.loads(line.decode())
+                except ValueError:
+                    return
+                offset += len(line)
+                yield record, offset
+
+    def open(self, context, resume=False):
+        '''Opens the journal for writing.
+
+        Parameters
+        ----------
+        context : dict
+            Run context (recorded at the start of a new journal): it must
+            not hold secrets (see `Medusa.public_context`).
+        resume : bool, optional
+            If true, new records are appended to the existing journal (after
+            its last complete record), else the journal is started over
+            (false by default).
+        '''
+        size = 0
+        if resume and os.path.exists(self.path):
+            for _, size in self._records():
+                pass
+        if size > 0:
+            # (an incomplete last record is cut off, so that the new records
+            # are not glued to it)
+            self._file = open(self.path, 'a')
+            self._file.truncate(size)
+        else:
+            self._file = open(self.path, 'w')
+            self._write({'context': context})
+        return self
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if self.durable:
+            os.fsync(self._file.fileno())
+
+    def record(self, rel_path, digest):
+        '''Records a completed output.
+
+        Parameters
+        ----------
+        rel_path : str
+            Path of the output, relative to the output directory.
+        digest : str
+            Hex SHA-256 of the output content.
+        '''
+        self._write({'path': rel_path, 'sha256': digest})
+
+    def close(self, remove=False):
+        '''Closes the journal.
+
+        Parameters
+        ----------
+        remove : bool, optional
+            If true, the journal file is deleted (when the run is complete)
+            (false by default).
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,365 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+from .scheduler import BATCH_FILES, BATCH_SIZE, plan_tasks
+
+# duration of a lease (in seconds): a lease that was not renewed for this long
+# is considered abandoned and can be reclaimed by another node
+LEASE_TTL = 60.
+# delay between two checks of the batches leased by other nodes
+POLL_INTERVAL = 1.
+CONTEXT_NAME = 'context.json'
+RUN_NAME = 'run.json'
+# a lease is only renewed if it has at least this fraction of its duration
+# left: a lease closer to its expiry may be taken over by another node
+# meanwhile, and must not be overwritten
+RENEW_MARGIN = 1 / 6.
+
+
+def batch_id(files):
+    '''Identifies a batch of files by its content, so that nodes that did not
+    scan the same tree never mix up their batches.
+
+    Parameters
+    ----------
+    files : list(str)
+        Relative paths of the files of the batch.
+
+    Returns
+    -------
+    str
+        Batch id.
+    '''
+    return hashlib.sha256('\n'.join(files).encode()).hexdigest()[:24]
+
+
+class LeaseDir(object):
+
+    def __init__(self, path, owner=None, ttl=LEASE_TTL):
+        '''Work directory shared by the nodes of a distributed run (e.g. on
+        NFS), where they claim batches of files with lease files.
+
+        - a lease is created atomically (`O_CREAT | O_EXCL`), so only one
+          node gets it; its owner renews it regularly (see `start_heartbeat`)
+        - a lease that expired is reclaimed by atomically renaming it first,
+          so only one node takes it over
+        - a done marker is created once a batch is complete
+        - the work directory belongs to a single run (see `check_run`)
+
+        Parameters
+        ----------
+        path : str
+            Path to the work directory.
+        owner : str, optional
+            Name of this node (host name, process id and a random suffix by
+            default).
+        ttl : float, optional
+            Duration of the leases, in seconds (60 by default).
+        '''
+        self.path = path
+        self.owner = owner or '{}:{}:{:08x}'.format(
+            socket.gethostname(), os.getpid(), random.getrandbits(32))
+        self.ttl = ttl
+        self.held = set()
+        self._lock = threading.Lock()
+        self._stop = None
+        os.makedirs(path, exist_ok=True)
+
+    def _lease_path(self, batch):
+        return os.path.join(self.path, batch + '.lease')
+
+    def _done_path(self, batch):
+        return os.path.join(self.path, batch + '.done')
+
+    def _lease_record(self):
+        return json.dumps({'owner': self.owner,
+                           'expires': time.time() + self.ttl}).encode()
+
+    def _read_lease(self, path):
+        try:
+            with open(path, 'rb') as FILE:
+                return json.loads(FILE.read().decode())
+        except (IOError, ValueError):
+            # (missing, or being written: not expired yet)
+            return None
+
+    def _record_once(self, name, record):
+        # (the first node records the file, the other ones read it)
+        path = os.path.join(self.path, name)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as FILE:
+            json.dump(record, FILE)
+        try:
+            # (a hard link does not replace an existing file)
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+        with open(path, 'r') as FILE:
+            return json.load(FILE)
+
+    def check_run(self, run):
+        '''Checks that the work directory is used by the current run (the
+        first node records the run, the other ones compare theirs to it), so
+        that a work directory left by another run is not reused: its batches
+        would be skipped as done, and its context reused (see `reset`).
+
+        Parameters
+        ----------
+        run : dict
+            Description of the run (JSON-serializable).
+        '''
+        recorded = self._record_once(RUN_NAME, run)
+        if recorded != run:
+            raise ValueError('The work directory "{}" belongs to another run '
+                             '({}): use a new one, or reset it.'.format(
+                                 self.path, ', '.join(
+                                     '{}={}'.format(k, v)
+                                     for k, v in sorted(recorded.items()))))
+
+    def reset(self):
+        '''Removes the state of the previous run of the work directory (its
+        leases, done markers and context), to start a new one: no node of the
+        previous run must still be running.'''
+        for name in os.listdir(self.path):
+            if name in [CONTEXT_NAME, RUN_NAME] or \
+                    name.endswith(('.lease', '.done', '.tmp')) or \
+                    '.lease.' in name:
+                os.unlink(os.path.join(self.path, name))
+
+    def shared_context(self, context):
+        '''Returns the context of the run: the first node records its own, the
+        other ones use it, so that all the outputs share the same keys.
+
+        Parameters
+        ----------
+        context : dict
+            Context of this node: it must not hold secrets (see
+            `Medusa.public_context`), each node gets them from its own params.
+
+        Returns
+        -------
+        dict
+            Context of the run.
+        '''
+        return self._record_once(CONTEXT_NAME, context)
+
+    def is_done(self, batch):
+        '''Checks if a batch is complete.'''
+        return os.path.exists(self._done_path(batch))
+
+    def is_expired(self, batch):
+        '''Checks if the lease of a batch is missing or expired.'''
+        record = self._read_lease(self._lease_path(batch))
+        if record is None:
+            return not os.path.exists(self._lease_path(batch))
+        return record['expires'] < time.time()
+
+    def claim(self, batch):
+        '''Tries to take the lease of a batch (reclaiming it if it expired).
+
+        Parameters
+        ----------
+        batch : str
+            Batch id.
+
+        Returns
+        -------
+        bool
+            Whether or not this node now holds the lease.
+        '''
+        path = self._lease_path(batch)
+        record = self._read_lease(path)
+        if record is not None and record['expires'] < time.time():
+            # only one node can rename the stale lease away
+            stale_path = '{}.stale.{}'.format(path, self.owner)
+            try:
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                return False
+            stale = self._read_lease(stale_path)
+            if stale is not None and stale['expires'] >= time.time():
+                # it was renewed in the meantime: put it back
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+                os.unlink(stale_path)
+                return False
+            os.unlink(stale_path)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, self._lease_record())
+        finally:
+            os.close(fd)
+        if self.is_done(batch):
+            # (completed while the lease was being reclaimed)
+            os.unlink(path)
+            return False
+        with self._lock:
+            self.held.add(batch)
+        return True
+
+    def renew(self, batch):
+        '''Extends the lease of a batch held by this node. The lease is given
+        up if it is about to expire (another node may be taking it over, see
+        `RENEW_MARGIN`), or if another node's lease replaced it.
+
+        Returns
+        -------
+        bool
+            Whether or not this node still holds the lease.
+        '''
+        path = self._lease_path(batch)
+        record = self._read_lease(path)
+        if record is not None and record['owner'] == self.owner and \
+                record['expires'] - time.time() > self.ttl * RENEW_MARGIN:
+            tmp_path = '{}.{}.tmp'.format(path, self.owner)
+            with open(tmp_path, 'wb') as FILE:
+                FILE.write(self._lease_record())
+            os.replace(tmp_path, path)
+            # (read back, in case another node took the lease over meanwhile)
+            record = self._read_lease(path)
+            if record is not None and record['owner'] == self.owner:
+                return True
+        with self._lock:
+            self.held.discard(batch)
+        return False
+
+    def complete(self, batch):
+        '''Marks a batch as done and releases its lease.'''
+        with open(self._done_path(batch), 'w') as FILE:
+            FILE.write(self.owner + '\n')
+        self.release(batch)
+
+    def release(self, batch):
+        '''Releases the lease of a batch held by this node.'''
+        with self._lock:
+            self.held.discard(batch)
+        record = self._read_lease(self._lease_path(batch))
+        if record is not None and record['owner'] == self.owner:
+            os.unlink(self._lease_path(batch))
+
+    def start_heartbeat(self):
+        '''Starts renewing the held leases in a background thread (three
+        times per lease duration).'''
+        self._stop = threading.Event()
+
+        def _beat(stop):
+            while not stop.wait(self.ttl / 3.):
+                with self._lock:
+                    held = list(self.held)
+                for batch in held:
+                    self.renew(batch)
+
+        threading.Thread(target=_beat, args=(self._stop,), daemon=True).start()
+
+    def stop_heartbeat(self):
+        '''Stops renewing the leases.'''
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+
+def run_distributed(input_path, files, leases, process_batch,
+                    poll_interval=POLL_INTERVAL, progress=None):
+    '''Processes the files of a directory run together with other nodes: the
+    files are grouped into batches (the same ones on all the nodes), and each
+    node claims batches through leases, processes them and marks them done,
+    until all the batches are done.
+
+    Parameters
+    ----------
+    input_path : str
+        Absolute path to the original directory.
+    files : list(str)
+        Relative paths of the files to process.
+    leases : LeaseDir
+        Shared work directory.
+    process_batch : callable
+        Function to process a batch, given the relative paths of its files
+        (its outputs must be in place when it returns).
+    poll_interval : float, optional
+        Delay between two checks of the batches leased by other nodes.
+    progress : tqdm, optional
+        Progress bar to update for each completed file.
+
+    Returns
+    -------
+    int
+        Number of batches processed by this node.
+    '''
+    sizes = {f: os.path.getsize(os.path.join(input_path, f)) for f in files}
+    batches = [(batch_id(t.files), t.files) for t in plan_tasks(
+        files, sizes, 1, 0, batch_size=BATCH_SIZE, batch_files=BATCH_FILES)]
+
+    # (the nodes start at different batches, to limit contention)
+    start = random.randrange(len(batches)) if len(batches) > 0 else 0
+    pending = batches[start:] + batches[:start]
+    processed = 0
+    leases.start_heartbeat()
+    try:
+        while len(pending) > 0:
+            waiting = []
+            for batch, batch_files in pending:
+                if leases.is_done(batch):
+                    if progress is not None:
+                        progress.update(len(batch_files))
+                    continue
+                if not leases.claim(batch):
+                    waiting.append((batch, batch_files))
+                    continue
+                try:
+                    process_batch(batch_files)
+                except BaseException:
+                    leases.release(batch)
+                    raise
+                leases.complete(batch)
+                processed += 1
+                if progress is not None:
+                    progress.update(len(batch_files))
+            pending = waiting
+            if len(pending) > 0:
+                # the other nodes hold these leases: wait for them to be done
+                # (or to expire)
+                time.sleep(poll_interval)
+    finally:
+        leases.stop_heartbeat()
+    return processed
@@ -27,16 +27,55 @@ __author__ = 'Mina Pêcheux'
 __copyright__ = 'Copyright 2020, Mina Pêcheux'
 
 import argparse
+import codecs
 import inspect
 import getpass
+import io
 import os
 import shutil
+import signal
 import sys
-from time import sleep
+import tarfile
+import tempfile
+from contextlib import redirect_stdout
+from copy import copy
+from array import array
 from tqdm import tqdm
 
-from .config import load_config
+from .config import BASE_CONFIG, load_config
+from .archive import (Pipe, ReadAhead, WriteBehind, run_producer,
+                      safe_link_target, safe_member_path)
+from . import envelope as envelopes
+from .dedup import CHUNKS_DIR, MAX_CHUNK_SIZE, ChunkStore, is_manifest
+from .envelope import ENVELOPE_KINDS, ENVELOPE_PARAMS, RECIPIENTS_PARAMS
+from .header import pack_header, read_header
+from .journal import JOURNAL_NAME, Journal, file_digest
+from .lease import LEASE_TTL, LeaseDir, run_distributed
+from .memory import (IN_FLIGHT_FACTOR, MemoryBudget, format_size, parse_size,
+                     peak_rss)
 from .algorithms import ALGORITHMS
+from .algorithms.aes import KDF_TARGET_TIME, KDFS, calibrate_kdf, parse_kdf
+from .parallel import process_segments
+from .pipeline import (CODECS, DEFAULT_CHUNK_SIZE, OUTPUT_ENCODINGS,
+                       decode_stream, decoding_reader, encode_stream,
+                       encoded_size, encoding_writer, iter_chunks,
+                       peek_encoding)
+from .records import (INDEX_SUFFIX, index_path, iter_index_batches,
+                      iter_record_batches, read_offsets, write_index)
+from .scan import SYMLINK_POLICIES, create_link, scan_dir
+from .scheduler import STRATEGIES, RunStats, schedule_files
+from .server import serve
+from .throttle import Throttle, parse_ionice, parse_limit, set_priority
+from .tuning import auto_tune, describe
+from .verify import verify_dir, verify_file
+from .watch import POLL_INTERVAL, SETTLE_TIME, Watcher
+from .streams import MedusaReader, MedusaWriter
+from .writers import (DURABILITY_POLICIES, PATCH_SUFFIX, OutputWriter,
+                      StreamWriter, patch_file, recover_patch)
+
+# path that stands for the standard input/output
+STREAM_PATH = '-'
+PARAMS_ENV_PREFIX = 'MEDUSA_'
 
 
 class ShellColors(object):
@@ -55,7 +94,15 @@ class MedusaError(Exception):
 class Medusa(object):
 
     def __init__(self, algo, params, exclude=[], verbose=False, base_path=None,
-                 exit_on_error=True):
+                 exit_on_error=True, workers=1, segment_size=4 * 1024 * 1024,
+                 durability='none', journal=False, dedup=False,
+                 compression=None, compression_level=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_memory=None,
+                 strategy='process', records=None, envelope=None,
+                 checksum=False, symlinks='follow', passthrough=False,
+                 read_rate=None, write_rate=None, cpu_limit=None, nice=None,
+                 ionice=None, control_file=None, kdf=None, recipients=None,
+                 output_encoding='raw', pipelined=False):
         '''Main Medusa object to encode/decode strings using basic cryptography techniques.
 
         Parameters
@@ -72,6 +119,121 @@ class Medusa(object):
             Root path to prepend all input/output paths with if they are not absolute.
         exit_on_error : bool, optional
             Whether or not to sys exit if object could not be instantiated (true by default).
+        workers : int, optional
+            Number of worker processes to use to process large contents in
+            parallel segments, and the files of directories in parallel tasks
+            scheduled by size (1 by default, i.e. no parallelism).
+        segment_size : int, optional
+            Maximum length of a segment for parallel processing; smaller
+            contents are always processed sequentially (4M characters by default).
+        durability : str, optional
+            Durability policy for the output files: "none", "file" (fsync each
+            file) or "batch" (fsync by batches per directory) ("none" by
+            default). In all cases, outputs are written to temporary files
+            and atomically renamed once complete.
+        journal : bool, optional
+            If true, directory runs record their progress in a checkpoint
+            journal, so that they can be resumed if interrupted (false by
+            default).
+        dedup : bool, optional
+            If true, directory encodings are deduplicated: files are split into
+            content-defined chunks, each unique chunk is encrypted and stored
+            once and the outputs are manifests referring to them (false by
+            default).
+        compression : str, optional
+            If set, contents are compressed before encryption with this codec:
+            "zlib", "lzma" or "bz2" (inputs that do not compress well are
+            stored as is). Compressed outputs start with a header that records
+            the codec (None by default, i.e. no compression).
+        compression_level : int, optional
+            Compression level (the codec's default if None).
+        chunk_size : int, optional
+            Size of the chunks files are streamed by (1MB by default).
+        max_memory : int or str, optional
+            Budget of in-flight bytes for the processings (e.g. "512M"): each
+            one waits for its share before reading, the files that fit in the
+            budget are processed at once and the other ones are streamed. With
+            worker processes, each one gets an equal part of the budget (None
+            by default, i.e. no budget).
+        strategy : str, optional
+            How the files of directories are processed with several workers:
+            in worker "process"es, or in "thread"s sharing this object (only
+            useful for the algorithms that release the GIL, like AES)
+            ("process" by default).
+        records : str or bytes, optional
+            If set, files are processed in record mode, with this delimiter
+            (e.g. "\\n" for JSONL or CSV logs): each record is encoded so that
+            it can be decoded on its own, and a sidecar index of the record
+            offsets (".idx" file) is written next to each output, to decode
+            any record or range of records without the rest of the file (see
+            `read_records`) (None by default, i.e. whole files).
+        envelope : str, optional
+            If set, each output is encrypted under its own random data key,
+            that is wrapped in its header: with a key derived from the
+            password ("password"), or with an RSA public key ("rsa", with the
+            "n" and "e" params, and "d" to decode). Changing the password or
+            the RSA key then only rewrites the headers (see `rekey`) (None by
+            default, i.e. the content is encrypted with the password key).
+        checksum : bool, optional
+            If true, outputs are always written in the header format (even
+            without compression), which ends with the length and SHA-256 of
+            the content, so that their integrity can be checked without
+            decoding them (see `verify_file`) (false by default).
+        symlinks : str, optional
+            How the symbolic links of directories are handled: "follow"
+            (their targets are processed), "preserve" (they are recreated as
+            is in the outputs) or "skip". In all cases, each file or folder is
+            processed once: its other hard links, and the links that lead back
+            to a processed folder, are recreated as links ("follow" by
+            default).
+        passthrough : bool, optional
+            If true, the excluded files and folders of directories are copied
+            as is to the outputs instead of being dropped, and so are the
+            inputs that already start with a Medusa header when encoding (the
+            copies are done in the kernel when possible) (false by default).
+        read_rate : int or str, optional
+            Maximum rate at which the inputs are read, in bytes per second
+            (e.g. "50M"); with worker processes, each one gets an equal part
+            of it (None by default, i.e. no limit).
+        write_rate : int or str, optional
+            Maximum rate at which the outputs are written, in bytes per
+            second (None by default, i.e. no limit).
+        cpu_limit : float, optional
+            Maximum fraction of a CPU each process uses, in ]0, 1] (the
+            processings sleep between chunks to stay below it) (None by
+            default, i.e. no limit).
+        nice : int, optional
+            Niceness of the worker processes (None by default).
+        ionice : str, optional
+            I/O scheduling class of the worker processes, optionally with a
+            level (e.g. "idle" or "best-effort:7") (None by default).
+        control_file : str, optional
+            Path to a file that overrides the rate and CPU limits while
+            processing ("read_rate=...", "write_rate=..." and "cpu_limit=..."
+            lines, see `throttle.Throttle`) (None by default).
+        kdf : str, optional
+            Key derivation of the passwords: "pbkdf2:<iterations>" or
+            "scrypt:<n>:<r>:<p>" (see `algorithms.aes.parse_kdf` and
+            `calibrate_kdf`). It is recorded in the header of the outputs, so
+            that decoding uses it (None by default, i.e. PBKDF2 with 100,000
+            iterations, not recorded).
+        recipients : list, optional
+            If set, the data key of each output is wrapped with the RSA
+            public key of each recipient (paths to PEM key files, PEM keys, or
+            modulus and exponent pairs, see `envelope.load_public_key`): the
+            content is encrypted once, and any recipient decodes it with
+            their private key (the "n", "e" and "d" params). It implies the
+            "rsa" envelope (None by default).
+        output_encoding : str, optional
+            Encoding of the outputs: "raw" (bytes), or "base64", "base85" or
+            "hex" to transport them as text (see `pipeline.OUTPUT_ENCODINGS`).
+            The outputs of the Caesar and Vigenere ciphers and of RSA (that
+            are text) are written with a header, so that they are stored as
+            raw bytes; decoding detects the encoding ("raw" by default).
+        pipelined : bool, optional
+            If true, the files are read ahead and their outputs written
+            behind in background threads, so that the disk I/O overlaps with
+            the processing (the outputs are the same) (false by default).
         '''
         if algo not in ALGORITHMS:
             print('Unknown algorithm: "{}"'.format(algo))
@@ -85,29 +247,210 @@ class Medusa(object):
 
         self.algo = ALGORITHMS[algo]()
         self.algo_params = ALGORITHMS[algo].get_params()
-        self.params = params
+        if recipients is not None and envelope is None:
+            envelope = 'rsa'
+        if envelope is not None:
+            if envelope not in ENVELOPE_KINDS \
+                    or not self.algo._envelope or records is not None or dedup:
+                print('[Medusa - Error] Invalid envelope: "{}" (available: {}, '
+                      'only for the AES algorithm, without record mode or '
+                      'deduplication).'.format(envelope, ', '.join(ENVELOPE_KINDS)))
+                if exit_on_error:
+                    sys.exit(1)
+                else:
+                    raise MedusaError()
+            self.algo_params = ENVELOPE_PARAMS[envelope]
+        if recipients is not None:
+            try:
+                if envelope != 'rsa' or len(recipients) == 0:
+                    raise ValueError('Recipients need the "rsa" envelope.')
+                recipients = [envelopes.load_public_key(r) for r in recipients]
+            except (ValueError, OSError) as e:
+                print('[Medusa - Error] Invalid recipients: {}'.format(e))
+                if exit_on_error:
+                    sys.exit(1)
+                else:
+                    raise MedusaError()
+            self.algo_params = RECIPIENTS_PARAMS
+        self.envelope = envelope
+        self.recipients = recipients
+        self.header_size = envelopes.header_size(recipients)
+        self.checksum = checksum
+        # (all the data keys wrapped by the object use the same password
+        # derivation)
+        self.envelope_salt = envelopes.new_salt()
+        self.params = dict(params)
         self.exclude = exclude
         self.verbose = verbose
         self.exit_on_error = exit_on_error
+        self.workers = max(1, workers)
+        self.segment_size = segment_size
+        self.writer = OutputWriter(durability=durability)
+        self.journal = journal
+        self.dedup = dedup
+        self.compression = compression
+        self.compression_level = compression_level
+        self.chunk_size = chunk_size
+        self.max_memory = parse_size(max_memory) \
+            if max_memory is not None else None
+        self.memory = MemoryBudget(self.max_memory) \
+            if max_memory is not None else None
+        self.strategy = strategy
+        self.symlinks = symlinks
+        self.passthrough = passthrough
+        try:
+            read_rate, write_rate, cpu_limit = [
+                parse_limit(k, v) for k, v in [('read_rate', read_rate),
+                                               ('write_rate', write_rate),
+                                               ('cpu_limit', cpu_limit)]]
+            if ionice is not None:
+                parse_ionice(ionice)
+        except ValueError as e:
+            print('[Medusa - Error] {}'.format(e))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+        self.read_rate = read_rate
+        self.write_rate = write_rate
+        self.cpu_limit = cpu_limit
+        self.nice = nice
+        self.ionice = ionice
+        self.control_file = control_file
+        self.kdf = kdf
+        self.output_encoding = output_encoding
+        self.pipelined = pipelined
+        self.throttle = None
+        if read_rate is not None or write_rate is not None \
+                or cpu_limit is not None or control_file is not None:
+            self.throttle = Throttle(read_rate=self.read_rate,
+                                     write_rate=self.write_rate,
+                                     cpu_limit=cpu_limit,
+                                     control_file=control_file)
+        self.records = records.encode() if isinstance(records, str) \
+            else records
+
+        if kdf is not None:
+            error = None
+            if 'password' not in self.algo_params.get('common', {}).get('required', []):
+                error = 'Algorithm "{}" has no password to derive.'.format(algo)
+            else:
+                try:
+                    parse_kdf(kdf)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                print('[Medusa - Error] {}'.format(error))
+                if exit_on_error:
+                    sys.exit(1)
+                else:
+                    raise MedusaError()
+
+        if output_encoding not in OUTPUT_ENCODINGS or \
+                (output_encoding != 'raw' and (records is not None or dedup)):
+            print('[Medusa - Error] Invalid output encoding: "{}" (available: '
+                  '{}, only raw in record mode or with deduplication).'.format(
+                      output_encoding, ', '.join(OUTPUT_ENCODINGS)))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+
+        if symlinks not in SYMLINK_POLICIES:
+            print('[Medusa - Error] Unknown symlink policy: "{}" (available: '
+                  '{}).'.format(symlinks, ', '.join(SYMLINK_POLICIES)))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+
+        if strategy not in STRATEGIES:
+            print('[Medusa - Error] Unknown strategy: "{}"'.format(strategy))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+
+        if records is not None and (len(records) == 0 or
+                                    compression is not None or dedup):
+            print('[Medusa - Error] The record mode needs a non-empty delimiter, '
+                  'and cannot be used with compression or deduplication.')
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+
+        if compression is not None and compression not in CODECS:
+            print('[Medusa - Error] Unknown compression codec: "{}"'.format(
+                compression))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
+        if dedup and self.algo._max_content_size is not None \
+                and self.algo._max_content_size < MAX_CHUNK_SIZE:
+            print('[Medusa - Error] Algorithm "{}" cannot be used with '
+                  'deduplication.'.format(algo))
+            if exit_on_error:
+                sys.exit(1)
+            else:
+                raise MedusaError()
 
         if not self._check_missing_params(self.params):
             raise MedusaError()
         if not self._check_secure_params(self.params):
             raise MedusaError()
 
-        self.encode = self._wrap_processor(self.algo.encode, 'encode')
-        self.decode = self._wrap_processor(self.algo.decode, 'decode')
+        self.encode = self._wrap_processor('encode')
+        self.decode = self._wrap_processor('decode')
 
         if base_path is None:
             self.base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
         else:
             self.base_path = base_path
 
-    def _check_missing_params(self, params, action=None):
-        '''Checks if the object has all necessary args for required action.'''
-        req_params = self.algo_params.get('common', {}).get('required', [])
+    def tune(self, target_path, **overrides):
+        '''Tunes the execution settings of the object for this host (see
+        `tuning.auto_tune`): worker count, chunk size, strategy and memory
+        budget. The chosen settings are logged.
+
+        Parameters
+        ----------
+        target_path : str
+            Path the outputs will be written to.
+        overrides : dict, optional
+            Settings to keep instead of the tuned ones (ignored if None).
+
+        Returns
+        -------
+        dict
+            Chosen settings.
+        '''
+        settings, measures = auto_tune(self, target_path)
+        settings.update((k, v) for k, v in overrides.items() if v is not None)
+        for k in ['chunk_size', 'max_memory']:
+            if settings[k] is not None:
+                settings[k] = parse_size(settings[k])
+        print(describe(settings, measures))
+
+        self.workers = max(1, settings['workers'])
+        if settings['chunk_size'] is not None:
+            self.chunk_size = settings['chunk_size']
+        self.strategy = settings['strategy']
+        if settings['max_memory'] is not None:
+            self.max_memory = settings['max_memory']
+            self.memory = MemoryBudget(self.max_memory)
+        return settings
+
+    def _check_missing_params(self, params, action=None, envelope=None):
+        '''Checks if the object has all necessary args for required action
+        (or to wrap or unwrap data keys with another kind of envelope).'''
+        algo_params = self.algo_params if envelope is None \
+            else ENVELOPE_PARAMS[envelope]
+        req_params = list(
+            algo_params.get('common', {}).get('required', []))
         if action is not None:
-            req_params += self.algo_params.get(action, {}).get('required', [])
+            req_params += algo_params.get(action, {}).get('required', [])
         missing_params = [p for p in req_params if p not in params]
         if len(missing_params) > 0:
             msg = 'Invalid parameters: algorithm "{}" requires:'.format(
@@ -121,9 +464,15 @@ class Medusa(object):
                 return False
         return True
 
-    def _check_secure_params(self, params, action=None):
+    def _check_secure_params(self, params, action=None, envelope=None):
         '''Checks if the object has secure params for required action.'''
-        check, error = self.algo.check_secure(params, action=action)
+        if envelope is None:
+            envelope = self.envelope
+        if envelope is not None:
+            check, error = envelopes.check_secure(envelope, params,
+                                                  action=action)
+        else:
+            check, error = self.algo.check_secure(params, action=action)
         if not check:
             print('[Medusa - Error] {}'.format(error))
             if self.exit_on_error:
@@ -132,28 +481,72 @@ class Medusa(object):
                 return False
         return True
 
-    def _print_context(self):
+    def _print_context(self, ctx=None):
         '''Prints the current context of the used algorithm (auto-generated keys, offsets...).'''
-        for k, v in self.algo.ctx.items():
+        if ctx is None:
+            ctx = self.algo.ctx
+        for k, v in ctx.items():
             print('[{:>6}] {}'.format(k.title().replace('_', ' '), v))
 
-    def _wrap_processor(self, func, action):
+    def _get_params(self, action, **kwargs):
+        '''Gets the checked and transformed params for an action (the object's
+        params, updated with the given ones).'''
+        params = self.params.copy()
+        if self.kdf is not None:
+            params['kdf'] = self.kdf
+        params.update(kwargs)
+        if not self._check_missing_params(params, action=action):
+            raise MedusaError()
+        if not self._check_secure_params(params, action=action):
+            raise MedusaError()
+        self.algo.transform_params(params)
+        return params
+
+    def _process_chunk(self, content, params, action, offset=0):
+        '''Processes a content, or a chunk of a larger stream at a given offset
+        (in parallel segments if it is large enough).'''
+        if self.workers > 1 and self.algo._segmentable \
+                and not self.algo._binary \
+                and isinstance(content, str) \
+                and len(content) > self.segment_size:
+            try:
+                return process_segments(self.algo, content, params, action,
+                                        self.workers, self.segment_size,
+                                        offset=offset)
+            except UnicodeEncodeError:
+                # characters out of the alphabet: let the sequential
+                # processing report the error
+                pass
+        if action == 'encode':
+            return self.algo.encode_segment(content, params, offset)
+        return self.algo.decode_segment(content, params, offset)
+
+    def _wrap_processor(self, action):
         '''Wraps a processing function with auto check of params, auto update of
-        params with object-specific values...'''
-        def _wrapped(content, **kwargs):
-            __is_direct = kwargs.pop('__is_direct', True)
-            params = self.params.copy()
-            params.update(kwargs)
-            if not self._check_missing_params(params, action=action):
-                raise MedusaError()
-            if not self._check_secure_params(params, action=action):
-                raise MedusaError()
-            self.algo.transform_params(params)
-            res = func(content, params)
+        params with object-specific values...
+
+        With `return_context=True`, encoding uses a fresh context (see
+        `new_context`) instead of the object's one, and returns it along with
+        the result (nothing is printed), so that concurrent calls never share
+        a context. Only the context is returned, not the other params given
+        with the call.'''
+        def _wrapped(content, return_context=False, **kwargs):
+            is_direct = kwargs.pop('_is_direct', True)
+            ctx = None
+            if return_context:
+                ctx = self.new_context() if action == 'encode' else {}
+                # (the given params override the context, but only the keys
+                # of the context are returned, never e.g. a password)
+                kwargs = dict(ctx, **kwargs)
+                ctx = {k: kwargs[k] for k in ctx}
+            params = self._get_params(action, **kwargs)
+            res = self._process_chunk(content, params, action)
             if action == 'decode' and not isinstance(res, str):
                 res = res.decode()
 
-            if __is_direct and action == 'encode':
+            if return_context:
+                return res, ctx
+            if is_direct and action == 'encode':
                 self._print_context()
             return res
         return _wrapped
@@ -164,11 +557,78 @@ class Medusa(object):
         Returns
         -------
         dict
-            Current algorithm context.
+            Current algorithm context (with the key derivation, if the
+            object has one).
         '''
+        if self.kdf is not None:
+            return dict(self.algo.ctx, kdf=self.kdf)
         return self.algo.ctx
 
-    def process_file(self, input_path, output_path, action, indent=0):
+    def new_context(self):
+        '''Creates a context for one processing call: the object's context,
+        with fresh per-call values (e.g. a new AES nonce). Passing it with the
+        params of an encoding makes the call independent of the others.
+
+        Returns
+        -------
+        dict
+            New context.
+        '''
+        ctx = dict(self.algo.get_ctx())
+        ctx.update(self.algo.new_context())
+        return ctx
+
+    def public_context(self, ctx=None):
+        '''Returns a context without its secrets (e.g. the private exponent of
+        an RSA key), to write it to disk or share it.
+
+        Parameters
+        ----------
+        ctx : dict, optional
+            Context to filter (the object's one if None).
+
+        Returns
+        -------
+        dict
+            Context with only its non-secret values (salt, IV, key
+            derivation...).
+        '''
+        if ctx is None:
+            ctx = self.get_context()
+        return {k: v for k, v in ctx.items()
+                if k not in self.algo._secret_ctx}
+
+    def _secret_context(self, ctx, action, recorded=False):
+        '''Completes the context of a journaled or distributed run with its
+        secrets, that are never written to disk: when encoding, they are
+        taken from the params (e.g. the RSA key of a private key file), so
+        that each process of the run (and each resumption) gets them from its
+        own params. If the context was `recorded` (read back from the disk),
+        the params must match it.'''
+        if action != 'encode' or len(self.algo._secret_ctx) == 0:
+            return ctx
+        error = None
+        missing = [k for k in self.algo._secret_ctx if k not in self.params]
+        given = {k: v for k, v in self.params.items()
+                 if k in ctx or k in self.algo._secret_ctx}
+        if len(missing) > 0:
+            error = 'The secrets of the context are not written to disk: ' \
+                'algorithm "{}" needs them in the params to journal, resume ' \
+                'or distribute a run (missing: {}).'.format(
+                    self.algo._name, ', '.join(missing))
+        elif recorded and any(str(given[k]) != str(v)
+                              for k, v in ctx.items() if k in given):
+            error = 'The params do not match the context of the run.'
+        if error is not None:
+            print('[Medusa - Error] {}'.format(error))
+            if self.exit_on_error:
+                sys.exit(1)
+            raise MedusaError()
+        return dict(ctx, **given)
+
+    def process_file(self, input_path, output_path, action, indent=0,
+                     commit=True, store=None, writer=None, read_ahead=None,
+                     write_behind=None, **kwargs):
         '''Processes one file (either for encoding or decoding).
 
         Parameters
@@ -181,8 +641,27 @@ class Medusa(object):
             Action to perform, can be: "encode" or "decode".
         indent : int, optional
             Indent size for log verbose output (0 by default).
+        commit : bool, optional
+            If false, the output may be left pending until the next
+            `self.writer.flush()` (for the "batch" durability policy) (true by
+            default).
+        store : ChunkStore, optional
+            If given, the file is deduplicated through this chunk store (when
+            encoding) or rebuilt from it (when decoding a manifest).
+        writer : OutputWriter, optional
+            Writer to write the output with (the object's one by default).
+        read_ahead : ReadAhead, optional
+            If given (in pipelined mode), the input is the next file read
+            ahead by this object.
+        write_behind : WriteBehind, optional
+            If given (in pipelined mode), the output is written behind by this
+            object, after the previous ones.
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
         '''
         ind = ' ' * 4 * indent
+        if writer is None:
+            writer = self.writer
 
         if not os.path.isabs(input_path):
             input_path = os.path.join(self.base_path, input_path)
@@ -193,32 +672,447 @@ class Medusa(object):
         if self.verbose:
             print('\n{}> {}'.format(ind, os.path.basename(input_path)))
 
-        try:
-            with open(input_path, 'r') as FILE_READ:
-                content = FILE_READ.read()
-        except UnicodeDecodeError:
+        # (already encoded inputs are copied as is)
+        if self.passthrough and action == 'encode':
             with open(input_path, 'rb') as FILE_READ:
-                content = FILE_READ.read()
+                encoded = peek_encoding(FILE_READ) is not None
+            if encoded:
+                if read_ahead is not None:
+                    read_ahead.next().close()
+                self.copy_file(input_path, output_path, indent=indent,
+                               commit=commit, writer=writer)
+                return
 
-        # process
+        if self.records is not None:
+            self.process_records(input_path, output_path, action,
+                                 writer=writer, **kwargs)
+            if commit:
+                writer.flush(os.path.dirname(output_path))
+            return
+
+        # with a memory budget, the files that fit in it are processed at once,
+        # the other ones are streamed (with the memory of their chunks)
+        chunk_size, reserved = None, 0
+        if self.memory is not None:
+            footprint = IN_FLIGHT_FACTOR * os.path.getsize(input_path)
+            if store is not None:
+                reserved = self.memory.acquire(footprint)
+            elif footprint <= self.memory.limit // 2 \
+                    and self.memory.try_acquire(footprint):
+                chunk_size, reserved = -1, footprint
+
+        try:
+            res = None
+            if store is not None:
+                # deduplicated processing: work on raw bytes, through the chunk store
+                with self._open_input(input_path) as FILE_READ:
+                    content = FILE_READ.read()
+                if action == 'encode':
+                    res = store.put(content, self._get_params(action, **kwargs))
+                elif is_manifest(content):
+                    res = store.get(content, self._get_params(action, **kwargs))
+
+            # process and write encoded file (streamed chunk by chunk)
+            if res is None and (self.pipelined or read_ahead is not None):
+                self._process_pipelined(input_path, output_path, action,
+                                        writer, read_ahead=read_ahead,
+                                        write_behind=write_behind,
+                                        chunk_size=chunk_size, **kwargs)
+            else:
+                with writer.open(output_path) as FILE_WRITE:
+                    if res is not None:
+                        FILE_WRITE.write(res)
+                    else:
+                        with open(input_path, 'rb') as FILE_READ:
+                            self.process_stream(FILE_READ, FILE_WRITE, action,
+                                                chunk_size=chunk_size,
+                                                **kwargs)
+        finally:
+            if reserved > 0:
+                self.memory.release(reserved)
+        if commit:
+            if store is not None:
+                store.flush()
+            writer.flush(os.path.dirname(output_path))
+
+    def _process_pipelined(self, input_path, output_path, action, writer,
+                           read_ahead=None, write_behind=None,
+                           chunk_size=None, **kwargs):
+        '''Processes one file with its reads and writes overlapped with the
+        processing: the input is read ahead in a background thread, and the
+        output written behind in another one (both can be shared with the
+        previous and next files of a directory).'''
+        own_reader, own_writer = read_ahead is None, write_behind is None
+        if own_reader:
+            read_ahead = ReadAhead([input_path], self.chunk_size)
+        if own_writer:
+            write_behind = WriteBehind(writer)
+        try:
+            with read_ahead.next() as FILE_READ:
+                write_behind.open(output_path)
+                self.process_stream(FILE_READ, write_behind, action,
+                                    chunk_size=chunk_size, **kwargs)
+                write_behind.commit()
+        finally:
+            if own_reader:
+                read_ahead.close()
+            if own_writer:
+                write_behind.close()
+
+    def copy_file(self, input_path, output_path, indent=0, commit=True,
+                  writer=None):
+        '''Copies one file as is (e.g. an excluded or already encoded file), in
+        the kernel when possible.
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the original file.
+        output_path : str
+            Absolute path to the copy.
+        indent : int, optional
+            Indent size for log verbose output (0 by default).
+        commit : bool, optional
+            If false, the output may be left pending until the next
+            `self.writer.flush()` (for the "batch" durability policy) (true by
+            default).
+        writer : OutputWriter, optional
+            Writer to write the output with (the object's one by default).
+        '''
+        if writer is None:
+            writer = self.writer
+        if self.verbose:
+            print('{}Copying as is: {}'.format(' ' * 4 * indent,
+                                               os.path.basename(input_path)))
+        on_copy = None
+        if self.throttle is not None:
+            def on_copy(n):
+                self.throttle.read(n)
+                self.throttle.write(n)
+        with writer.open(output_path) as FILE_WRITE:
+            FILE_WRITE.copy_from(input_path, on_copy=on_copy)
+        if commit:
+            writer.flush(os.path.dirname(output_path))
+
+    def _seal(self, params, action):
+        '''Prepares the params of an envelope processing: when encoding, a new
+        data key is created and wrapped (returns the metadata to record in the
+        header); when decoding, the data key is unwrapped from the header
+        (returns the function to call with its metadata).'''
         if action == 'encode':
-            res = self.encode(content, __is_direct=False)
-        elif action == 'decode':
-            res = self.decode(content, __is_direct=False)
-
-        # write encoded file
-        if isinstance(res, str):
-            with open(output_path, 'w') as FILE_WRITE:
-                FILE_WRITE.write(res)
-        elif isinstance(res, bytes):
-            with open(output_path, 'wb') as FILE_WRITE:
-                FILE_WRITE.write(res)
+            data_key = envelopes.new_data_key()
+            meta = envelopes.wrap_keys(self.envelope, data_key, params,
+                                       salt=self.envelope_salt,
+                                       recipients=self.recipients)
+            # (each data key encrypts a single content)
+            params.update(data_key=data_key, iv=0)
+            return meta
+
+        def _on_header(meta):
+            params.update(data_key=envelopes.unwrap_keys(meta, params), iv=0)
+        return _on_header
+
+    def process_stream(self, src, dst, action, header=None, codec=None,
+                       chunk_size=None, header_ctx=None, **kwargs):
+        '''Processes a stream chunk by chunk (either for encoding or decoding),
+        so that memory use does not depend on the size of the content.
+
+        Parameters
+        ----------
+        src : io.BufferedReader
+            Binary stream to read the content from.
+        dst : file-like
+            Stream to write the processed content to (with a `write` method).
+        action : str
+            Action to perform, can be: "encode" or "decode".
+        header : bool, optional
+            Whether or not to write a header when encoding (if None, only
+            when the content is compressed).
+        codec : str, optional
+            Compression codec to use when encoding (the object's one if None).
+        chunk_size : int, optional
+            Size of the chunks to read (-1 to read everything at once), if
+            the caller already acquired the memory it needs. If None, the
+            object's chunk size is used, with its memory taken from the
+            object's memory budget (if any).
+        header_ctx : dict, optional
+            Per-call context (see `new_context`) to record in the header when
+            encoding, so that decoding reads it from there (e.g. the IV of
+            each file of a watch). It is not recorded with an envelope, whose
+            data key is already new for each content.
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+        '''
+        params = self._get_params(action, **kwargs)
+        meta, on_header, header_size = None, None, None
+        if self.envelope is not None:
+            if action == 'encode':
+                meta = self._seal(params, action)
+                header, header_size = True, self.header_size
+            else:
+                if peek_encoding(src) is None:
+                    raise ValueError('Content has no envelope data key.')
+                on_header = self._seal(params, action)
+        elif action == 'encode' and self.kdf is not None:
+            # (the key derivation is recorded in the header)
+            meta, header = {'kdf': params['kdf']}, True
+        if action == 'encode' and header_ctx and self.envelope is None:
+            meta, header = dict(meta or {}, ctx=header_ctx), True
+        if action == 'decode':
+            on_header = self._header_hook(params, on_header)
+
+        if self.throttle is not None:
+            src, dst = self.throttle.reader(src), self.throttle.writer(dst)
+
+        def _process(chunk, offset):
+            res = self._process_chunk(chunk, params, action, offset=offset)
+            if self.throttle is not None:
+                self.throttle.tick()
+            return res
+
+        reserved = 0
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+            # (parallel processing needs chunks that are worth splitting)
+            if self.workers > 1:
+                chunk_size = max(chunk_size, self.segment_size * self.workers)
+            if self.memory is not None:
+                reserved = self.memory.acquire(IN_FLIGHT_FACTOR * chunk_size)
+
+        try:
+            if action == 'encode':
+                if codec is None:
+                    codec = self.compression
+                if header is None:
+                    # (text contents are stored as raw bytes in the header
+                    # format, and text encodings have a header)
+                    header = codec is not None or self.checksum \
+                        or self.output_encoding != 'raw' \
+                        or not self.algo._binary or self.algo._hexlified
+                encode_stream(self.algo, _process, src, dst,
+                              chunk_size=chunk_size, header=header, codec=codec,
+                              level=self.compression_level, meta=meta,
+                              header_size=header_size,
+                              encoding=self.output_encoding)
+            elif action == 'decode':
+                decode_stream(self.algo, _process, src, dst,
+                              chunk_size=chunk_size, on_header=on_header)
+        finally:
+            if reserved > 0:
+                self.memory.release(reserved)
+
+    def _header_hook(self, params, on_header=None):
+        '''Gets the function to call with the metadata of a header when
+        decoding: the key derivation and the per-call context it records (if
+        any) are used for the params, before calling `on_header`.'''
+        def _on_header(meta):
+            if 'kdf' in meta:
+                params['kdf'] = meta['kdf']
+                if not self._check_secure_params(params, action='decode'):
+                    raise ValueError('Invalid key derivation in the header.')
+            if 'ctx' in meta:
+                # (only the per-call values, e.g. an IV)
+                ctx = {k: v for k, v in meta['ctx'].items()
+                       if k in self.algo.new_context()}
+                self.algo.transform_params(ctx)
+                params.update(ctx)
+            if on_header is not None:
+                on_header(meta)
+        return _on_header
+
+    def _open_input(self, path):
+        '''Opens an input file for reading (throttled, if the object has
+        limits).'''
+        f = open(path, 'rb')
+        if self.throttle is None:
+            return f
+        return self.throttle.reader(f, closefd=True)
+
+    def _process_records(self, records, params, action, offset):
+        '''Processes a batch of records (as one segment for the segmentable
+        algorithms, see `Algorithm.encode_batch`).'''
+        as_text = not self.algo._binary
+        if as_text:
+            records = [r.decode('latin-1') for r in records]
+        if action == 'encode':
+            res = self.algo.encode_batch(records, params, offset)
         else:
-            i = os.path.basename(input_path)
-            print(
-                '[Medusa - Error] Invalid processing: could not write output for "{}".'.format(i))
-            if self.exit_on_error:
-                sys.exit(1)
+            res = self.algo.decode_batch(records, params, offset)
+        if as_text:
+            res = [r.encode('latin-1') for r in res]
+        return res
+
+    def process_records(self, input_path, output_path, action, writer=None,
+                        **kwargs):
+        '''Processes one file in record mode (either for encoding or decoding):
+        the records are read and processed by batches of about the object's
+        chunk size. When encoding, the offsets of the encoded records are
+        written to a sidecar index (the output path with an ".idx" suffix),
+        that decoding then reads the records with.
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the original file.
+        output_path : str
+            Absolute path to the new processed file.
+        action : str
+            Action to perform, can be: "encode" or "decode".
+        writer : OutputWriter, optional
+            Writer to write the output with (the object's one by default).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+        '''
+        if writer is None:
+            writer = self.writer
+        params = self._get_params(action, **kwargs)
+        reserved = 0
+        if self.memory is not None:
+            reserved = self.memory.acquire(IN_FLIGHT_FACTOR * self.chunk_size)
+
+        try:
+            if action == 'encode':
+                offsets = array('Q', [0])
+                with self._open_input(input_path) as FILE_READ, \
+                        writer.open(output_path) as FILE_WRITE:
+                    batches = iter_record_batches(FILE_READ, self.records,
+                                                  self.chunk_size)
+                    try:
+                        for batch in batches:
+                            for res in self._process_records(
+                                    batch, params, action, offsets[-1]):
+                                FILE_WRITE.write(res)
+                                offsets.append(offsets[-1] + len(res))
+                                if self.throttle is not None:
+                                    self.throttle.write(len(res))
+                            if self.throttle is not None:
+                                self.throttle.tick()
+                    except ValueError as e:
+                        print('[Medusa - Error] Invalid records in "{}": '
+                              '{}'.format(input_path, e))
+                        if self.exit_on_error:
+                            sys.exit(1)
+                        raise MedusaError()
+                with writer.open(index_path(output_path)) as FILE_WRITE:
+                    write_index(FILE_WRITE, offsets)
+            elif action == 'decode':
+                if not os.path.exists(index_path(input_path)):
+                    print('[Medusa - Error] Missing record index: "{}"'.format(
+                        index_path(input_path)))
+                    if self.exit_on_error:
+                        sys.exit(1)
+                    raise MedusaError()
+                with self._open_input(input_path) as FILE_READ, \
+                        writer.open(output_path) as FILE_WRITE:
+                    for offsets in iter_index_batches(index_path(input_path)):
+                        FILE_READ.seek(offsets[0])
+                        data = FILE_READ.read(offsets[-1] - offsets[0])
+                        batch = [data[start - offsets[0]:end - offsets[0]]
+                                 for start, end in zip(offsets, offsets[1:])]
+                        for res in self._process_records(batch, params, action,
+                                                         offsets[0]):
+                            FILE_WRITE.write(res)
+                            if self.throttle is not None:
+                                self.throttle.write(len(res))
+                        if self.throttle is not None:
+                            self.throttle.tick()
+        finally:
+            if reserved > 0:
+                self.memory.release(reserved)
+
+    def read_records(self, path, start, stop=None, **kwargs):
+        '''Decodes some records of a file encoded in record mode, reading only
+        their part of the file (and of its index).
+
+        Parameters
+        ----------
+        path : str
+            Path to the encoded file.
+        start : int
+            Index of the first record to decode.
+        stop : int, optional
+            Index after the last record to decode (only the first one if
+            None).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+
+        Returns
+        -------
+        list(bytes)
+            Decoded records (with their delimiter).
+        '''
+        if not os.path.isabs(path):
+            path = os.path.join(self.base_path, path)
+        if stop is None:
+            stop = start + 1
+        params = self._get_params('decode', **kwargs)
+        offsets = read_offsets(index_path(path), start, stop)
+        with open(path, 'rb') as FILE:
+            FILE.seek(offsets[0])
+            data = FILE.read(offsets[-1] - offsets[0])
+        batch = [data[i - offsets[0]:j - offsets[0]]
+                 for i, j in zip(offsets, offsets[1:])]
+        return self._process_records(batch, params, 'decode', offsets[0])
+
+    def open(self, path, mode='rb', **kwargs):
+        '''Opens an encoded file as a file object, that encodes the data written
+        to it ("wb" mode) or decodes the data read from it ("rb" mode) chunk by
+        chunk. The file is in the header format (compressed if the object has
+        a compression codec). In "rb" mode, uncompressed files of segmentable
+        algorithms are seekable.
+
+        Parameters
+        ----------
+        path : str or file-like
+            Path to the encoded file (or binary file object to wrap).
+        mode : str, optional
+            Opening mode, can be: "rb" or "wb" ("rb" by default).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+
+        Returns
+        -------
+        io.BufferedReader or io.BufferedWriter
+            File object.
+        '''
+        if mode not in ['rb', 'wb']:
+            raise ValueError('Invalid mode: "{}" (use "rb" or "wb")'.format(mode))
+        action = 'decode' if mode == 'rb' else 'encode'
+        params = self._get_params(action, **kwargs)
+        meta, on_header, header_size = None, None, None
+        if self.envelope is not None:
+            if action == 'encode':
+                meta, header_size = self._seal(params, action), self.header_size
+            else:
+                on_header = self._seal(params, action)
+        elif action == 'encode' and self.kdf is not None:
+            meta = {'kdf': params['kdf']}
+        if action == 'decode':
+            on_header = self._header_hook(params, on_header)
+
+        def _process(chunk, offset):
+            return self._process_chunk(chunk, params, action, offset=offset)
+
+        closefd = isinstance(path, (str, bytes, os.PathLike))
+        if closefd and not os.path.isabs(path):
+            path = os.path.join(self.base_path, path)
+        f = open(path, mode) if closefd else path
+        try:
+            if mode == 'rb':
+                if not hasattr(f, 'peek'):
+                    f = io.BufferedReader(f)
+                raw = MedusaReader(f, self.algo, _process, self.chunk_size,
+                                   closefd=closefd, on_header=on_header)
+                return io.BufferedReader(raw, buffer_size=self.chunk_size)
+            raw = MedusaWriter(f, self.algo, _process, codec=self.compression,
+                               level=self.compression_level, closefd=closefd,
+                               meta=meta, header_size=header_size,
+                               encoding=self.output_encoding)
+            return io.BufferedWriter(raw, buffer_size=self.chunk_size)
+        except Exception:
+            if closefd:
+                f.close()
+            raise
 
     def encode_file(self, input_path, output_path):
         '''Encodes one file.
@@ -244,7 +1138,9 @@ class Medusa(object):
         '''
         self.process_file(input_path, output_path, 'decode')
 
-    def process_dir(self, input_path, output_path, action, indent=0):
+    def process_dir(self, input_path, output_path, action, indent=0,
+                    resume=False, stats=None, work_dir=None,
+                    lease_ttl=LEASE_TTL, reset_work_dir=False, **kwargs):
         '''Processes one directory recursively (either for encoding or decoding).
 
         Parameters
@@ -257,6 +1153,36 @@ class Medusa(object):
             Action to perform, can be: "encode" or "decode".
         indent : int, optional
             Indent size for log verbose output (0 by default).
+        resume : bool, optional
+            If true, resume an interrupted run from its journal: the files it
+            completed are skipped, and its context is restored (false by
+            default).
+        stats : RunStats, optional
+            Statistics to fill with a record per task, when the files are
+            scheduled on several workers.
+        work_dir : str, optional
+            If given, the run is distributed: several processes (on one or
+            many hosts) pointed at the same input, output and work directory
+            share the files, claiming batches of them with lease files in the
+            work directory (the journal is not used then).
+        lease_ttl : float, optional
+            Duration of the leases of a distributed run, in seconds: the
+            batches of a process that stopped renewing its leases for this
+            long are reclaimed by the other ones (60 by default).
+        reset_work_dir : bool, optional
+            If true, the state of the previous run of the work directory is
+            removed first, to start a new distributed run in it (false by
+            default): a work directory belongs to one run (the same action
+            and algorithm, on the same input and output directories), and
+            is refused otherwise.
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+
+        Returns
+        -------
+        dict
+            Context of the run (the object's one, or the one of the
+            interrupted run when resuming).
         '''
         ind = ' ' * 4 * indent
 
@@ -277,30 +1203,418 @@ class Medusa(object):
             log = 'Reading files from directory: "{}"'.format(dir_name)
             print(ind + log)
             print(ind + '-' * len(log))
-        files = [f for f in os.listdir(input_path)]
+        excluded = []
+
+        def _on_ignore(f):
+            if self.passthrough and os.path.basename(f) in self.exclude:
+                excluded.append(f)
+            elif self.verbose:
+                print(ind + 'Ignoring:', f)
+        links = []
+        dirs, files = scan_dir(input_path, self.exclude, on_ignore=_on_ignore,
+                               symlinks=self.symlinks,
+                               on_link=lambda *link: links.append(link))
+        # (the excluded files, and the contents of the excluded folders, are
+        # copied as is)
+        copies = set()
+        for f in excluded:
+            if not os.path.isdir(os.path.join(input_path, f)):
+                copies.add(f)
+                continue
+
+            def _on_link(p, kind, target, f=f):
+                links.append((os.path.join(f, p), kind, target
+                              if kind == 'symlink' else os.path.join(f, target)))
+            sub_dirs, sub_files = scan_dir(os.path.join(input_path, f),
+                                           symlinks=self.symlinks,
+                                           on_link=_on_link)
+            dirs += [f] + [os.path.join(f, d) for d in sub_dirs]
+            copies.update(os.path.join(f, p) for p in sub_files)
+        files += sorted(copies)
+        for d in dirs:
+            os.makedirs(os.path.join(output_path, d), exist_ok=True)
+        # (in record mode, the indexes are read along with their files)
+        if self.records is not None and action == 'decode':
+            files = [f for f in files if not f.endswith(INDEX_SUFFIX)]
+            links = [l for l in links if not l[0].endswith(INDEX_SUFFIX)]
+        # (the processes of a distributed run do not know when the targets of
+        # the hard links are complete, so they process them as files)
+        if work_dir is not None:
+            files += [l[0] for l in links if l[1] == 'hardlink']
+            links = [l for l in links if l[1] == 'symlink']
+
+        # the run has its own writer and context, so that the object can be
+        # used by other runs at the same time
+        writer = OutputWriter(durability=self.writer.durability)
+        ctx = self.get_context()
+
+        # if asked, checkpoint the completed files (and skip those of the
+        # interrupted run if resuming)
+        journal = None
+        if (self.journal or resume) and work_dir is None:
+            journal = Journal(os.path.join(output_path, JOURNAL_NAME),
+                              durable=writer.durability != 'none')
+            run_ctx, done = journal.load() if resume else ({}, {})
+            if len(run_ctx) > 0:
+                ctx = run_ctx
+            ctx = self._secret_context(ctx, action, recorded=len(run_ctx) > 0)
+            # (a completed output is skipped only if it is still the one
+            # recorded)
+            done = {f for f, digest in done.items()
+                    if file_digest(os.path.join(output_path, f)) == digest}
+            files = [f for f in files if f not in done]
+            if self.verbose and len(done) > 0:
+                print(ind + 'Resuming: {} file(s) already processed.'.format(
+                    len(done)))
+            journal.open(self.public_context(ctx), resume=resume)
+            writer.on_commit = lambda path, digest: journal.record(
+                os.path.relpath(path, output_path), digest)
+
+        # in a distributed run, all the processes use the context of the first one
+        leases = None
+        if work_dir is not None:
+            leases = LeaseDir(work_dir, ttl=lease_ttl)
+            if reset_work_dir:
+                leases.reset()
+            # (by the names of the directories, that may be mounted at
+            # different paths on the hosts)
+            try:
+                leases.check_run({'action': action, 'algo': self.algo._name,
+                                  'input': os.path.basename(os.path.normpath(input_path)),
+                                  'output': os.path.basename(os.path.normpath(output_path))})
+            except ValueError as e:
+                print('[Medusa - Error] {}'.format(e))
+                if self.exit_on_error:
+                    sys.exit(1)
+                else:
+                    raise MedusaError()
+            if action == 'encode':
+                shared = leases.shared_context(self.public_context(
+                    self._secret_context(ctx, action)))
+                ctx = self._secret_context(shared, action, recorded=True)
+        if action == 'encode':
+            kwargs = dict(ctx, **kwargs)
+
+        # if asked, deduplicate the contents through a chunk store (decoding
+        # uses the store of the input directory, if there is one)
+        store = None
+        if action == 'encode' and self.dedup:
+            store = ChunkStore(output_path, self.algo,
+                               durability=writer.durability)
+        elif action == 'decode' and \
+                os.path.isdir(os.path.join(input_path, CHUNKS_DIR)):
+            store = ChunkStore(input_path, self.algo)
 
-        # go through files in directory
-        it = tqdm(files) if indent == 0 else files
         print('{}{} "{}"'.format(ind, 'Encrypting' if action == 'encode' else 'Decrypting',
                                  dir_name))
-        for f in it:
-            if f.startswith('.') or f in self.exclude:
+        completed = False
+
+        def _copy_files(batch_files):
+            # (copies the files to pass through, returns the other ones)
+            for f in batch_files:
+                if f in copies:
+                    self.copy_file(os.path.join(input_path, f),
+                                   os.path.join(output_path, f), indent=indent,
+                                   commit=False, writer=writer)
+            return [f for f in batch_files if f not in copies]
+
+        if leases is not None:
+            def _process_batch(batch_files):
+                batch_files = _copy_files(batch_files)
+                if self.workers > 1 and len(batch_files) > 1:
+                    schedule_files(self, input_path, output_path, batch_files,
+                                   action, kwargs, stats=stats)
+                    return
+                for f in batch_files:
+                    self.process_file(os.path.join(input_path, f),
+                                      os.path.join(output_path, f), action,
+                                      indent=indent, commit=False, store=store,
+                                      writer=writer, **kwargs)
+                if store is not None:
+                    store.flush()
+                writer.flush()
+
+            progress = tqdm(total=len(files)) if indent == 0 else None
+            try:
+                n_batches = run_distributed(input_path, files, leases,
+                                            _process_batch, progress=progress)
+            finally:
+                if progress is not None:
+                    progress.close()
+            self._create_links(output_path, links, action, indent=indent)
+            if self.verbose:
+                print(ind + 'Processed {} batch(es) as "{}".'.format(
+                    n_batches, leases.owner))
+                print('')
+            return ctx
+
+        # with several workers, the files are scheduled by size on a pool of
+        # worker processes
+        if self.workers > 1 and len(files) > 1:
+            if stats is None:
+                stats = RunStats(self.workers)
+            files = _copy_files(files)
+            progress = tqdm(total=len(files)) if indent == 0 else None
+            try:
+                writer.flush()
+                schedule_files(self, input_path, output_path, files, action,
+                               kwargs, on_commit=journal.record
+                               if journal is not None else None,
+                               stats=stats, progress=progress)
+                self._create_links(output_path, links, action, indent=indent)
+                completed = True
+            finally:
+                if progress is not None:
+                    progress.close()
+                if journal is not None:
+                    journal.close(remove=completed)
+            if self.verbose:
+                summary = stats.summary()
+                print(ind + 'Scheduled {} task(s) on {} worker(s): {:.1f}s, '
+                      '{:.0%} utilization'.format(
+                          summary['tasks'], self.workers,
+                          summary['wall_time'], summary['utilization']))
+                print('')
+            return ctx
+
+        # in pipelined mode, the next files are read ahead and the outputs
+        # written behind while the current one is processed
+        read_ahead, write_behind = None, None
+        if self.pipelined and store is None and self.records is None:
+            read_ahead = ReadAhead([os.path.join(input_path, f)
+                                    for f in files if f not in copies],
+                                   self.chunk_size)
+            write_behind = WriteBehind(writer)
+        # go through files in directory
+        it = tqdm(files) if indent == 0 else files
+        try:
+            last_dir = None
+            for f in it:
+                ipath = os.path.join(input_path, f)
+                opath = os.path.join(output_path, f)
+
+                # commit the outputs still pending in the previous directory
+                # (after the chunks they refer to)
+                if os.path.dirname(opath) != last_dir and last_dir is not None:
+                    if store is not None:
+                        store.flush()
+                    (write_behind or writer).flush(last_dir)
+                last_dir = os.path.dirname(opath)
+
+                if f in copies:
+                    self.copy_file(ipath, opath, indent=indent, commit=False,
+                                   writer=writer)
+                    continue
+                self.process_file(ipath, opath, action, indent=indent,
+                                  commit=False, store=store, writer=writer,
+                                  read_ahead=read_ahead,
+                                  write_behind=write_behind, **kwargs)
+            if write_behind is not None:
+                write_behind.close()
+                write_behind = None
+            if store is not None:
+                store.flush()
+            writer.flush()
+            self._create_links(output_path, links, action, indent=indent)
+            completed = True
+        finally:
+            if read_ahead is not None:
+                read_ahead.close()
+            if write_behind is not None:
+                # (the error that interrupted the run is the one raised)
+                try:
+                    write_behind.close()
+                except Exception:
+                    pass
+            if journal is not None:
+                # the journal is only useful until the run is complete
+                journal.close(remove=completed)
+
+        if self.verbose:
+            print('')
+        return ctx
+
+    def _create_links(self, output_path, links, action, indent=0):
+        '''Recreates the links of a processed directory (see `scan_dir`), once
+        the targets of its hard links are written.
+
+        Parameters
+        ----------
+        output_path : str
+            Absolute path to the processed directory.
+        links : list(tuple(str, str, str))
+            Relative path, kind and target of each link.
+        action : str
+            Action performed, can be: "encode" or "decode".
+        indent : int, optional
+            Indent size for log verbose output (0 by default).
+        '''
+        for rel_path, kind, target in links:
+            create_link(output_path, rel_path, kind, target)
+            # (in record mode, the index of an encoded file is linked too)
+            if kind == 'hardlink' and self.records is not None \
+                    and action == 'encode':
+                create_link(output_path, index_path(rel_path), kind,
+                            index_path(target))
+        if self.verbose and len(links) > 0:
+            print(' ' * 4 * indent + 'Recreated {} link(s).'.format(len(links)))
+
+    def encode_tar(self, input_path, dst, indent=0, **kwargs):
+        '''Encodes one directory recursively into a tar stream, written
+        incrementally: each file is an archive member in the header format,
+        read and encoded in a background thread while the previous data is
+        written. The sizes of uncompressed members are known in advance, so
+        they are never buffered; compressed ones are spooled (in memory up to
+        the chunk size, on disk beyond).
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the original directory.
+        dst : file-like
+            Stream to write the archive to (with a `write` method).
+        indent : int, optional
+            Indent size for log verbose output (0 by default).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+        '''
+        ind = ' ' * 4 * indent
+
+        if not os.path.isabs(input_path):
+            input_path = os.path.join(self.base_path, input_path)
+
+        dir_name = os.path.basename(input_path)
+
+        def _on_ignore(f):
+            if self.verbose:
+                print(ind + 'Ignoring:', f)
+        links = []
+        dirs, files = scan_dir(input_path, self.exclude, on_ignore=_on_ignore,
+                               symlinks=self.symlinks,
+                               on_link=lambda *link: links.append(link))
+
+        print('{}Encrypting "{}" to a tar stream'.format(ind, dir_name))
+        # (the links to follow are listed as files and folders)
+        tar = tarfile.open(fileobj=dst, mode='w|', format=tarfile.PAX_FORMAT,
+                           dereference=True)
+        try:
+            for d in dirs:
+                tar.addfile(tar.gettarinfo(os.path.join(input_path, d),
+                                           arcname=d))
+            for f in (tqdm(files) if indent == 0 else files):
+                ipath = os.path.join(input_path, f)
                 if self.verbose:
-                    print(ind + 'Ignoring:', f)
-                continue
+                    print('\n{}> {}'.format(ind, f))
+                info = tar.gettarinfo(ipath, arcname=f)
+
+                def _encode(out, ipath=ipath):
+                    with open(ipath, 'rb') as FILE_READ:
+                        self.process_stream(FILE_READ, out, 'encode',
+                                            header=True, **kwargs)
+
+                size = None
+                if self.compression is None:
+                    size = encoded_size(self.algo, info.size,
+                                        level=self.compression_level,
+                                        header_size=self.header_size
+                                        if self.envelope else None,
+                                        meta={'kdf': self.kdf}
+                                        if self.kdf is not None else None,
+                                        encoding=self.output_encoding)
+                if size is None:
+                    with tempfile.SpooledTemporaryFile(self.chunk_size) as spool:
+                        _encode(spool)
+                        info.size = spool.tell()
+                        spool.seek(0)
+                        tar.addfile(info, spool)
+                    continue
+
+                info.size = size
+                pipe = Pipe()
+                thread = run_producer(_encode, pipe)
+                try:
+                    tar.addfile(info, pipe)
+                    if len(pipe.read(1)) > 0:
+                        raise IOError(
+                            'File changed while encoding: "{}"'.format(f))
+                finally:
+                    pipe.cancel()
+                    thread.join()
+            # (the links come after their targets)
+            for rel_path, kind, target in links:
+                info = tarfile.TarInfo(rel_path)
+                info.type = tarfile.SYMTYPE if kind == 'symlink' \
+                    else tarfile.LNKTYPE
+                info.linkname = target
+                tar.addfile(info)
+        finally:
+            tar.close()
+
+    def decode_tar(self, src, output_path, indent=0, **kwargs):
+        '''Decodes a tar stream (see `encode_tar`) into a directory, extracting
+        the members while reading the stream: the outputs are written in a
+        background thread while the next data is decoded. The links are
+        recreated; members that are not regular files, directories or links,
+        or whose path (or link target) leads outside of the output directory,
+        are ignored.
 
-            # read input file
-            ipath = os.path.abspath(os.path.join(input_path, f))
-            opath = os.path.abspath(os.path.join(output_path, f))
-            if os.path.isdir(ipath):
-                self.process_dir(ipath, opath, action, indent=indent + 1)
-            else:
-                self.process_file(ipath, opath, action, indent=indent)
+        Parameters
+        ----------
+        src : file-like
+            Binary stream to read the archive from.
+        output_path : str
+            Absolute path to the new processed directory.
+        indent : int, optional
+            Indent size for log verbose output (0 by default).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+        '''
+        ind = ' ' * 4 * indent
 
-            sleep(0.1)
+        if not os.path.isabs(output_path):
+            output_path = os.path.join(self.base_path, output_path)
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
 
-        if self.verbose:
-            print('')
+        print('{}Decrypting tar stream to "{}"'.format(
+            ind, os.path.basename(output_path)))
+        out = WriteBehind(OutputWriter(durability=self.writer.durability))
+        try:
+            with tarfile.open(fileobj=src, mode='r|') as tar:
+                for member in tar:
+                    path = safe_member_path(member.name)
+                    target = None
+                    if path is not None and member.issym():
+                        target = safe_link_target(path, member.linkname)
+                    elif path is not None and member.islnk():
+                        target = safe_member_path(member.linkname)
+                    if path is None or not (member.isfile() or member.isdir() or
+                                            target is not None):
+                        print('{}[Medusa - Warning] Ignoring archive member: '
+                              '"{}"'.format(ind, member.name))
+                        continue
+                    opath = os.path.join(output_path, path)
+                    if member.isdir():
+                        os.makedirs(opath, exist_ok=True)
+                        continue
+                    if target is not None:
+                        # (the target of a hard link must be written first)
+                        os.makedirs(os.path.dirname(opath), exist_ok=True)
+                        out.flush()
+                        out.link(output_path, path, 'symlink'
+                                 if member.issym() else 'hardlink',
+                                 member.linkname if member.issym() else target)
+                        continue
+                    if self.verbose:
+                        print('\n{}> {}'.format(ind, path))
+                    os.makedirs(os.path.dirname(opath), exist_ok=True)
+                    out.open(opath)
+                    self.process_stream(tar.extractfile(member), out, 'decode',
+                                        **kwargs)
+                    out.commit()
+            out.flush()
+        finally:
+            out.close()
 
     def encode_dir(self, input_path, output_path):
         '''Encodes one directory.
@@ -311,8 +1625,13 @@ class Medusa(object):
             Absolute path to the original directory.
         output_path : str
             Absolute path to the new processed directory.
+
+        Returns
+        -------
+        dict
+            Context of the run.
         '''
-        self.process_dir(input_path, output_path, 'encode')
+        return self.process_dir(input_path, output_path, 'encode')
 
     def decode_dir(self, input_path, output_path):
         '''Decodes one directory.
@@ -326,38 +1645,388 @@ class Medusa(object):
         '''
         self.process_dir(input_path, output_path, 'decode')
 
-    def process(self, args):
+    def watch_dir(self, input_path, output_path, settle=SETTLE_TIME,
+                  move_to=None, delete=False, polling=False,
+                  interval=POLL_INTERVAL, on_start=None, **kwargs):
+        '''Watches a directory and encodes its files as they land in it, until
+        interrupted: the files are picked up through inotify (or by periodic
+        scans, if it is not available), and encoded once they have not
+        changed for a while (see `watch.Watcher`). The files share the
+        context of the run, but each encoding gets its own per-call values
+        (e.g. a new AES IV, recorded in its header), so that no keystream is
+        ever reused, even when a modified file is encoded again.
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the directory to watch.
+        output_path : str
+            Absolute path to the directory to write the outputs to (outside
+            of the watched directory).
+        settle : float, optional
+            Time without changes after which a file is considered complete,
+            in seconds (0.5s by default).
+        move_to : str, optional
+            If given, path to the directory to move the encoded sources to
+            (outside of the watched directory).
+        delete : bool, optional
+            If true, the encoded sources are deleted (false by default).
+        polling : bool, optional
+            If true, scan the directory periodically instead of using
+            inotify (false by default).
+        interval : float, optional
+            Interval between two scans, if polling, in seconds (1s by default).
+        on_start : callable, optional
+            Function called with the watcher once it is created (e.g. to stop
+            it from another thread).
+        kwargs : dict, optional
+            Additional processing params (override the object's params).
+
+        Returns
+        -------
+        dict
+            Context of the run.
+        '''
+        paths = []
+        for p in [input_path, output_path, move_to]:
+            if p is not None and not os.path.isabs(p):
+                p = os.path.join(self.base_path, p)
+            paths.append(p)
+        input_path, output_path, move_to = paths
+
+        root = os.path.realpath(input_path)
+        for p in [output_path, move_to]:
+            if p is None:
+                continue
+            p = os.path.realpath(p)
+            if p == root or p.startswith(root + os.sep):
+                print('[Medusa - Error] Invalid argument: the outputs of a '
+                      'watch must be outside of the watched directory.')
+                if self.exit_on_error:
+                    sys.exit(1)
+                raise MedusaError()
+        # (the record mode has no header to record the per-call context in)
+        if self.records is not None:
+            print('[Medusa - Error] Invalid argument: the record mode cannot '
+                  'be used to watch a directory.')
+            if self.exit_on_error:
+                sys.exit(1)
+            raise MedusaError()
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+
+        ctx = self.get_context()
+        watcher = Watcher(self, input_path, output_path, settle=settle,
+                          move_to=move_to, delete=delete, polling=polling,
+                          interval=interval, **dict(ctx, **kwargs))
+        if self.verbose:
+            print('Watching "{}" ({})'.format(
+                os.path.basename(input_path), 'polling'
+                if watcher.source.fileno() is None else 'inotify'))
+        if on_start is not None:
+            on_start(watcher)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        if self.verbose:
+            print('Encoded {} file(s).'.format(watcher.n_processed))
+        return ctx
+
+    def _verify_hook(self, **kwargs):
+        '''Gets the function that checks the wrapped data key of a header, for
+        the objects with an envelope (None otherwise).'''
+        if self.envelope is None:
+            return None
+        params = self._get_params('decode', **kwargs)
+
+        def _on_header(meta):
+            if 'key' in meta or 'keys' in meta:
+                envelopes.unwrap_keys(meta, params)
+        return _on_header
+
+    def verify_file(self, input_path, **kwargs):
+        '''Checks the integrity of an encoded file without decoding it (see
+        `verify.verify_file`). For envelope outputs, if the object has an
+        envelope, the authentication tag of the wrapped data key is checked
+        too.
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the encoded file.
+        kwargs : dict, optional
+            Additional params (override the object's params), to unwrap the
+            data keys.
+
+        Returns
+        -------
+        (str, str)
+            Status of the file ("ok", "corrupted" or "unchecked") and details.
+        '''
+        if not os.path.isabs(input_path):
+            input_path = os.path.join(self.base_path, input_path)
+        return verify_file(input_path, chunk_size=self.chunk_size,
+                           on_header=self._verify_hook(**kwargs))
+
+    def verify_dir(self, input_path, indent=0, **kwargs):
+        '''Checks the integrity of the encoded files of a directory recursively
+        with the object's workers (see `verify.verify_dir`). The corrupted
+        files are logged.
+
+        Parameters
+        ----------
+        input_path : str
+            Absolute path to the encoded directory.
+        indent : int, optional
+            Indent size for log verbose output (0 by default).
+        kwargs : dict, optional
+            Additional params (override the object's params).
+
+        Returns
+        -------
+        dict
+            Status and details of each file (by relative path).
+        '''
+        ind = ' ' * 4 * indent
+        if not os.path.isabs(input_path):
+            input_path = os.path.join(self.base_path, input_path)
+
+        def _on_ignore(f):
+            if self.verbose:
+                print(ind + 'Ignoring:', f)
+
+        def _on_report(f, status, message):
+            if status == 'corrupted' or self.verbose:
+                print('{}[{:>9}] {}: {}'.format(ind, status, f, message))
+
+        progress = tqdm(total=0) if indent == 0 else None
+        try:
+            return verify_dir(input_path, workers=self.workers,
+                              exclude=self.exclude, chunk_size=self.chunk_size,
+                              on_header=self._verify_hook(**kwargs),
+                              on_report=_on_report, on_ignore=_on_ignore,
+                              progress=progress)
+        finally:
+            if progress is not None:
+                progress.close()
+
+    def rekey(self, path, new_params, new_envelope=None, recipients=None,
+              **kwargs):
+        '''Rewraps the data keys of envelope outputs (see the `envelope` option)
+        with new keys, e.g. to rotate a password: their contents are neither
+        decoded nor re-encoded, only their headers are rewritten (in place,
+        with a backup of the old header until the new one is on disk, so that
+        an interrupted rekey is undone by the next one), so the cost depends
+        on the number of files, not on their size (the outputs in a text
+        encoding are copied, see `output_encoding`).
+
+        Parameters
+        ----------
+        path : str
+            Path to an encoded file, or to a directory of encoded files (the
+            files without envelope are left untouched).
+        new_params : dict
+            Params to wrap the data keys with (e.g. the new password).
+        new_envelope : str, optional
+            Kind of envelope to wrap the data keys with: "password" or "rsa"
+            (the object's one if None).
+        recipients : list, optional
+            Public keys of the recipients to wrap the data keys for, e.g. to
+            add or remove one (see the `recipients` option; the object's
+            ones if None and the envelope is the same).
+        kwargs : dict, optional
+            Additional params to unwrap the data keys with (override the
+            object's params).
+
+        Returns
+        -------
+        int
+            Number of rekeyed files.
+        '''
+        if new_envelope is None:
+            new_envelope = 'rsa' if recipients is not None else self.envelope
+        if recipients is None and new_envelope == self.envelope:
+            recipients = self.recipients
+        if self.envelope is None or new_envelope not in ENVELOPE_KINDS \
+                or (recipients is not None and new_envelope != 'rsa'):
+            print('[Medusa - Error] Rekeying needs an envelope (available: {}, '
+                  'recipients only with "rsa").'.format(', '.join(ENVELOPE_KINDS)))
+            if self.exit_on_error:
+                sys.exit(1)
+            raise MedusaError()
+        if recipients is not None:
+            recipients = [envelopes.load_public_key(r) for r in recipients]
+        params = self._get_params('decode', **kwargs)
+        if self.kdf is not None:
+            new_params = dict(new_params, kdf=new_params.get('kdf', self.kdf))
+        if recipients is None and \
+                not self._check_missing_params(new_params, action='encode',
+                                               envelope=new_envelope):
+            raise MedusaError()
+        if not self._check_secure_params(new_params, action='encode',
+                                         envelope=new_envelope):
+            raise MedusaError()
+
+        if not os.path.isabs(path):
+            path = os.path.join(self.base_path, path)
+        if os.path.isdir(path):
+            _, files = scan_dir(path, self.exclude)
+            paths = [os.path.join(path, f) for f in files]
+        else:
+            paths = [path]
+
+        # (a single derivation of the new password for all the files)
+        salt = envelopes.new_salt()
+        n_rekeyed = 0
+        for p in paths:
+            if p.endswith(PATCH_SUFFIX):
+                continue
+            # (a header that an interrupted rekey was rewriting is restored)
+            if recover_patch(p) and self.verbose:
+                print('Restored an interrupted rekey:', p)
+            with open(p, 'rb') as FILE:
+                encoding = peek_encoding(FILE)
+                meta = read_header(decoding_reader(FILE))
+                size = FILE.tell()
+            if meta is None or ('key' not in meta and 'keys' not in meta):
+                if self.verbose:
+                    print('Ignoring (no envelope):', p)
+                continue
+            data_key = envelopes.unwrap_keys(meta, params)
+            meta.pop('key', None)
+            meta.pop('keys', None)
+            meta.update(envelopes.wrap_keys(new_envelope, data_key, new_params,
+                                            salt=salt, recipients=recipients))
+            header = pack_header(meta, size=size)
+            if encoding == 'raw' and len(header) == size:
+                # (the header holds the only wrapped copy of the data key:
+                # it is never left torn)
+                patch_file(p, header)
+            else:
+                # the new header does not fit in the old one (or is encoded
+                # with the content): the content is copied as is after it
+                with open(p, 'rb') as FILE_READ, self.writer.open(p) as FILE_WRITE:
+                    src = decoding_reader(FILE_READ)
+                    read_header(src)
+                    out = encoding_writer(FILE_WRITE, encoding)
+                    out.write(pack_header(
+                        meta, size=envelopes.header_size(recipients)))
+                    for chunk in iter_chunks(src, self.chunk_size):
+                        out.write(chunk)
+                    if out is not FILE_WRITE:
+                        out.close()
+                self.writer.flush()
+            n_rekeyed += 1
+        return n_rekeyed
+
+    def process(self, args, stdout=None):
         '''Processes the inputs (using the args context).
 
         Parameters
         ----------
         args : dict
-            Execution context.
+            Execution context (an input or output path of "-" means the
+            standard input or output).
+        stdout : file-like, optional
+            Stream to write the output to when the output path is "-" (the
+            standard output by default).
         '''
+        if stdout is None:
+            stdout = sys.stdout
+        # when the output is the standard output, logs go to the standard error
+        with redirect_stdout(sys.stderr if args['output'] == STREAM_PATH
+                             else sys.stdout):
+            self._process(args, stdout)
+            if self.verbose or self.memory is not None:
+                log = 'Peak memory: {}'.format(format_size(peak_rss()))
+                if self.memory is not None:
+                    log += ' (budget: {}, peak in flight: {})'.format(
+                        format_size(self.memory.limit),
+                        format_size(self.memory.peak))
+                print(log)
+            if self.throttle is not None:
+                print(self.throttle.summary())
+
+    def _process(self, args, stdout):
         if self.verbose:
             print('')
+        ctx = None
 
-        if not os.path.isabs(args['input']):
-            input_path = os.path.join(self.base_path, args['input'])
-        else:
+        if args['input'] == STREAM_PATH or os.path.isabs(args['input']):
             input_path = args['input']
-        if not os.path.isabs(args['output']):
-            output_path = os.path.join(self.base_path, args['output'])
         else:
+            input_path = os.path.join(self.base_path, args['input'])
+        if args['output'] == STREAM_PATH or os.path.isabs(args['output']):
             output_path = args['output']
+        else:
+            output_path = os.path.join(self.base_path, args['output'])
 
         input_type = 'dir' if os.path.isdir(input_path) else 'file'
+        if args.get('tar', False):
+            input_type = 'tar'
+        elif STREAM_PATH in [input_path, output_path]:
+            if input_type == 'dir':
+                print('[Medusa - Error] Invalid argument: a directory can only '
+                      'be processed from or to a standard stream as a tar stream.')
+                if self.exit_on_error:
+                    sys.exit(1)
+                raise MedusaError()
+            input_type = 'stream'
+        if self.records is not None and input_type in ['stream', 'tar']:
+            print('[Medusa - Error] Invalid argument: the record mode needs '
+                  'files (for the record indexes).')
+            if self.exit_on_error:
+                sys.exit(1)
+            raise MedusaError()
 
         # if acting on FILE
         if input_type == 'file':
             self.process_file(input_path=input_path,
                               output_path=output_path,
                               action=args['action'])
+        # else if acting on STREAM (standard input and/or output)
+        elif input_type == 'stream':
+            if input_path == STREAM_PATH:
+                src = sys.stdin.buffer
+            else:
+                src = open(input_path, 'rb')
+            if output_path == STREAM_PATH:
+                dst = StreamWriter(stdout)
+            else:
+                dst = self.writer.open(output_path)
+            with dst:
+                self.process_stream(src, dst, args['action'])
+            if src is not sys.stdin.buffer:
+                src.close()
+            self.writer.flush()
+        # else if acting on a TAR STREAM (of a directory)
+        elif input_type == 'tar':
+            if args['action'] == 'encode':
+                if output_path == STREAM_PATH:
+                    dst = StreamWriter(stdout)
+                else:
+                    dst = self.writer.open(output_path)
+                with dst:
+                    self.encode_tar(input_path, dst)
+                self.writer.flush()
+            else:
+                if input_path == STREAM_PATH:
+                    src = sys.stdin.buffer
+                else:
+                    src = open(input_path, 'rb')
+                self.decode_tar(src, output_path)
+                if src is not sys.stdin.buffer:
+                    src.close()
         # else if acting on DIRECTORY
         elif input_type == 'dir':
-            self.process_dir(input_path=input_path,
-                             output_path=output_path,
-                             action=args['action'])
+            ctx = self.process_dir(input_path=input_path,
+                                   output_path=output_path,
+                                   action=args['action'],
+                                   resume=args.get('resume', False),
+                                   work_dir=args.get('work_dir'),
+                                   lease_ttl=args.get('lease_ttl', LEASE_TTL),
+                                   reset_work_dir=args.get('reset_work_dir', False))
 
             # if asked, zip the resulting directory
             if args['zip']:
@@ -367,7 +2036,7 @@ class Medusa(object):
 
         if args['action'] == 'encode':
             print('')
-            self._print_context()
+            self._print_context(ctx)
 
 
 def parse_args(args):
@@ -387,33 +2056,201 @@ def parse_args(args):
             action=action,
             exclude=args.exclude,
             zip=args.zip,
-            verbose=args.verbose
+            verbose=args.verbose,
+            workers=args.workers,
+            durability=args.durability,
+            journal=args.journal,
+            resume=args.resume,
+            dedup=args.dedup,
+            compression=args.compression,
+            compression_level=args.compression_level,
+            max_memory=args.max_memory,
+            chunk_size=args.chunk_size,
+            strategy=args.strategy,
+            auto_tune=args.auto_tune,
+            params_fd=args.params_fd,
+            tar=args.tar,
+            work_dir=args.work_dir,
+            lease_ttl=args.lease_ttl,
+            reset_work_dir=args.reset_work_dir,
+            records=args.records,
+            envelope=args.envelope,
+            checksum=args.checksum,
+            symlinks=args.symlinks,
+            passthrough=args.passthrough,
+            read_rate=args.read_rate,
+            write_rate=args.write_rate,
+            cpu_limit=args.cpu_limit,
+            nice=args.nice,
+            ionice=args.ionice,
+            control_file=args.control_file,
+            kdf=args.kdf,
+            recipients=args.recipients,
+            private_key=args.private_key,
+            output_encoding=args.output_encoding,
+            pipelined=args.pipelined
         )
     return config
 
 
-def input_params(algo, action):
+def read_params_fd(fd):
+    '''Reads params from a file descriptor (one "name=value" per line), so that
+    they can be passed by a calling process without prompts.
+
+    Parameters
+    ----------
+    fd : int
+        File descriptor to read.
+
+    Returns
+    -------
+    dict
+        Read params.
+    '''
+    params = dict()
+    with os.fdopen(fd, 'r') as FILE:
+        for line in FILE:
+            line = line.rstrip('\n')
+            if '=' not in line:
+                continue
+            k, v = line.split('=', 1)
+            params[k.strip()] = v
+    return params
+
+
+def input_params(algo, action, params_fd=None, envelope=None, prefix='',
+                 private_key=None, recipients=None):
+    # (RSA keys can be read from a private key file, and data keys wrapped
+    # for recipients need no params to encode)
+    if private_key is not None:
+        return envelopes.load_private_key(private_key)
+    if recipients and action == 'encode':
+        return dict()
     params = dict()
-    ref_params = ALGORITHMS[algo].get_params()
+    ref_params = ALGORITHMS[algo].get_params() if envelope is None \
+        else ENVELOPE_PARAMS[envelope]
     req_params = ref_params.get('common', {}).get('required', []) + \
         ref_params.get(action, {}).get('required', [])
 
-    if len(req_params) > 0:
+    # params can be supplied by a file descriptor or by the environment
+    # (e.g. MEDUSA_PASSWORD, or MEDUSA_NEW_PASSWORD with the "new_" prefix),
+    # else they are prompted
+    supplied = read_params_fd(params_fd) if params_fd is not None else {}
+    prompted = []
+    for param in req_params:
+        env_name = PARAMS_ENV_PREFIX + (prefix + param).upper()
+        if prefix + param in supplied:
+            params[param] = supplied[prefix + param]
+        elif env_name in os.environ:
+            params[param] = os.environ[env_name]
+        else:
+            prompted.append(param)
+
+    if len(prompted) > 0:
         print(ShellColors.BLUE + '[Medusa] Set params:')
-        for param in req_params:
-            prompt = '>> {}: '.format(param.title().replace('_', ' '))
+        for param in prompted:
+            prompt = '>> {}: '.format(
+                (prefix + param).title().replace('_', ' '))
             tmp = getpass.getpass(prompt=prompt)
             params[param] = tmp
         print(ShellColors.ENDC)
     return params
 
 
+def rekey(args):
+    '''Runs the "rekey" command: the data keys of the envelope outputs of a
+    file or dir are rewrapped with new params (see `Medusa.rekey`).'''
+    supplied = read_params_fd(args.params_fd) \
+        if args.params_fd is not None else {}
+    new_envelope = args.new_envelope or \
+        ('rsa' if args.recipients else args.envelope)
+    params, new_params = {}, {}
+    for p, kind, prefix, action in [(params, args.envelope, '', 'decode'),
+                                    (new_params, new_envelope, 'new_', 'encode')]:
+        for k, v in supplied.items():
+            if k.startswith(prefix) and (prefix or not k.startswith('new_')):
+                p[k[len(prefix):]] = v
+        required = ENVELOPE_PARAMS[kind].get('common', {}).get('required', []) + \
+            ENVELOPE_PARAMS[kind].get(action, {}).get('required', [])
+        missing = [k for k in required if k not in p]
+        if len(missing) > 0:
+            p.update(input_params('aes', action, envelope=kind, prefix=prefix,
+                                  private_key=args.private_key
+                                  if action == 'decode' else None,
+                                  recipients=args.recipients))
+
+    processor = Medusa(algo='aes', params=params, exclude=args.exclude,
+                       verbose=args.verbose, durability=args.durability,
+                       envelope=args.envelope, base_path=os.getcwd())
+    n_rekeyed = processor.rekey(args.input, new_params,
+                                new_envelope=new_envelope,
+                                recipients=args.recipients)
+    print('Rekeyed {} file(s).'.format(n_rekeyed))
+
+
+def verify(args):
+    '''Runs the "verify" command: the integrity of an encoded file or dir is
+    checked without decoding it (see `verify.verify_file`). No key is needed,
+    unless the wrapped data keys are checked too. Exits with an error code
+    if some files are corrupted.'''
+    on_header = None
+    if args.envelope is not None:
+        params = input_params('aes', 'decode', params_fd=args.params_fd,
+                              envelope=args.envelope,
+                              private_key=args.private_key)
+        processor = Medusa(algo='aes', params=params, envelope=args.envelope)
+        on_header = processor._verify_hook()
+
+    def _on_report(f, status, message):
+        if status == 'corrupted' or args.verbose:
+            print('[{:>9}] {}: {}'.format(status, f, message))
+
+    path = os.path.abspath(args.input)
+    if os.path.isdir(path):
+        progress = tqdm(total=0)
+        try:
+            reports = verify_dir(path, workers=args.workers,
+                                 exclude=args.exclude, on_header=on_header,
+                                 on_report=_on_report, progress=progress)
+        finally:
+            progress.close()
+    else:
+        reports = {args.input: verify_file(path, on_header=on_header)}
+        _on_report(args.input, *reports[args.input])
+
+    statuses = [status for status, _ in reports.values()]
+    print('Verified {} file(s): {} ok, {} corrupted, {} unchecked.'.format(
+        len(statuses), statuses.count('ok'), statuses.count('corrupted'),
+        statuses.count('unchecked')))
+    if 'corrupted' in statuses:
+        sys.exit(1)
+
+
+def watch(args):
+    '''Runs the "watch" command: the files that land in a dir are encoded
+    as they come, until interrupted (see `Medusa.watch_dir`). The context
+    to decode them is printed first.'''
+    params = input_params(args.algo, 'encode', params_fd=args.params_fd,
+                          envelope=args.envelope, recipients=args.recipients)
+    processor = Medusa(algo=args.algo, params=params, exclude=args.exclude,
+                       verbose=args.verbose, base_path=os.getcwd(),
+                       durability=args.durability,
+                       compression=args.compression, envelope=args.envelope,
+                       checksum=args.checksum, recipients=args.recipients,
+                       output_encoding=args.output_encoding)
+    processor._print_context(processor.get_context())
+    processor.watch_dir(args.input, args.output, settle=args.settle,
+                        move_to=args.move_to, delete=args.delete,
+                        polling=args.poll, interval=args.interval)
+
+
 def main(return_args=False, **args):
     if len(args) == 0:
         parser = argparse.ArgumentParser()
         subparsers = parser.add_subparsers()
 
-        actions_parser = parser.add_mutually_exclusive_group(required=True)
+        # (an action is required for all subcommands but "serve")
+        actions_parser = parser.add_mutually_exclusive_group()
         actions_parser.add_argument('-e', '--encode', action='store_true')
         actions_parser.add_argument('-d', '--decode', action='store_true')
 
@@ -426,9 +2263,10 @@ def main(return_args=False, **args):
         cli_parser.add_argument('-a', '--algo', type=str, required=True,
                                 help='Algorithm to use for the encode/decode process.')
         cli_parser.add_argument('-i', '--input', type=str, required=True,
-                                help='Path to the input file or dir to process.')
+                                help='Path to the input file or dir to process ("-" for the standard input).')
         cli_parser.add_argument('-o', '--output', type=str, required=True,
-                                help='Path to the output file or dir (where to write the processed data).')
+                                help='Path to the output file or dir (where to write the processed data, '
+                                '"-" for the standard output).')
 
         cli_parser.add_argument('--exclude', type=str, default=[], nargs='+',
                                 help='List of files or folders to ignore during processing.')
@@ -436,8 +2274,217 @@ def main(return_args=False, **args):
                                 help='If true, create a zip with the processed data (only for dir processing).')
         cli_parser.add_argument('-v', '--verbose', action='store_true',
                                 help='If true, print additional logs during process.')
-
-        args = parse_args(parser.parse_args())
+        cli_parser.add_argument('-j', '--workers', type=int, default=None,
+                                help='Number of processes to use to process large files in parallel segments.')
+        cli_parser.add_argument('--durability', type=str, default='none',
+                                choices=DURABILITY_POLICIES,
+                                help='Fsync policy for the outputs: none, file (each file) or batch (per directory).')
+        cli_parser.add_argument('--journal', action='store_true',
+                                help='If true, checkpoint the progress of a dir processing so that it can be resumed.')
+        cli_parser.add_argument('--resume', action='store_true',
+                                help='If true, resume an interrupted dir processing from its journal.')
+        cli_parser.add_argument('--dedup', action='store_true',
+                                help='If true, deduplicate the contents of a dir before encoding them.')
+        cli_parser.add_argument('-c', '--compression', type=str, default=None,
+                                choices=CODECS,
+                                help='Codec to compress the contents with before encoding them.')
+        cli_parser.add_argument('--compression-level', type=int, default=None,
+                                help='Compression level (the codec default if not set).')
+        cli_parser.add_argument('--max-memory', type=str, default=None,
+                                help='Budget of in-flight bytes for the processing (e.g. "512M").')
+        cli_parser.add_argument('--chunk-size', type=str, default=None,
+                                help='Size of the chunks files are streamed by (e.g. "4M").')
+        cli_parser.add_argument('--strategy', type=str, default=None, choices=STRATEGIES,
+                                help='How dir files are processed with several workers (processes or threads).')
+        cli_parser.add_argument('--auto-tune', action='store_true',
+                                help='If true, tune the workers, chunk size, strategy and memory budget for '
+                                'this host (explicit arguments are kept).')
+        cli_parser.add_argument('--pipelined', action='store_true',
+                                help='If true, read the next files ahead and write the outputs behind in '
+                                'background threads, overlapping the disk I/O with the processing.')
+        cli_parser.add_argument('--records', type=str, nargs='?', default=None, const='\\n',
+                                help='If set, process files in record mode, with this record delimiter '
+                                '(newlines by default), and write an index of the records next to them.')
+        cli_parser.add_argument('--envelope', type=str, default=None, choices=ENVELOPE_KINDS,
+                                help='If set, encrypt each output under its own data key, wrapped with the '
+                                'password or an RSA public key (so that rekeying only rewrites the headers).')
+        cli_parser.add_argument('--recipient', type=str, default=None, action='append', dest='recipients',
+                                help='Path to the RSA public key of a recipient (repeat it for several ones): the '
+                                'content is encrypted once, and its data key wrapped for each recipient.')
+        cli_parser.add_argument('--private-key', type=str, default=None,
+                                help='Path to an RSA private key file to read the "n", "e" and "d" params from.')
+        cli_parser.add_argument('--checksum', action='store_true',
+                                help='If true, always write the outputs in the header format, with a checksum '
+                                'of their content (so that they can be verified).')
+        cli_parser.add_argument('--output-encoding', type=str, default='raw', choices=OUTPUT_ENCODINGS,
+                                help='Encoding of the outputs: raw bytes, or text to transport them (detected '
+                                'when decoding).')
+        cli_parser.add_argument('--symlinks', type=str, default='follow', choices=SYMLINK_POLICIES,
+                                help='How the symbolic links of a dir are handled: follow, preserve (recreate '
+                                'them) or skip (hard links are always recreated).')
+        cli_parser.add_argument('--passthrough', action='store_true',
+                                help='If true, copy the excluded files (and the already encoded ones, when '
+                                'encoding) as is to the output instead of dropping them.')
+        cli_parser.add_argument('--kdf', type=str, default=None,
+                                help='Key derivation of the password: "pbkdf2:<iterations>" or "scrypt:<n>:<r>:<p>" '
+                                '(see the "calibrate" command), recorded in the output headers.')
+        cli_parser.add_argument('--read-rate', type=str, default=None,
+                                help='Maximum rate at which the inputs are read, per second (e.g. "50M").')
+        cli_parser.add_argument('--write-rate', type=str, default=None,
+                                help='Maximum rate at which the outputs are written, per second (e.g. "50M").')
+        cli_parser.add_argument('--cpu-limit', type=float, default=None,
+                                help='Maximum fraction of a CPU each process uses (e.g. 0.5).')
+        cli_parser.add_argument('--nice', type=int, default=None,
+                                help='Niceness of the processes.')
+        cli_parser.add_argument('--ionice', type=str, default=None,
+                                help='I/O scheduling class of the processes, with an optional level '
+                                '(e.g. "idle" or "best-effort:7").')
+        cli_parser.add_argument('--control-file', type=str, default=None,
+                                help='File to change the rate and CPU limits while processing ("read_rate=...", '
+                                '"write_rate=..." and "cpu_limit=..." lines, re-read every second or on SIGHUP).')
+        cli_parser.add_argument('--tar', action='store_true',
+                                help='If true, encode a dir into a tar stream (or decode a tar stream into a dir).')
+        cli_parser.add_argument('--work-dir', type=str, default=None,
+                                help='Shared work dir of a distributed dir processing (several processes, on '
+                                'one or many hosts, share the files through lease files in it).')
+        cli_parser.add_argument('--lease-ttl', type=float, default=LEASE_TTL,
+                                help='Duration of the leases of a distributed dir processing, in seconds.')
+        cli_parser.add_argument('--reset-work-dir', action='store_true',
+                                help='If true, remove the state of the previous run of the work dir first (to start a '
+                                'new distributed run in it).')
+        cli_parser.add_argument('--params-fd', type=int, default=None,
+                                help='File descriptor to read the params from ("name=value" lines).')
+
+        # rekey parser
+        rekey_parser = subparsers.add_parser('rekey')
+        rekey_parser.set_defaults(command='rekey')
+        rekey_parser.add_argument('-i', '--input', type=str, required=True,
+                                  help='Path to the encoded file or dir to rekey.')
+        rekey_parser.add_argument('--envelope', type=str, default='password', choices=ENVELOPE_KINDS,
+                                  help='Kind of envelope the data keys are wrapped with.')
+        rekey_parser.add_argument('--new-envelope', type=str, default=None, choices=ENVELOPE_KINDS,
+                                  help='Kind of envelope to wrap the data keys with (the same by default).')
+        rekey_parser.add_argument('--recipient', type=str, default=None, action='append', dest='recipients',
+                                  help='Path to the RSA public key of a recipient to wrap the data keys for '
+                                  '(repeat it for several ones).')
+        rekey_parser.add_argument('--private-key', type=str, default=None,
+                                  help='Path to the RSA private key to unwrap the data keys with.')
+        rekey_parser.add_argument('--exclude', type=str, default=[], nargs='+',
+                                  help='List of files or folders to ignore.')
+        rekey_parser.add_argument('--durability', type=str, default='none',
+                                  choices=DURABILITY_POLICIES,
+                                  help='Fsync policy for the rewritten headers.')
+        rekey_parser.add_argument('-v', '--verbose', action='store_true',
+                                  help='If true, print additional logs during process.')
+        rekey_parser.add_argument('--params-fd', type=int, default=None,
+                                  help='File descriptor to read the params from ("name=value" lines, '
+                                  'with a "new_" prefix for the new params).')
+
+        # verify parser
+        verify_parser = subparsers.add_parser('verify')
+        verify_parser.set_defaults(command='verify')
+        verify_parser.add_argument('-i', '--input', type=str, required=True,
+                                   help='Path to the encoded file or dir to verify.')
+        verify_parser.add_argument('-j', '--workers', type=int, default=1,
+                                   help='Number of threads to verify the files of a dir with.')
+        verify_parser.add_argument('--envelope', type=str, default=None, choices=ENVELOPE_KINDS,
+                                   help='If set, also check the wrapped data keys (with the password or RSA key).')
+        verify_parser.add_argument('--private-key', type=str, default=None,
+                                   help='Path to the RSA private key to check the wrapped data keys with.')
+        verify_parser.add_argument('--exclude', type=str, default=[], nargs='+',
+                                   help='List of files or folders to ignore.')
+        verify_parser.add_argument('-v', '--verbose', action='store_true',
+                                   help='If true, print the status of each file.')
+        verify_parser.add_argument('--params-fd', type=int, default=None,
+                                   help='File descriptor to read the params from ("name=value" lines).')
+
+        # watch parser
+        watch_parser = subparsers.add_parser('watch')
+        watch_parser.set_defaults(command='watch')
+        watch_parser.add_argument('-a', '--algo', type=str, required=True,
+                                  help='Reference of the algorithm to encode the files with.')
+        watch_parser.add_argument('-i', '--input', type=str, required=True,
+                                  help='Path to the dir to watch.')
+        watch_parser.add_argument('-o', '--output', type=str, required=True,
+                                  help='Path to the dir to write the encoded files to.')
+        watch_parser.add_argument('--settle', type=float, default=SETTLE_TIME,
+                                  help='Time without changes after which a file is encoded, in seconds.')
+        watch_parser.add_argument('--move-to', type=str, default=None,
+                                  help='If set, move the encoded files to this dir.')
+        watch_parser.add_argument('--delete', action='store_true',
+                                  help='If true, delete the encoded files.')
+        watch_parser.add_argument('--poll', action='store_true',
+                                  help='If true, scan the dir periodically instead of using inotify.')
+        watch_parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                                  help='Interval between two scans of the dir, if polling, in seconds.')
+        watch_parser.add_argument('--exclude', type=str, default=[], nargs='+',
+                                  help='List of files or folders to ignore.')
+        watch_parser.add_argument('--durability', type=str, default='none',
+                                  choices=DURABILITY_POLICIES,
+                                  help='Fsync policy for the outputs: none, file (each file) or batch (per directory).')
+        watch_parser.add_argument('-c', '--compression', type=str, default=None,
+                                  choices=CODECS,
+                                  help='Codec to compress the contents with before encoding them.')
+        watch_parser.add_argument('--envelope', type=str, default=None, choices=ENVELOPE_KINDS,
+                                  help='If set, encrypt each output under its own data key.')
+        watch_parser.add_argument('--recipient', type=str, default=None, action='append', dest='recipients',
+                                  help='Path to the RSA public key of a recipient to wrap the data keys for '
+                                  '(repeat it for several ones).')
+        watch_parser.add_argument('--checksum', action='store_true',
+                                  help='If true, write the outputs with a checksum of their content.')
+        watch_parser.add_argument('--output-encoding', type=str, default='raw', choices=OUTPUT_ENCODINGS,
+                                  help='Encoding of the outputs: raw bytes, or text to transport them.')
+        watch_parser.add_argument('-v', '--verbose', action='store_true',
+                                  help='If true, print a log for each file.')
+        watch_parser.add_argument('--params-fd', type=int, default=None,
+                                  help='File descriptor to read the params from ("name=value" lines).')
+
+        # calibrate parser
+        calibrate_parser = subparsers.add_parser('calibrate')
+        calibrate_parser.set_defaults(command='calibrate')
+        calibrate_parser.add_argument('--kdf', type=str, default='pbkdf2', choices=list(KDFS),
+                                      help='Key derivation function to calibrate.')
+        calibrate_parser.add_argument('--target', type=float, default=KDF_TARGET_TIME * 1000,
+                                      help='Time a key derivation should take on this machine, in milliseconds.')
+
+        # daemon parser
+        serve_parser = subparsers.add_parser('serve')
+        serve_parser.set_defaults(command='serve')
+        serve_parser.add_argument('-s', '--socket', type=str, default=None,
+                                  help='Path to the Unix domain socket to listen on.')
+        serve_parser.add_argument('-w', '--workers', type=int, default=4,
+                                  help='Maximum number of jobs to run concurrently.')
+        serve_parser.add_argument('--max-queue', type=int, default=1024,
+                                  help='Maximum number of pending jobs.')
+        serve_parser.add_argument('-v', '--verbose', action='store_true',
+                                  help='If true, print a log for each job.')
+
+        parsed_args = parser.parse_args()
+        if getattr(parsed_args, 'command', None) == 'serve':
+            serve(socket_path=parsed_args.socket,
+                  workers=parsed_args.workers,
+                  max_queue=parsed_args.max_queue,
+                  verbose=parsed_args.verbose)
+            return
+        if getattr(parsed_args, 'command', None) == 'rekey':
+            rekey(parsed_args)
+            return
+        if getattr(parsed_args, 'command', None) == 'verify':
+            verify(parsed_args)
+            return
+        if getattr(parsed_args, 'command', None) == 'watch':
+            watch(parsed_args)
+            return
+        if getattr(parsed_args, 'command', None) == 'calibrate':
+            kdf, elapsed = calibrate_kdf(parsed_args.kdf,
+                                         target=parsed_args.target / 1000)
+            print('Key derivation: {} ({:.0f}ms on this machine)'.format(
+                kdf, elapsed * 1000))
+            print('Use it with: --kdf {}'.format(kdf))
+            return
+        if not parsed_args.encode and not parsed_args.decode:
+            parser.error('one of the arguments -e/--encode -d/--decode is required')
+        args = parse_args(parsed_args)
     else:
         if 'config' in args:
             action = args['action']
@@ -461,12 +2508,9 @@ def main(return_args=False, **args):
                 '[Medusa - Error] Invalid argument: action should be "encode" or "decode".')
             return
 
-        if 'exclude' not in args:
-            args['exclude'] = []
-        if 'zip' not in args:
-            args['zip'] = False
-        if 'verbose' not in args:
-            args['verbose'] = False
+        for k, v in BASE_CONFIG.items():
+            if k not in args:
+                args[k] = copy(v)
 
     st = inspect.stack()
     if len(st) == 2:
@@ -476,41 +2520,90 @@ def main(return_args=False, **args):
         base_path = os.path.abspath(os.path.dirname(
             inspect.stack()[1].filename))
 
-    # display info
-    if args['verbose']:
-        log = ShellColors.BLUE + '-------------------------------------\n'
-        log += 'MEDUSA {}\n'.format(
-            'Encryption' if args['action'] == 'encode' else 'Decryption')
-        log += '-------------------------------------\n'
-        log += ShellColors.ENDC
-        log += 'Working on: {}\n'.format(args['input'])
-        log += 'Algorithm: {}\n'.format(args['algo'])
-        print(log)
-
-    # check for overwrite problems: if decoding, ask to overwrite already existing file
-    if args['action'] == 'decode':
-        # if there is already a file with the decoded name
-        if os.path.exists(args['output']):
-            q = input(ShellColors.YELLOW +
-                      'Overwrite existing data? (y/n) ' + ShellColors.ENDC)
-            # if overwriting allowed
-            if q != 'y':
-                print(ShellColors.RED +
-                      'No data overwriting. Process aborted.' + ShellColors.ENDC)
-                return
-
-    # get params
-    params = input_params(args['algo'], args['action'])
-    # encode
-    processor = Medusa(algo=args['algo'],
-                       params=params,
-                       exclude=args['exclude'],
-                       verbose=args['verbose'],
-                       base_path=base_path)
-    processor.process(args)
-
-    if args['verbose']:
-        print('-------------------------------------\n' + ShellColors.ENDC)
+    # when the output is the standard output, logs go to the standard error
+    stdout = sys.stdout
+    with redirect_stdout(sys.stderr if args['output'] == STREAM_PATH
+                         else sys.stdout):
+        # display info
+        if args['verbose']:
+            log = ShellColors.BLUE + '-------------------------------------\n'
+            log += 'MEDUSA {}\n'.format(
+                'Encryption' if args['action'] == 'encode' else 'Decryption')
+            log += '-------------------------------------\n'
+            log += ShellColors.ENDC
+            log += 'Working on: {}\n'.format(args['input'])
+            log += 'Algorithm: {}\n'.format(args['algo'])
+            print(log)
+
+        # check for overwrite problems: if decoding, ask to overwrite already existing file
+        # (not possible when the standard input holds the data)
+        if args['action'] == 'decode' and args['input'] != STREAM_PATH:
+            # if there is already a file with the decoded name
+            if os.path.exists(args['output']):
+                q = input(ShellColors.YELLOW +
+                          'Overwrite existing data? (y/n) ' + ShellColors.ENDC)
+                # if overwriting allowed
+                if q != 'y':
+                    print(ShellColors.RED +
+                          'No data overwriting. Process aborted.' + ShellColors.ENDC)
+                    return
+
+        # get params
+        recipients = args['recipients']
+        if isinstance(recipients, str):
+            recipients = recipients.split(',')
+        params = input_params(args['algo'], args['action'],
+                              params_fd=args['params_fd'],
+                              envelope=args['envelope'],
+                              private_key=args['private_key'],
+                              recipients=recipients)
+        # encode
+        processor = Medusa(algo=args['algo'],
+                           params=params,
+                           exclude=args['exclude'],
+                           verbose=args['verbose'],
+                           base_path=base_path,
+                           workers=args['workers'] or 1,
+                           durability=args['durability'],
+                           journal=args['journal'],
+                           dedup=args['dedup'],
+                           compression=args['compression'],
+                           compression_level=args['compression_level'],
+                           max_memory=args['max_memory'],
+                           chunk_size=parse_size(args['chunk_size'] or
+                                                 DEFAULT_CHUNK_SIZE),
+                           strategy=args['strategy'] or 'process',
+                           records=codecs.decode(args['records'], 'unicode_escape')
+                           if args['records'] is not None else None,
+                           envelope=args['envelope'],
+                           checksum=args['checksum'],
+                           symlinks=args['symlinks'],
+                           passthrough=args['passthrough'],
+                           read_rate=args['read_rate'],
+                           write_rate=args['write_rate'],
+                           cpu_limit=args['cpu_limit'],
+                           nice=args['nice'],
+                           ionice=args['ionice'],
+                           control_file=args['control_file'],
+                           kdf=args['kdf'],
+                           recipients=recipients
+                           if args['action'] == 'encode' else None,
+                           output_encoding=args['output_encoding'],
+                           pipelined=args['pipelined'])
+        if args['auto_tune']:
+            target = args['output'] if args['output'] != STREAM_PATH else '.'
+            processor.tune(target, workers=args['workers'],
+                           chunk_size=args['chunk_size'],
+                           strategy=args['strategy'],
+                           max_memory=args['max_memory'])
+        set_priority(nice=args['nice'], ionice=args['ionice'])
+        if processor.throttle is not None and args['control_file'] is not None:
+            signal.signal(signal.SIGHUP,
+                          lambda *_: processor.throttle.reload())
+        processor.process(args, stdout=stdout)
+
+        if args['verbose']:
+            print('-------------------------------------\n' + ShellColors.ENDC)
 
     if return_args:
         return args
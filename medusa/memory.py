@@ -0,0 +1,154 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import re
+import resource
+import sys
+import threading
+
+# estimated memory footprint of a processed byte: the input, the processed
+# output and the written copy
+IN_FLIGHT_FACTOR = 3
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+              'T': 1024 ** 4}
+
+
+def parse_size(value):
+    '''Parses a size in bytes, with an optional unit (e.g. "512M", "2G").
+
+    Parameters
+    ----------
+    value : str or int
+        Size to parse.
+
+    Returns
+    -------
+    int
+        Size in bytes.
+    '''
+    if isinstance(value, int):
+        return value
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', str(value),
+                     re.IGNORECASE)
+    if match is None:
+        raise ValueError('Invalid size: "{}"'.format(value))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size):
+    '''Formats a size in bytes for display (e.g. "1.5M").'''
+    for unit in ['', 'K', 'M', 'G']:
+        if size < 1024:
+            return '{:.1f}{}'.format(size, unit) if unit else '{}B'.format(size)
+        size /= 1024.
+    return '{:.1f}T'.format(size)
+
+
+def peak_rss():
+    '''Returns the peak resident memory of this process and of its (finished)
+    child processes, in bytes.'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + \
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # (kilobytes on Linux, bytes on macOS)
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class MemoryBudget(object):
+
+    def __init__(self, limit):
+        '''Budget of in-flight bytes shared by the concurrent processings: each
+        one acquires the memory it will hold before reading, and admission
+        blocks until enough memory is released (instead of running out of
+        memory).
+
+        Parameters
+        ----------
+        limit : int
+            Budget, in bytes.
+        '''
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def _take(self, size):
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+    def try_acquire(self, size):
+        '''Acquires some memory if it is available right away.
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes.
+
+        Returns
+        -------
+        bool
+            Whether or not the memory was acquired.
+        '''
+        with self._cond:
+            if self.used + size > self.limit:
+                return False
+            self._take(size)
+            return True
+
+    def acquire(self, size):
+        '''Acquires some memory, waiting for it to be available (a request
+        larger than the whole budget is reduced to the budget).
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes.
+
+        Returns
+        -------
+        int
+            Number of acquired bytes (to release).
+        '''
+        size = min(size, self.limit)
+        with self._cond:
+            while self.used + size > self.limit:
+                self._cond.wait()
+            self._take(size)
+        return size
+
+    def release(self, size):
+        '''Releases some acquired memory.
+
+        Parameters
+        ----------
+        size : int
+            Number of bytes.
+        '''
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
@@ -0,0 +1,147 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # (Python < 3.8: the segments are sent to the workers)
+    SharedMemory = None
+
+from .algorithms import ALGORITHMS
+
+
+def split_segments(size, workers, segment_size):
+    '''Splits a content into (start, end) segments of roughly equal sizes:
+    at least one per worker, and none larger than `segment_size`.
+
+    Parameters
+    ----------
+    size : int
+        Length of the content to split.
+    workers : int
+        Number of workers that will process the segments.
+    segment_size : int
+        Maximum length of a segment.
+
+    Returns
+    -------
+    list((int, int))
+        Segments boundaries.
+    '''
+    n_segments = max(workers, math.ceil(size / segment_size))
+    length = math.ceil(size / n_segments)
+    return [(start, min(start + length, size))
+            for start in range(0, size, length)]
+
+
+def _run_segment(algo_name, action, params, segment, offset):
+    algo = ALGORITHMS[algo_name]()
+    if action == 'encode':
+        return algo.encode_segment(segment, params, offset)
+    return algo.decode_segment(segment, params, offset)
+
+
+def _process_segment(algo_name, action, params, input_name, output_name,
+                     start, end, offset):
+    input_shm = SharedMemory(name=input_name)
+    output_shm = SharedMemory(name=output_name)
+    try:
+        segment = bytes(input_shm.buf[start:end]).decode('latin-1')
+        res = _run_segment(algo_name, action, params, segment,
+                           offset + start).encode('latin-1')
+        if len(res) != end - start:
+            raise ValueError('Algorithm "{}" does not preserve lengths.'
+                             .format(algo_name))
+        output_shm.buf[start:end] = res
+    finally:
+        input_shm.close()
+        output_shm.close()
+
+
+def process_segments(algo, content, params, action, workers, segment_size,
+                     offset=0):
+    '''Processes a large content by splitting it into segments that are
+    encoded or decoded in parallel worker processes. The content and the
+    result are exchanged through shared memory, and each worker starts its
+    segment with the algorithm state at this offset, so the result is the
+    same as with a sequential processing. (Without shared memory, before
+    Python 3.8, the segments are sent to the workers instead.)
+
+    Parameters
+    ----------
+    algo : Algorithm
+        Segmentable, length-preserving algorithm to use.
+    content : str
+        Content to process (with characters in the algorithm's alphabet).
+    params : dict
+        Processing context (already transformed).
+    action : str
+        Action to perform, can be: "encode" or "decode".
+    workers : int
+        Number of worker processes.
+    segment_size : int
+        Maximum length of a segment.
+    offset : int, optional
+        Position of the content in a larger stream (0 by default).
+
+    Returns
+    -------
+    str
+        Processed content.
+    '''
+    if SharedMemory is None:
+        segments = split_segments(len(content), workers, segment_size)
+        with ProcessPoolExecutor(max_workers=min(workers, len(segments))) as pool:
+            futures = [pool.submit(_run_segment, algo._name, action, params,
+                                   content[start:end], offset + start)
+                       for start, end in segments]
+            return ''.join(future.result() for future in futures)
+
+    data = content.encode('latin-1')
+    size = len(data)
+    input_shm = SharedMemory(create=True, size=max(1, size))
+    output_shm = SharedMemory(create=True, size=max(1, size))
+    try:
+        input_shm.buf[:size] = data
+        del data
+        segments = split_segments(size, workers, segment_size)
+        with ProcessPoolExecutor(max_workers=min(workers, len(segments))) as pool:
+            futures = [pool.submit(_process_segment, algo._name, action, params,
+                                   input_shm.name, output_shm.name, start, end,
+                                   offset)
+                       for start, end in segments]
+            for future in futures:
+                future.result()
+        return bytes(output_shm.buf[:size]).decode('latin-1')
+    finally:
+        input_shm.close()
+        input_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
@@ -0,0 +1,866 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import base64
+import binascii
+import bz2
+import hashlib
+import io
+import lzma
+import struct
+import zlib
+
+from .header import MAGIC, pack_header, read_header
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+# inputs that do not shrink below this ratio on the sample are not compressed
+COMPRESSION_THRESHOLD = 0.9
+
+CODECS = ['zlib', 'lzma', 'bz2']
+# the content of the header format is followed by its length and SHA-256, so
+# that its integrity can be checked without decoding it
+TRAILER = struct.Struct('>Q32s')
+
+# encodings of the outputs, applied once to the whole output (header
+# included): raw bytes, or text for transport
+OUTPUT_ENCODINGS = ['raw', 'base64', 'base85', 'hex']
+# (encode function, decode function, size of the groups of bytes encoded
+# independently, size of their encodings)
+_TEXT_ENCODINGS = {
+    'base64': (base64.b64encode, base64.b64decode, 3, 4),
+    'base85': (base64.b85encode, base64.b85decode, 4, 5),
+    'hex': (binascii.hexlify, binascii.unhexlify, 1, 2),
+}
+# beginnings of the headers in each encoding, to detect them
+ENCODED_MAGICS = dict(
+    [('raw', MAGIC)] +
+    [(name, encode(MAGIC[:len(MAGIC) // group * group]))
+     for name, (encode, _, group, _) in _TEXT_ENCODINGS.items()])
+# (whitespace is ignored in the encoded outputs, e.g. line breaks added by
+# a transport)
+_WHITESPACE = b' \t\r\n'
+
+
+class _NoCodec(object):
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class _Decompressor(object):
+
+    def __init__(self, decompressor):
+        self.decompressor = decompressor
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        if hasattr(self.decompressor, 'flush'):
+            return self.decompressor.flush()
+        if not self.decompressor.eof:
+            raise ValueError('Truncated compressed content.')
+        return b''
+
+
+def get_compressor(codec, level=None):
+    '''Creates an incremental compressor.
+
+    Parameters
+    ----------
+    codec : str
+        Compression codec: "zlib", "lzma", "bz2" (or None for no compression).
+    level : int, optional
+        Compression level (the codec's default if None).
+
+    Returns
+    -------
+    object
+        Compressor with `compress(data)` and `flush()` methods.
+    '''
+    if codec is None or codec == 'none':
+        return _NoCodec()
+    if codec == 'zlib':
+        return zlib.compressobj(-1 if level is None else level)
+    if codec == 'lzma':
+        return lzma.LZMACompressor(preset=level)
+    if codec == 'bz2':
+        return bz2.BZ2Compressor(9 if level is None else level)
+    raise ValueError('Unknown compression codec: "{}"'.format(codec))
+
+
+def get_decompressor(codec):
+    '''Creates an incremental decompressor (see `get_compressor`).
+
+    Returns
+    -------
+    object
+        Decompressor with `decompress(data)` and `flush()` methods.
+    '''
+    if codec is None or codec == 'none':
+        return _NoCodec()
+    if codec == 'zlib':
+        return _Decompressor(zlib.decompressobj())
+    if codec == 'lzma':
+        return _Decompressor(lzma.LZMADecompressor())
+    if codec == 'bz2':
+        return _Decompressor(bz2.BZ2Decompressor())
+    raise ValueError('Unknown compression codec: "{}"'.format(codec))
+
+
+def is_compressible(sample, codec, level=None):
+    '''Checks on a sample if a content is worth compressing.
+
+    Parameters
+    ----------
+    sample : bytes
+        Beginning of the content.
+    codec : str
+        Compression codec.
+    level : int, optional
+        Compression level.
+
+    Returns
+    -------
+    bool
+        Whether or not the sample shrinks enough.
+    '''
+    if len(sample) == 0:
+        return False
+    compressor = get_compressor(codec, level)
+    compressed = len(compressor.compress(sample)) + len(compressor.flush())
+    return compressed < COMPRESSION_THRESHOLD * len(sample)
+
+
+class _TextEncoder(object):
+
+    def __init__(self, encoding):
+        # incremental encoder: the bytes that do not fill a group are held
+        # back until the next write (or the end)
+        self._encode, _, self.group, _ = _TEXT_ENCODINGS[encoding]
+        self._pending = b''
+
+    def encode(self, data):
+        data = self._pending + data
+        n = len(data) - len(data) % self.group
+        self._pending = data[n:]
+        return self._encode(data[:n])
+
+    def flush(self):
+        data, self._pending = self._pending, b''
+        return self._encode(data) if len(data) > 0 else b''
+
+
+class _TextDecoder(object):
+
+    def __init__(self, encoding):
+        _, self._decode, _, self.group = _TEXT_ENCODINGS[encoding]
+        self._pending = b''
+
+    def decode(self, data):
+        data = self._pending + data.translate(None, _WHITESPACE)
+        n = len(data) - len(data) % self.group
+        self._pending = data[n:]
+        return self._decode(data[:n])
+
+    def flush(self):
+        data, self._pending = self._pending, b''
+        if len(data) == 0:
+            return b''
+        try:
+            return self._decode(data)
+        except ValueError:
+            raise ValueError('Truncated encoded content.')
+
+
+class _EncodingWriter(object):
+
+    def __init__(self, encoder, dst):
+        self.encoder = encoder
+        self.dst = dst
+
+    def write(self, data):
+        self.dst.write(self.encoder.encode(data))
+
+    def close(self):
+        self.dst.write(self.encoder.flush())
+
+
+class _DecodingReader(object):
+
+    def __init__(self, decoder, src):
+        # decodes a stream as it is read (with the reads and peeks needed to
+        # read headers)
+        self.decoder = decoder
+        self.src = src
+        self.buffer = bytearray()
+        self.eof = False
+
+    def _fill(self, size):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.src.read(DEFAULT_CHUNK_SIZE if size < 0
+                                  else max(size - len(self.buffer), 1) *
+                                  self.decoder.group)
+            if not chunk:
+                self.buffer += self.decoder.flush()
+                self.eof = True
+            else:
+                self.buffer += self.decoder.decode(chunk)
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0 or size > len(self.buffer):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def peek(self, size=1):
+        self._fill(size)
+        return bytes(self.buffer[:size])
+
+    def seekable(self):
+        return False
+
+
+def sniff_encoding(data):
+    '''Detects the encoding of an output from its beginning.
+
+    Parameters
+    ----------
+    data : bytes
+        Beginning of the output.
+
+    Returns
+    -------
+    str
+        Encoding of the output (see `OUTPUT_ENCODINGS`), or None if it has
+        no header.
+    '''
+    for name, magic in ENCODED_MAGICS.items():
+        if data[:len(magic)] == magic:
+            return name
+    return None
+
+
+def peek_encoding(f):
+    '''Detects the encoding of a stream (see `sniff_encoding`), without
+    consuming it.'''
+    return sniff_encoding(f.peek(max(len(m) for m in ENCODED_MAGICS.values())))
+
+
+def encoding_writer(dst, encoding):
+    '''Wraps a stream to write an output in an encoding (see
+    `OUTPUT_ENCODINGS`).
+
+    Parameters
+    ----------
+    dst : file-like
+        Stream to write the encoded output to.
+    encoding : str
+        Output encoding.
+
+    Returns
+    -------
+    file-like
+        Stream to write the output to (with a `close` method to call at its
+        end, that leaves `dst` open), or `dst` itself for raw outputs.
+    '''
+    if encoding is None or encoding == 'raw':
+        return dst
+    if encoding not in _TEXT_ENCODINGS:
+        raise ValueError('Unknown output encoding: "{}"'.format(encoding))
+    return _EncodingWriter(_TextEncoder(encoding), dst)
+
+
+def decoding_reader(src):
+    '''Wraps a stream to read an output in its encoding, detected from its
+    beginning (see `encoding_writer`).
+
+    Parameters
+    ----------
+    src : io.BufferedReader
+        Binary stream to read.
+
+    Returns
+    -------
+    io.BufferedReader or file-like
+        Stream to read the raw output from (`src` itself if it is raw), with
+        `read` and `peek` methods.
+    '''
+    encoding = peek_encoding(src)
+    if encoding is None or encoding == 'raw':
+        return src
+    return _DecodingReader(_TextDecoder(encoding), src)
+
+
+def armored_size(size, encoding=None):
+    '''Computes the size of a raw output of the given size once encoded (see
+    `OUTPUT_ENCODINGS`).'''
+    if encoding is None or encoding == 'raw':
+        return size
+    _, _, group, encoded_group = _TEXT_ENCODINGS[encoding]
+    if encoding == 'base85':
+        # (the last group is not padded)
+        rest = size % group
+        return size // group * encoded_group + (rest + 1 if rest else 0)
+    return (size + group - 1) // group * encoded_group
+
+
+def encoded_size(algo, size, level=None, header_size=None, meta=None,
+                 encoding='raw'):
+    '''Predicts the size of an uncompressed stream once encoded with a header
+    (segmentable algorithms keep the length of the content).
+
+    Parameters
+    ----------
+    algo : Algorithm
+        Algorithm to use.
+    size : int
+        Size of the content.
+    level : int, optional
+        Compression level (recorded in the header).
+    header_size : int, optional
+        Size the header is padded to (if any).
+    meta : dict, optional
+        Additional metadata recorded in the header (see `StreamEncoder`).
+    encoding : str, optional
+        Output encoding (see `OUTPUT_ENCODINGS`, "raw" by default).
+
+    Returns
+    -------
+    int
+        Size of the output (or None if it cannot be known before encoding).
+    '''
+    if not algo._segmentable:
+        return None
+    if header_size is None:
+        header_size = len(pack_header(dict(
+            meta or {}, algo=algo._name, checksum='sha256', codec=None,
+            level=level, encoding=encoding)))
+    return armored_size(header_size + size + TRAILER.size, encoding)
+
+
+def iter_chunks(f, chunk_size):
+    '''Reads a stream chunk by chunk (in one go if `chunk_size` is negative).'''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+        if chunk_size < 0:
+            return
+
+
+class _CipherStage(object):
+
+    def __init__(self, algo, process, dst, as_text):
+        # cipher stage: keeps track of the position in the stream (and buffers
+        # everything for algorithms that must process the content at once)
+        self.algo = algo
+        self.process = process
+        self.dst = dst
+        self.as_text = as_text
+        self.offset = 0
+        self._pending = [] if not algo._segmentable else None
+
+    def _run(self, data):
+        if self.as_text:
+            data = data.decode('latin-1')
+        res = self.process(data, self.offset)
+        self.offset += len(data)
+        if self.as_text:
+            res = res.encode('latin-1')
+        return res
+
+    def feed(self, data):
+        if len(data) == 0:
+            return
+        if self._pending is not None:
+            self._pending.append(data)
+            return
+        self.dst.write(self._run(data))
+
+    def close(self):
+        if self._pending is not None:
+            # (only binary algorithms cannot process segments)
+            self.dst.write(self._run(b''.join(self._pending)))
+
+
+class _DecompressingWriter(object):
+
+    def __init__(self, decompressor, dst):
+        self.decompressor = decompressor
+        self.dst = dst
+
+    def write(self, data):
+        self.dst.write(self.decompressor.decompress(data))
+
+
+class _ChecksumWriter(object):
+
+    def __init__(self, dst):
+        # hashes the content written to a stream, for its trailer
+        self.dst = dst
+        self.hash = hashlib.sha256()
+        self.length = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.length += len(data)
+        self.dst.write(data)
+
+    def trailer(self):
+        return TRAILER.pack(self.length, self.hash.digest())
+
+
+class _ChecksumReader(object):
+
+    def __init__(self, src):
+        # reads the content of a stream, holding back its trailer, and checks
+        # it once the whole content has been read
+        self.src = src
+        self.hash = hashlib.sha256()
+        self.length = 0
+        self.tail = b''
+        self.sequential = True
+
+    def read(self, size=-1):
+        while True:
+            chunk = self.src.read(size)
+            if not chunk:
+                return b''
+            if len(chunk) >= TRAILER.size:
+                data = self.tail + chunk[:-TRAILER.size]
+                self.tail = chunk[-TRAILER.size:]
+            else:
+                data = self.tail + chunk
+                self.tail = data[-TRAILER.size:]
+                data = data[:-TRAILER.size]
+            if len(data) > 0:
+                self.hash.update(data)
+                self.length += len(data)
+                return data
+
+    def seek(self, position):
+        # (the content is not checked if it is not read from its start)
+        self.src.seek(position)
+        self.tail = b''
+        self.sequential = False
+
+    def check(self):
+        if not self.sequential:
+            return
+        if len(self.tail) != TRAILER.size:
+            raise ValueError('Truncated Medusa content: missing trailer.')
+        length, digest = TRAILER.unpack(self.tail)
+        if length != self.length:
+            raise ValueError('Corrupted Medusa content: expected {} bytes, '
+                             'got {}.'.format(length, self.length))
+        if digest != self.hash.digest():
+            raise ValueError('Corrupted Medusa content: checksum mismatch.')
+
+
+def _hexlify_input(process):
+    # (the raw contents of algorithms that decode hexadecimal text, see
+    # `StreamEncoder`)
+    def _process(chunk, offset):
+        return process(binascii.hexlify(chunk), offset)
+    return _process
+
+
+class StreamEncoder(object):
+
+    def __init__(self, algo, process, dst, codec=None, level=None, meta=None,
+                 header_size=None, encoding='raw'):
+        '''Incremental encoder for the header format: the content is written
+        to it piece by piece (see `encode_stream`). With a codec, the
+        beginning of the content is held back until there is enough of it to
+        check if it is worth compressing.
+
+        Parameters
+        ----------
+        algo : Algorithm
+            Algorithm to use.
+        process : callable
+            Function to encode a chunk, given the chunk and its offset in the
+            (compressed) stream.
+        dst : file-like
+            Stream to write the output to.
+        codec : str, optional
+            Compression codec, or None for no compression.
+        level : int, optional
+            Compression level.
+        meta : dict, optional
+            Additional metadata to record in the header (e.g. a wrapped data
+            key, see `envelope`).
+        header_size : int, optional
+            Size to pad the header to (see `pack_header`).
+        encoding : str, optional
+            Encoding of the output (see `OUTPUT_ENCODINGS`, "raw" by
+            default). It is recorded in the header.
+        '''
+        self.algo = algo
+        self.process = process
+        self.encoding = encoding
+        self.dst = encoding_writer(dst, encoding)
+        self._closes_dst = self.dst is not dst
+        self.codec = codec
+        self.level = level
+        self.meta = meta or {}
+        self.header_size = header_size
+        self.compressor = None
+        self.stage = None
+        self._sample = bytearray()
+        if codec is None:
+            self._start()
+
+    def _start(self):
+        if self.codec is not None and not is_compressible(
+                bytes(self._sample[:COMPRESSION_SAMPLE_SIZE]), self.codec,
+                self.level):
+            self.codec = None
+        self.dst.write(pack_header(dict(self.meta, algo=self.algo._name,
+                                        checksum='sha256', codec=self.codec,
+                                        level=self.level,
+                                        encoding=self.encoding),
+                                   size=self.header_size))
+        self.compressor = get_compressor(self.codec, self.level)
+        self.out = _ChecksumWriter(self.dst)
+        process = self.process
+        if self.algo._hexlified:
+            # (hexadecimal contents are stored as raw bytes)
+            def process(chunk, offset):
+                return binascii.unhexlify(self.process(chunk, offset))
+        self.stage = _CipherStage(self.algo, process, self.out,
+                                  as_text=not self.algo._binary)
+        sample, self._sample = self._sample, None
+        if len(sample) > 0:
+            self.stage.feed(self.compressor.compress(bytes(sample)))
+
+    def write(self, data):
+        '''Encodes a piece of content.
+
+        Parameters
+        ----------
+        data : bytes
+            Content to encode.
+        '''
+        if self.stage is None:
+            self._sample += data
+            if len(self._sample) >= COMPRESSION_SAMPLE_SIZE:
+                self._start()
+            return
+        self.stage.feed(self.compressor.compress(data))
+
+    def close(self):
+        '''Encodes the end of the content.'''
+        if self.stage is None:
+            self._start()
+        self.stage.feed(self.compressor.flush())
+        self.stage.close()
+        self.dst.write(self.out.trailer())
+        if self._closes_dst:
+            self.dst.close()
+
+
+class _Buffer(bytearray):
+
+    def write(self, data):
+        self.extend(data)
+
+
+class StreamDecoder(object):
+
+    def __init__(self, algo, process, src, chunk_size=DEFAULT_CHUNK_SIZE,
+                 on_header=None):
+        '''Incremental decoder for the header format, that decodes the content
+        as it is read (see `decode_stream`). Uncompressed contents of
+        segmentable algorithms can be read from any position.
+
+        Parameters
+        ----------
+        algo : Algorithm
+            Algorithm to use.
+        process : callable
+            Function to decode a chunk, given the chunk and its offset in the
+            stream.
+        src : io.BufferedReader
+            Binary stream to decode (positioned at its header).
+        chunk_size : int, optional
+            Size of the chunks to read.
+        on_header : callable, optional
+            Function called with the metadata of the header before decoding
+            (e.g. to unwrap a data key).
+        '''
+        src = decoding_reader(src)
+        meta = read_header(src)
+        if meta is None:
+            raise ValueError('Content has no Medusa header.')
+        if meta['algo'] != algo._name:
+            raise ValueError('Content was encoded with algorithm "{}".'.format(
+                meta['algo']))
+        if on_header is not None:
+            on_header(meta)
+        if algo._hexlified and 'encoding' in meta:
+            process = _hexlify_input(process)
+        self.src = src
+        # (outputs of older versions have no trailer)
+        self.checked = meta.get('checksum') is not None
+        self.reader = _ChecksumReader(src) if self.checked else src
+        self.chunk_size = chunk_size if algo._segmentable else -1
+        self.codec = meta.get('codec')
+        self.start = src.tell() if src.seekable() else None
+        self.seekable = algo._segmentable and self.codec is None \
+            and self.start is not None
+        self.buffer = _Buffer()
+        self.decompressor = get_decompressor(self.codec)
+        self.stage = _CipherStage(
+            algo, process, _DecompressingWriter(self.decompressor, self.buffer),
+            as_text=not algo._binary)
+        self.position = 0
+        self.eof = False
+
+    def read(self, size=-1):
+        '''Reads and decodes some content.
+
+        Parameters
+        ----------
+        size : int, optional
+            Maximum number of bytes to return (everything if negative).
+
+        Returns
+        -------
+        bytes
+            Decoded content (empty at the end of the stream).
+        '''
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.reader.read(self.chunk_size)
+            if chunk:
+                self.stage.feed(chunk)
+                continue
+            if self.checked:
+                self.reader.check()
+            self.stage.close()
+            self.buffer.write(self.decompressor.flush())
+            self.eof = True
+        if size < 0 or size > len(self.buffer):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.position += size
+        return data
+
+    def seek(self, position):
+        '''Moves to a position in the decoded content (only if `seekable`).
+
+        Parameters
+        ----------
+        position : int
+            New position, from the start of the content.
+        '''
+        if not self.seekable:
+            raise io.UnsupportedOperation('Content cannot be read from any position.')
+        self.reader.seek(self.start + position)
+        self.stage.offset = position
+        self.position = position
+        del self.buffer[:]
+        self.eof = False
+
+    def size(self):
+        '''Returns the size of the decoded content (only if `seekable`).'''
+        if not self.seekable:
+            raise io.UnsupportedOperation('Content size is unknown.')
+        current = self.src.tell()
+        end = self.src.seek(0, io.SEEK_END)
+        self.src.seek(current)
+        return end - self.start - (TRAILER.size if self.checked else 0)
+
+
+def encode_stream(algo, process, src, dst, chunk_size=DEFAULT_CHUNK_SIZE,
+                  header=False, codec=None, level=None, meta=None,
+                  header_size=None, encoding='raw'):
+    '''Encodes a stream chunk by chunk.
+
+    Without header, the output is the same as encoding the whole content at
+    once (text for the Caesar/Vigenere ciphers). With a header, the output is
+    binary and starts with the metadata needed to decode it; the content can
+    then be compressed before encryption, and the whole output written in a
+    text encoding.
+
+    Parameters
+    ----------
+    algo : Algorithm
+        Algorithm to use.
+    process : callable
+        Function to encode a chunk, given the chunk and its offset in the
+        (compressed) stream.
+    src : io.BufferedReader
+        Binary stream to encode.
+    dst : file-like
+        Stream to write the output to.
+    chunk_size : int, optional
+        Size of the chunks to read.
+    header : bool, optional
+        Whether or not to write a header (false by default).
+    codec : str, optional
+        Compression codec (only with a header), or None for no compression.
+    level : int, optional
+        Compression level.
+    meta : dict, optional
+        Additional metadata to record in the header (see `StreamEncoder`).
+    header_size : int, optional
+        Size to pad the header to.
+    encoding : str, optional
+        Encoding of the output (see `OUTPUT_ENCODINGS`, "raw" by default),
+        with a header (text encodings always have one).
+    '''
+    if not algo._segmentable:
+        chunk_size = -1
+
+    if not header and encoding in [None, 'raw']:
+        if not algo._binary:
+            src = io.TextIOWrapper(src, newline='')
+        stage = _CipherStage(algo, process, dst, as_text=False)
+        try:
+            for chunk in iter_chunks(src, chunk_size):
+                stage.feed(chunk)
+            stage.close()
+        finally:
+            if not algo._binary:
+                src.detach()
+        return
+
+    encoder = StreamEncoder(algo, process, dst, codec=codec, level=level,
+                            meta=meta, header_size=header_size,
+                            encoding=encoding)
+    for chunk in iter_chunks(src, chunk_size):
+        encoder.write(chunk)
+    encoder.close()
+
+
+def decode_stream(algo, process, src, dst, chunk_size=DEFAULT_CHUNK_SIZE,
+                  on_header=None):
+    '''Decodes a stream chunk by chunk (see `encode_stream`): the header, if
+    there is one, tells how to decode the content.
+
+    Parameters
+    ----------
+    algo : Algorithm
+        Algorithm to use.
+    process : callable
+        Function to decode a chunk, given the chunk and its offset in the
+        stream.
+    src : io.BufferedReader
+        Binary stream to decode.
+    dst : file-like
+        Stream to write the output to.
+    chunk_size : int, optional
+        Size of the chunks to read.
+    on_header : callable, optional
+        Function called with the metadata of the header, if there is one,
+        before decoding (see `StreamDecoder`).
+    '''
+    if not algo._segmentable:
+        chunk_size = -1
+
+    src = decoding_reader(src)
+    meta = read_header(src)
+    if meta is None:
+        if not algo._binary:
+            src = io.TextIOWrapper(src, newline='')
+        stage = _CipherStage(algo, process, dst, as_text=False)
+        try:
+            for chunk in iter_chunks(src, chunk_size):
+                stage.feed(chunk)
+            stage.close()
+        finally:
+            if not algo._binary:
+                src.detach()
+        return
+
+    if meta['algo'] != algo._name:
+        raise ValueError('Content was encoded with algorithm "{}".'.format(
+            meta['algo']))
+    if on_header is not None:
+        on_header(meta)
+    if algo._hexlified and 'encoding' in meta:
+        process = _hexlify_input(process)
+    reader = _ChecksumReader(src) if meta.get('checksum') else src
+    decompressor = get_decompressor(meta.get('codec'))
+    stage = _CipherStage(algo, process, _DecompressingWriter(decompressor, dst),
+                         as_text=not algo._binary)
+    for chunk in iter_chunks(reader, chunk_size):
+        stage.feed(chunk)
+    if reader is not src:
+        reader.check()
+    stage.close()
+    dst.write(decompressor.flush())
+
+
+def verify_stream(src, chunk_size=DEFAULT_CHUNK_SIZE, on_header=None):
+    '''Checks the integrity of an encoded stream without decoding it: its
+    header, and the length and SHA-256 of its content (from its trailer). The
+    content is only read and hashed, so the check goes at the speed of the
+    reads.
+
+    Parameters
+    ----------
+    src : io.BufferedReader
+        Binary stream to check.
+    chunk_size : int, optional
+        Size of the chunks to read.
+    on_header : callable, optional
+        Function called with the metadata of the header (e.g. to check a
+        wrapped data key).
+
+    Returns
+    -------
+    dict
+        Metadata of the header (or None if the stream has no header). The
+        content was checked if it has a "checksum" entry.
+    '''
+    src = decoding_reader(src)
+    meta = read_header(src)
+    if meta is None:
+        return None
+    if on_header is not None:
+        on_header(meta)
+    if meta.get('checksum') is not None:
+        reader = _ChecksumReader(src)
+        for _ in iter_chunks(reader, chunk_size):
+            pass
+        reader.check()
+    return meta
@@ -0,0 +1,238 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import sys
+from array import array
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'MEDUSA-IDX 1\n'
+# (offsets are stored as little-endian unsigned 64-bits integers)
+OFFSET_SIZE = 8
+INDEX_BATCH = 4096
+# maximum size of a record (the data read without finding a delimiter is kept
+# in memory until there is one)
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+
+
+def index_path(path):
+    '''Gets the path of the sidecar index of a record file.'''
+    return path + INDEX_SUFFIX
+
+
+def split_records(data, delimiter):
+    '''Splits some data into records: each record keeps its delimiter, so
+    that the records put back together give the data (the last record may
+    have no delimiter).
+
+    Parameters
+    ----------
+    data : bytes
+        Data to split.
+    delimiter : bytes
+        End of a record.
+
+    Returns
+    -------
+    list(bytes)
+        Records.
+    '''
+    records = data.split(delimiter)
+    last = records.pop()
+    records = [r + delimiter for r in records]
+    if len(last) > 0:
+        records.append(last)
+    return records
+
+
+def iter_record_batches(f, delimiter, batch_size, max_record_size=None):
+    '''Reads a stream by batches of whole records (of about `batch_size`
+    bytes, unless a record is longer).
+
+    Parameters
+    ----------
+    f : io.BufferedReader
+        Binary stream to read.
+    delimiter : bytes
+        End of a record.
+    batch_size : int
+        Size of the chunks to read.
+    max_record_size : int, optional
+        Maximum size of a record (`MAX_RECORD_SIZE` by default): a longer
+        one raises a ValueError.
+
+    Yields
+    ------
+    list(bytes)
+        Batch of records.
+    '''
+    if max_record_size is None:
+        max_record_size = MAX_RECORD_SIZE
+    pending = bytearray()
+    while True:
+        chunk = f.read(batch_size)
+        if not chunk:
+            if len(pending) > 0:
+                yield [bytes(pending)]
+            return
+        # (only the new data is searched, with the end of the pending one
+        # since the delimiter may be cut between two chunks, so that a long
+        # record is not searched again for each chunk)
+        start = max(0, len(pending) - len(delimiter) + 1)
+        pending += chunk
+        end = pending.rfind(delimiter, start)
+        if end < 0:
+            if len(pending) > max_record_size:
+                raise ValueError('Record longer than {} bytes (missing '
+                                 'delimiter?).'.format(max_record_size))
+            continue
+        end += len(delimiter)
+        records = split_records(bytes(pending[:end]), delimiter)
+        del pending[:end]
+        yield records
+
+
+def _to_bytes(offsets):
+    if sys.byteorder == 'big':
+        offsets = array('Q', offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def write_index(f, offsets):
+    '''Writes a record index: the offsets of the records in the encoded file,
+    followed by its size.
+
+    Parameters
+    ----------
+    f : file-like
+        Stream to write the index to.
+    offsets : array.array
+        Offsets ("Q" array), starting with 0 and ending with the size of the
+        encoded file.
+    '''
+    f.write(INDEX_MAGIC)
+    f.write(_to_bytes(offsets))
+
+
+def count_records(path):
+    '''Gets the number of records of an index.
+
+    Parameters
+    ----------
+    path : str
+        Path to the index.
+
+    Returns
+    -------
+    int
+        Number of records.
+    '''
+    with open(path, 'rb') as FILE:
+        if FILE.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError('Invalid record index: "{}"'.format(path))
+        size = FILE.seek(0, 2) - len(INDEX_MAGIC)
+    return size // OFFSET_SIZE - 1
+
+
+def read_offsets(path, start, stop):
+    '''Reads the offsets of some records from an index, without loading the
+    rest of it.
+
+    Parameters
+    ----------
+    path : str
+        Path to the index.
+    start : int
+        Index of the first record.
+    stop : int
+        Index after the last record.
+
+    Returns
+    -------
+    array.array
+        Offsets of the records `start` to `stop` (included, i.e. the first
+        one is the start of record `start` and the last one is the end of
+        record `stop - 1`).
+    '''
+    if start < 0 or stop < start:
+        raise IndexError('Invalid record range: [{}, {})'.format(start, stop))
+    with open(path, 'rb') as FILE:
+        if FILE.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError('Invalid record index: "{}"'.format(path))
+        FILE.seek(len(INDEX_MAGIC) + start * OFFSET_SIZE)
+        data = FILE.read((stop - start + 1) * OFFSET_SIZE)
+    if len(data) != (stop - start + 1) * OFFSET_SIZE:
+        raise IndexError('Record range out of the index: [{}, {})'.format(
+            start, stop))
+    offsets = array('Q')
+    offsets.frombytes(data)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
+
+def iter_index_batches(path, batch_records=INDEX_BATCH):
+    '''Reads an index by batches of records.
+
+    Parameters
+    ----------
+    path : str
+        Path to the index.
+    batch_records : int, optional
+        Number of records per batch.
+
+    Yields
+    ------
+    array.array
+        Offsets of a batch (see `read_offsets`).
+    '''
+    n_records = count_records(path)
+    for start in range(0, n_records, batch_records):
+        yield read_offsets(path, start, min(n_records, start + batch_records))
+
+
+def check_index(path, size):
+    '''Checks that an index is consistent with its record file: its offsets
+    start at 0, never decrease and end at the size of the file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the index.
+    size : int
+        Size of the record file.
+    '''
+    last = 0
+    for offsets in iter_index_batches(path):
+        if offsets[0] != last or any(
+                offsets[i] > offsets[i + 1] for i in range(len(offsets) - 1)):
+            raise ValueError('Corrupted record index: invalid offsets.')
+        last = offsets[-1]
+    if last != size:
+        raise ValueError('Corrupted record file: expected {} bytes, got {}.'
+                         .format(last, size))
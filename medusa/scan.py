@@ -0,0 +1,159 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import os
+import shutil
+import stat
+
+# how symbolic links are handled when scanning a directory: followed (their
+# target is processed as if it were in the directory), preserved (recreated
+# as is in the output) or skipped
+SYMLINK_POLICIES = ['follow', 'preserve', 'skip']
+
+
+def scan_dir(input_path, exclude=[], on_ignore=None, symlinks='follow',
+             on_link=None):
+    '''Lists the contents to process in a directory, recursively. Hidden files
+    and folders, and those listed in `exclude`, are ignored.
+
+    Each file or folder is identified by its device and inode, so that it is
+    only listed once: the other hard links of a listed file, and the other
+    paths to a listed folder, are reported as links to recreate instead. The
+    symbolic links that lead within the directory (including the symbolic
+    link loops) are always reported as relative links.
+
+    Parameters
+    ----------
+    input_path : str
+        Absolute path to the directory to scan.
+    exclude : list(str), optional
+        Names of the files or folders to ignore (empty list by default).
+    on_ignore : callable, optional
+        Function called with the relative path of each ignored file or folder.
+    symlinks : str, optional
+        How symbolic links are handled: "follow", "preserve" or "skip" (see
+        `SYMLINK_POLICIES`) ("follow" by default). Broken links are preserved
+        unless skipped.
+    on_link : callable, optional
+        Function called with the relative path, the kind ("hardlink" or
+        "symlink") and the target of each link to recreate (see
+        `create_link`); if None, the links are simply not listed.
+
+    Returns
+    -------
+    (list(str), list(str))
+        Relative paths of the subdirectories and of the files to process
+        (depth-first, sorted by name).
+    '''
+    def _link(rel_path, kind, target):
+        if on_link is not None:
+            on_link(rel_path, kind, target)
+
+    root = os.path.realpath(input_path)
+    st = os.stat(input_path)
+    seen = {(st.st_dev, st.st_ino): ''}
+    dirs, files = [], []
+    stack = ['']
+    while len(stack) > 0:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(input_path, rel_dir)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name)
+            if entry.name.startswith('.') or entry.name in exclude \
+                    or (entry.is_symlink() and symlinks == 'skip'):
+                if on_ignore is not None:
+                    on_ignore(rel_path)
+                continue
+            if entry.is_symlink() and symlinks == 'preserve':
+                _link(rel_path, 'symlink', os.readlink(entry.path))
+                continue
+            if entry.is_symlink():
+                # (the links within the directory are kept as relative links,
+                # their targets are processed on their own)
+                target = os.path.realpath(entry.path)
+                if target == root or target.startswith(root + os.sep):
+                    _link(rel_path, 'symlink', os.path.relpath(
+                        target, os.path.realpath(os.path.dirname(entry.path))))
+                    continue
+            try:
+                st = entry.stat()
+            except OSError:
+                _link(rel_path, 'symlink', os.readlink(entry.path))
+                continue
+
+            key = (st.st_dev, st.st_ino)
+            if key in seen:
+                if stat.S_ISDIR(st.st_mode):
+                    _link(rel_path, 'symlink', os.path.relpath(
+                        seen[key] or os.curdir, rel_dir or os.curdir))
+                else:
+                    _link(rel_path, 'hardlink', seen[key])
+                continue
+            seen[key] = rel_path
+            if stat.S_ISDIR(st.st_mode):
+                dirs.append(rel_path)
+                subdirs.append(rel_path)
+            else:
+                files.append(rel_path)
+        # (reversed so that subdirectories are popped in name order)
+        stack.extend(reversed(subdirs))
+    return dirs, files
+
+
+def create_link(root, rel_path, kind, target):
+    '''Creates (or replaces) a link in a processed directory.
+
+    Parameters
+    ----------
+    root : str
+        Absolute path to the processed directory.
+    rel_path : str
+        Relative path of the link.
+    kind : str
+        Kind of link: "hardlink" (to the `target` file, relative to the
+        directory; copied if it cannot be linked) or "symlink" (with `target`
+        as is).
+    target : str
+        Target of the link.
+    '''
+    path = os.path.join(root, rel_path)
+    tmp_path = os.path.join(os.path.dirname(path),
+                            '.{}.link'.format(os.path.basename(path)))
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    if kind == 'symlink':
+        os.symlink(target, tmp_path)
+    else:
+        try:
+            os.link(os.path.join(root, target), tmp_path)
+        except OSError:
+            shutil.copyfile(os.path.join(root, target), tmp_path)
+    # (atomically, like the other outputs)
+    os.replace(tmp_path, path)
@@ -0,0 +1,444 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import os
+import threading
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from .dedup import CHUNKS_DIR, ChunkStore
+from .journal import file_digest
+from .parallel import split_segments
+from .pipeline import peek_encoding
+from .throttle import set_priority
+from .writers import OutputWriter, create_temp_file, fsync_dir
+
+# files smaller than this are batched together (up to this total size, and
+# `BATCH_FILES` files) to amortize the dispatch of the tasks
+BATCH_SIZE = 1024 * 1024
+BATCH_FILES = 64
+# files larger than this are split into segments processed in parallel (for
+# the algorithms that allow it)
+SPLIT_SIZE = 64 * 1024 * 1024
+# how the tasks are run: in worker processes, or in threads sharing the
+# processor (only useful for algorithms that release the GIL)
+STRATEGIES = ['process', 'thread']
+
+
+class Task(object):
+
+    def __init__(self, files, size, start=None, end=None):
+        '''Unit of work of a directory run: either a batch of whole files, or
+        a (start, end) byte range of a single large file.
+
+        Parameters
+        ----------
+        files : list(str)
+            Relative paths of the files to process.
+        size : int
+            Number of bytes to process.
+        start : int, optional
+            Start of the range, for a segment task.
+        end : int, optional
+            End of the range, for a segment task.
+        '''
+        self.files = files
+        self.size = size
+        self.start = start
+        self.end = end
+        self.tmp_path = None
+
+    @property
+    def is_segment(self):
+        return self.start is not None
+
+
+def plan_tasks(files, sizes, workers, segment_size, splittable=None,
+               batch_size=BATCH_SIZE, batch_files=BATCH_FILES,
+               split_size=SPLIT_SIZE):
+    '''Groups the files of a directory run into tasks, largest first, so that
+    the big files do not end up alone at the end of the run: small files are
+    batched, and the files above `split_size` that can be split are cut into
+    segments.
+
+    Parameters
+    ----------
+    files : list(str)
+        Relative paths of the files.
+    sizes : dict(str, int)
+        Size of each file.
+    workers : int
+        Number of workers.
+    segment_size : int
+        Maximum size of a segment.
+    splittable : callable, optional
+        Function that tells if a file can be split (no file is split if None).
+    batch_size : int, optional
+        Size below which files are batched, and maximum size of a batch.
+    batch_files : int, optional
+        Maximum number of files in a batch.
+    split_size : int, optional
+        Size above which files are split.
+
+    Returns
+    -------
+    list(Task)
+        Tasks, by decreasing size.
+    '''
+    tasks = []
+    batch, batch_bytes = [], 0
+    for f in sorted(files, key=lambda f: (-sizes[f], f)):
+        size = sizes[f]
+        if size > split_size and splittable is not None and splittable(f):
+            tasks.extend(Task([f], end - start, start=start, end=end)
+                         for start, end in split_segments(size, workers,
+                                                          segment_size))
+        elif size >= batch_size:
+            tasks.append(Task([f], size))
+        else:
+            batch.append(f)
+            batch_bytes += size
+            if batch_bytes >= batch_size or len(batch) >= batch_files:
+                tasks.append(Task(batch, batch_bytes))
+                batch, batch_bytes = [], 0
+    if len(batch) > 0:
+        tasks.append(Task(batch, batch_bytes))
+    # (stable sort: the segments of a file stay in order)
+    tasks.sort(key=lambda t: -t.size)
+    return tasks
+
+
+class RunStats(object):
+
+    def __init__(self, workers):
+        '''Statistics of a scheduled directory run: one record per task, and a
+        summary with the achieved utilization of the workers.
+
+        Parameters
+        ----------
+        workers : int
+            Number of workers.
+        '''
+        self.workers = workers
+        self.tasks = []
+        self.start = None
+        self.end = None
+
+    def add(self, record):
+        '''Adds the record of a completed task (a dict with its "files",
+        "bytes", "start", "end" and worker "pid").'''
+        self.tasks.append(record)
+
+    def summary(self):
+        '''Summarizes the run.
+
+        Returns
+        -------
+        dict
+            Number of tasks, bytes, wall and busy times (in seconds) and
+            utilization of the workers (busy time over the available time).
+        '''
+        wall = (self.end or time.time()) - (self.start or time.time())
+        busy = sum(t['end'] - t['start'] for t in self.tasks)
+        return {
+            'tasks': len(self.tasks),
+            'bytes': sum(t['bytes'] for t in self.tasks),
+            'wall_time': wall,
+            'busy_time': busy,
+            'utilization': busy / (wall * self.workers) if wall > 0 else 0.,
+        }
+
+
+# per-process state of the worker processes, and per-thread chunk stores
+_WORKER = {}
+_LOCAL = threading.local()
+
+
+def _init_worker(algo, params, options, share=1):
+    from .medusa import Medusa
+    processor = Medusa(algo=algo, params=params, base_path='/',
+                       exit_on_error=False, workers=1, **options)
+    # (the rates of the control file are split between the workers)
+    if processor.throttle is not None:
+        processor.throttle.share = share
+        processor.throttle.reload()
+    set_priority(nice=processor.nice, ionice=processor.ionice)
+    _WORKER['processor'] = processor
+
+
+def _get_store(processor, root, durability):
+    stores = getattr(_LOCAL, 'stores', None)
+    if stores is None:
+        stores = _LOCAL.stores = {}
+    if (id(processor), root) not in stores:
+        stores[(id(processor), root)] = ChunkStore(root, processor.algo,
+                                                   durability=durability)
+    return stores[(id(processor), root)]
+
+
+def _run_task(task, input_path, output_path, action, store_root, kwargs,
+              processor=None):
+    # (worker threads share the processor of the run)
+    owned = processor is None
+    if owned:
+        processor = _WORKER['processor']
+    start = time.time()
+    throttle = processor.throttle if owned else None
+    counts = throttle.counts() if throttle is not None else None
+    committed = []
+    if task.is_segment:
+        _process_range(processor, os.path.join(input_path, task.files[0]),
+                       task.tmp_path, task.start, task.end, action, kwargs)
+    else:
+        writer = OutputWriter(
+            durability=processor.writer.durability,
+            on_commit=lambda path, digest: committed.append(
+                (os.path.relpath(path, output_path), digest)))
+        store = None
+        if store_root is not None:
+            store = _get_store(processor, store_root, writer.durability)
+        last_dir = None
+        for f in task.files:
+            opath = os.path.join(output_path, f)
+            if os.path.dirname(opath) != last_dir and last_dir is not None:
+                if store is not None:
+                    store.flush()
+                writer.flush(last_dir)
+            last_dir = os.path.dirname(opath)
+            processor.process_file(os.path.join(input_path, f), opath, action,
+                                   commit=False, store=store, writer=writer,
+                                   **kwargs)
+        if store is not None:
+            store.flush()
+        writer.flush()
+    record = {'files': list(task.files), 'bytes': task.size, 'start': start,
+              'end': time.time(), 'pid': os.getpid(),
+              'thread': threading.current_thread().name,
+              'committed': committed}
+    # (the bytes moved by a worker process are reported to the run)
+    if throttle is not None:
+        record['io'] = {k: v - counts[k] for k, v in throttle.counts().items()}
+    return record
+
+
+def _process_range(processor, input_path, tmp_path, start, end, action,
+                   kwargs):
+    # (only for raw outputs of length-preserving binary algorithms: the range
+    # is at the same position in the input and in the output)
+    params = processor._get_params(action, **kwargs)
+    fd = os.open(tmp_path, os.O_WRONLY)
+    try:
+        with open(input_path, 'rb') as FILE_READ:
+            FILE_READ.seek(start)
+            position = start
+            while position < end:
+                chunk = FILE_READ.read(min(processor.chunk_size, end - position))
+                if not chunk:
+                    raise IOError('File changed while processing: "{}"'
+                                  .format(input_path))
+                res = processor._process_chunk(chunk, params, action,
+                                               offset=position)
+                if processor.throttle is not None:
+                    processor.throttle.read(len(chunk))
+                    processor.throttle.write(len(res))
+                    processor.throttle.tick()
+                view = memoryview(res)
+                while len(view) > 0:
+                    n = os.pwrite(fd, view, position)
+                    view = view[n:]
+                    position += n
+        if processor.writer.durability != 'none':
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def can_split(processor, action, input_path):
+    '''Returns a function that tells if a file of a directory run can be split
+    into segments: only raw (headerless) contents of length-preserving
+    segmentable binary algorithms (AES-CTR) can.'''
+    algo = processor.algo
+    if not (algo._binary and algo._segmentable) or processor.compression \
+            or processor.dedup or processor.records is not None \
+            or processor.envelope is not None or processor.checksum \
+            or processor.kdf is not None \
+            or processor.output_encoding != 'raw':
+        return None
+
+    def _splittable(f):
+        # (the inputs to pass through are copied as files)
+        if action == 'encode' and not processor.passthrough:
+            return True
+        with open(os.path.join(input_path, f), 'rb') as FILE:
+            return peek_encoding(FILE) is None
+    return _splittable
+
+
+def schedule_files(processor, input_path, output_path, files, action, kwargs,
+                   on_commit=None, stats=None, progress=None):
+    '''Processes the files of a directory run with a pool of worker
+    processes (or threads, depending on the strategy of the processor),
+    largest tasks first (see `plan_tasks`).
+
+    Parameters
+    ----------
+    processor : Medusa
+        Processor of the run (its settings are replicated in the workers).
+    input_path : str
+        Absolute path to the original directory.
+    output_path : str
+        Absolute path to the new processed directory.
+    files : list(str)
+        Relative paths of the files to process.
+    action : str
+        Action to perform, can be: "encode" or "decode".
+    kwargs : dict
+        Additional processing params (with the context of the run).
+    on_commit : callable, optional
+        Function called with the relative path and the digest of each output
+        once it is in place.
+    stats : RunStats, optional
+        Statistics to fill.
+    progress : tqdm, optional
+        Progress bar to update for each completed file.
+    '''
+    workers = processor.workers
+    sizes = {f: os.path.getsize(os.path.join(input_path, f)) for f in files}
+    tasks = plan_tasks(files, sizes, workers, processor.segment_size,
+                       splittable=can_split(processor, action, input_path),
+                       batch_size=BATCH_SIZE, batch_files=BATCH_FILES,
+                       split_size=SPLIT_SIZE)
+
+    # the outputs of split files are assembled in place in a temporary file
+    remaining = {}
+    tmp_paths = {}
+    for task in tasks:
+        if not task.is_segment:
+            continue
+        f = task.files[0]
+        if f not in tmp_paths:
+            opath = os.path.join(output_path, f)
+            fd, tmp_paths[f] = create_temp_file(
+                os.path.dirname(opath),
+                '.{}.'.format(os.path.basename(opath)))
+            try:
+                os.ftruncate(fd, sizes[f])
+            finally:
+                os.close(fd)
+        task.tmp_path = tmp_paths[f]
+        remaining[f] = remaining.get(f, 0) + 1
+
+    store_root = None
+    if action == 'encode' and processor.dedup:
+        store_root = output_path
+    elif action == 'decode' and os.path.isdir(os.path.join(input_path, CHUNKS_DIR)):
+        store_root = input_path
+
+    options = dict(segment_size=processor.segment_size,
+                   durability=processor.writer.durability,
+                   dedup=processor.dedup, compression=processor.compression,
+                   compression_level=processor.compression_level,
+                   chunk_size=processor.chunk_size,
+                   records=processor.records, envelope=processor.envelope,
+                   recipients=processor.recipients,
+                   output_encoding=processor.output_encoding,
+                   pipelined=processor.pipelined,
+                   checksum=processor.checksum,
+                   passthrough=processor.passthrough,
+                   read_rate=processor.read_rate // workers
+                   if processor.read_rate is not None else None,
+                   write_rate=processor.write_rate // workers
+                   if processor.write_rate is not None else None,
+                   cpu_limit=processor.cpu_limit, nice=processor.nice,
+                   ionice=processor.ionice,
+                   control_file=processor.control_file, kdf=processor.kdf,
+                   max_memory=processor.max_memory // workers
+                   if processor.max_memory is not None else None)
+    if stats is not None:
+        stats.start = time.time()
+    if processor.strategy == 'thread':
+        # (for algorithms that release the GIL, e.g. AES)
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(tasks)) or 1)
+        shared = processor
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)) or 1, initializer=_init_worker,
+            initargs=(processor.algo._name, processor.params, options,
+                      workers))
+        shared = None
+    pending = set()
+    try:
+        pending = set(pool.submit(_run_task, task, input_path, output_path,
+                                  action, store_root, kwargs, shared)
+                      for task in tasks)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                committed = record.pop('committed')
+                io_counts = record.pop('io', None)
+                if io_counts is not None and processor.throttle is not None:
+                    processor.throttle.merge(io_counts)
+                if stats is not None:
+                    stats.add(record)
+                for rel_path, digest in committed:
+                    if on_commit is not None:
+                        on_commit(rel_path, digest)
+                if progress is not None:
+                    # (the files of segmented tasks are counted once complete,
+                    # and record mode commits an index along with each file)
+                    progress.update(len([f for f in record['files']
+                                         if f not in remaining]))
+                for f in record['files']:
+                    if f not in remaining:
+                        continue
+                    remaining[f] -= 1
+                    if remaining[f] > 0:
+                        continue
+                    # all the segments of the file are done
+                    opath = os.path.join(output_path, f)
+                    os.replace(tmp_paths.pop(f), opath)
+                    if processor.writer.durability != 'none':
+                        fsync_dir(os.path.dirname(opath))
+                    # (the segments are hashed apart, so the assembled
+                    # output is hashed again to be checked on resume)
+                    if on_commit is not None:
+                        on_commit(f, file_digest(opath))
+                    if progress is not None:
+                        progress.update(1)
+    finally:
+        # (the tasks that did not start are dropped)
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+        for tmp_path in tmp_paths.values():
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        if stats is not None:
+            stats.end = time.time()
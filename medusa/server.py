@@ -0,0 +1,276 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .client import (default_socket_path, pack_content, recv_frame,
+                     send_frame, unpack_content)
+
+# maximum number of warmed instances kept by the daemon
+MAX_PROCESSORS = 8
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        # a connection may send several jobs in a row
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            send_frame(self.request, self.server.medusa.submit(message))
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MedusaServer(object):
+
+    def __init__(self, socket_path=None, workers=4, max_queue=1024,
+                 verbose=False):
+        '''Long-running Medusa daemon: keeps warmed `Medusa` instances (and
+        their derived keys) and runs encode/decode jobs received on a Unix
+        domain socket with a pool of workers.
+
+        Parameters
+        ----------
+        socket_path : str, optional
+            Path to the Unix domain socket to listen on (default location if None).
+        workers : int, optional
+            Maximum number of jobs to run concurrently (4 by default).
+        max_queue : int, optional
+            Maximum number of pending jobs; further jobs are rejected as busy
+            (1024 by default).
+        verbose : bool, optional
+            If true, the daemon prints a log for each job (false by default).
+        '''
+        self.socket_path = socket_path or default_socket_path()
+        self.n_workers = max(1, workers)
+        self.verbose = verbose
+
+        self._jobs = queue.PriorityQueue(maxsize=max_queue)
+        self._counter = itertools.count()
+        self._processors = OrderedDict()
+        self._processors_lock = threading.Lock()
+        # (the instances are looked up by a keyed hash of their params, so
+        # that the secrets are not kept in the cache keys)
+        self._cache_key = os.urandom(32)
+        self._workers = []
+        self._server = None
+
+    def _get_processor(self, algo, params):
+        '''Returns a warmed `Medusa` instance for the given algorithm and params,
+        creating it on the first use (instances are shared by the workers, and
+        only the `MAX_PROCESSORS` most recently used ones are kept).'''
+        from .medusa import Medusa
+
+        key = hmac.new(self._cache_key,
+                       json.dumps([algo, params], sort_keys=True).encode(),
+                       hashlib.sha256).digest()
+        with self._processors_lock:
+            if key in self._processors:
+                self._processors.move_to_end(key)
+                return self._processors[key]
+            processor = Medusa(algo=algo, params=params, base_path='/',
+                               exit_on_error=False)
+            self._processors[key] = processor
+            while len(self._processors) > MAX_PROCESSORS:
+                self._processors.popitem(last=False)
+            return processor
+
+    def _run_job(self, message):
+        action = message.get('action')
+        if action == 'ping':
+            return {}
+        if action not in ['encode', 'decode']:
+            raise ValueError('Invalid action: "{}"'.format(action))
+
+        processor = self._get_processor(message['algo'],
+                                        message.get('params', {}))
+        kwargs = dict(message.get('extra', {}))
+        ctx = {}
+        if action == 'encode':
+            # (each job gets its own context, and only the context is sent
+            # back, never e.g. a password given with the job)
+            ctx = processor.new_context()
+            kwargs = dict(ctx, **kwargs)
+            ctx = {k: kwargs[k] for k in ctx}
+
+        response = {}
+        if 'input' in message:
+            input_path, output_path = message['input'], message['output']
+            if os.path.isdir(input_path):
+                processor.process_dir(input_path, output_path, action,
+                                      **kwargs)
+            else:
+                processor.process_file(input_path, output_path, action,
+                                       **kwargs)
+        else:
+            content = unpack_content(message)
+            func = processor.encode if action == 'encode' \
+                else processor.decode
+            pack_content(response, func(content, _is_direct=False,
+                                        **kwargs), 'result')
+
+        if action == 'encode':
+            response['context'] = ctx
+        return response
+
+    def _worker(self):
+        while True:
+            _, _, job = self._jobs.get()
+            if job is None:
+                return
+            message, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._run_job(message))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, message):
+        '''Queues a job and waits for its result.
+
+        Parameters
+        ----------
+        message : dict
+            Job description (see `MedusaClient`).
+
+        Returns
+        -------
+        dict
+            Response to send back to the client.
+        '''
+        future = Future()
+        priority = -int(message.get('priority', 0))
+        try:
+            self._jobs.put_nowait((priority, next(self._counter),
+                                   (message, future)))
+        except queue.Full:
+            return {'status': 'error', 'error': 'busy'}
+
+        try:
+            response = future.result()
+        except BaseException as e:
+            error = str(e) or e.__class__.__name__
+            if self.verbose:
+                print('[Medusa - Error] Job failed: {}'.format(error))
+            return {'status': 'error', 'error': error}
+        if self.verbose:
+            print('[Medusa] {} job done.'.format(message.get('action')))
+        response['status'] = 'ok'
+        return response
+
+    def start(self):
+        '''Binds the socket and starts the workers (non-blocking).'''
+        if os.path.exists(self.socket_path):
+            # remove a stale socket, but never steal one from a live daemon
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise OSError('A Medusa daemon is already listening on "{}".'
+                              .format(self.socket_path))
+            finally:
+                probe.close()
+
+        # jobs carry passwords: only the owner may talk to the daemon, so the
+        # socket is bound in a private directory, and only moved to its path
+        # once restricted (instead of being reachable until it is chmoded)
+        private_dir = tempfile.mkdtemp(
+            prefix='.medusa-', dir=os.path.dirname(os.path.abspath(self.socket_path)))
+        tmp_path = os.path.join(private_dir, 'sock')
+        try:
+            self._server = _UnixServer(tmp_path, _RequestHandler)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.socket_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            os.rmdir(private_dir)
+        self._server.medusa = self
+
+        for _ in range(self.n_workers):
+            worker = threading.Thread(target=self._worker, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def serve_forever(self):
+        '''Starts the daemon and blocks until `shutdown` is called.'''
+        if self._server is None:
+            self.start()
+        if self.verbose:
+            print('[Medusa] Listening on: {}'.format(self.socket_path))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._cleanup()
+
+    def shutdown(self):
+        '''Stops the daemon (pending jobs are still run).'''
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _cleanup(self):
+        for _ in self._workers:
+            self._jobs.put((float('inf'), next(self._counter), None))
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path=None, workers=4, max_queue=1024, verbose=False):
+    '''Runs a Medusa daemon until interrupted (see `MedusaServer`).'''
+    server = MedusaServer(socket_path=socket_path, workers=workers,
+                          max_queue=max_queue, verbose=verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,163 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import io
+
+from .pipeline import StreamDecoder, StreamEncoder
+
+
+class MedusaWriter(io.RawIOBase):
+
+    def __init__(self, f, algo, process, codec=None, level=None, closefd=True,
+                 meta=None, header_size=None, encoding='raw'):
+        '''Writable file object that encodes the data written to it (in the
+        header format) into another file. It is usually wrapped in an
+        `io.BufferedWriter` (see `Medusa.open`).
+
+        Parameters
+        ----------
+        f : file-like
+            Binary file to write the encoded data to.
+        algo : Algorithm
+            Algorithm to use.
+        process : callable
+            Function to encode a chunk, given the chunk and its offset.
+        codec : str, optional
+            Compression codec, or None for no compression.
+        level : int, optional
+            Compression level.
+        closefd : bool, optional
+            Whether or not to close `f` when this file is closed (true by
+            default).
+        meta : dict, optional
+            Additional metadata to record in the header.
+        header_size : int, optional
+            Size to pad the header to.
+        encoding : str, optional
+            Encoding of the output (see `pipeline.OUTPUT_ENCODINGS`, "raw" by
+            default).
+        '''
+        self.f = f
+        self.closefd = closefd
+        self.encoder = StreamEncoder(algo, process, f, codec=codec, level=level,
+                                     meta=meta, header_size=header_size,
+                                     encoding=encoding)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._checkClosed()
+        data = bytes(b)
+        self.encoder.write(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.encoder.close()
+            if self.closefd:
+                self.f.close()
+            else:
+                self.f.flush()
+        finally:
+            super().close()
+
+
+class MedusaReader(io.RawIOBase):
+
+    def __init__(self, f, algo, process, chunk_size, closefd=True,
+                 on_header=None):
+        '''Readable file object that decodes the content of another file (in the
+        header format) as it is read. Uncompressed raw contents of segmentable
+        algorithms (Caesar, Vigenere, AES-CTR) are seekable. It is usually
+        wrapped in an `io.BufferedReader` (see `Medusa.open`).
+
+        Parameters
+        ----------
+        f : io.BufferedReader
+            Binary file to read the encoded data from.
+        algo : Algorithm
+            Algorithm to use.
+        process : callable
+            Function to decode a chunk, given the chunk and its offset.
+        chunk_size : int
+            Size of the chunks to read.
+        closefd : bool, optional
+            Whether or not to close `f` when this file is closed (true by
+            default).
+        on_header : callable, optional
+            Function called with the metadata of the header before decoding.
+        '''
+        self.f = f
+        self.closefd = closefd
+        self.decoder = StreamDecoder(algo, process, f, chunk_size=chunk_size,
+                                     on_header=on_header)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.decoder.seekable
+
+    def readinto(self, b):
+        self._checkClosed()
+        data = self.decoder.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        self._checkClosed()
+        return self.decoder.read()
+
+    def tell(self):
+        self._checkClosed()
+        return self.decoder.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_CUR:
+            offset += self.decoder.position
+        elif whence == io.SEEK_END:
+            offset += self.decoder.size()
+        elif whence != io.SEEK_SET:
+            raise ValueError('Invalid whence: {}'.format(whence))
+        if offset < 0:
+            raise ValueError('Negative seek position: {}'.format(offset))
+        self.decoder.seek(offset)
+        return offset
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.closefd:
+                self.f.close()
+        finally:
+            super().close()
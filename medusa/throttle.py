@@ -0,0 +1,419 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import ctypes
+import ctypes.util
+import io
+import os
+import platform
+import threading
+import time
+
+from .memory import format_size, parse_size
+
+# settings of a control file (one "name=value" line each)
+CONTROL_KEYS = ['read_rate', 'write_rate', 'cpu_limit']
+# interval between two checks of the control file, in seconds
+CONTROL_INTERVAL = 1.
+
+# I/O scheduling classes (see ionice(1)), and number of the ioprio_set system
+# call per architecture
+IONICE_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+              'armv7l': 314, 'ppc64le': 273, 's390x': 282}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# I/O priority levels of a class (0 is the highest)
+IONICE_LEVELS = range(8)
+
+
+def parse_limit(name, value):
+    '''Parses the value of a limit (see `CONTROL_KEYS`).
+
+    Parameters
+    ----------
+    name : str
+        Name of the limit.
+    value : int, float or str
+        Value of the limit (None for no limit).
+
+    Returns
+    -------
+    int or float
+        Rate in bytes per second, or fraction of a CPU in ]0, 1] (None for no
+        limit).
+    '''
+    if value is None:
+        return None
+    if name == 'cpu_limit':
+        try:
+            limit = float(value)
+        except ValueError:
+            limit = None
+        # (a zero or negative limit would make the duty cycle divide by zero
+        # or sleep for a negative time)
+        if limit is None or not 0 < limit <= 1:
+            raise ValueError('Invalid CPU limit: "{}" (must be in ]0, 1]).'.format(value))
+        return limit
+    rate = value if isinstance(value, (int, float)) else parse_size(value)
+    if rate <= 0:
+        raise ValueError('Invalid rate: "{}" (must be positive).'.format(value))
+    return rate
+
+
+def parse_ionice(ionice):
+    '''Parses an I/O scheduling class, optionally followed by a level (e.g.
+    "idle" or "best-effort:7").
+
+    Parameters
+    ----------
+    ionice : str
+        Class and level.
+
+    Returns
+    -------
+    int
+        I/O priority value of the `ioprio_set` system call.
+    '''
+    name, _, level = ionice.partition(':')
+    if name not in IONICE_CLASSES:
+        raise ValueError('Unknown I/O scheduling class: "{}" (available: {}).'.format(
+            ionice, ', '.join(IONICE_CLASSES)))
+    if level and (not level.isdigit() or int(level) not in IONICE_LEVELS):
+        raise ValueError('Invalid I/O priority level: "{}" (must be in {}-{}).'.format(
+            level, IONICE_LEVELS[0], IONICE_LEVELS[-1]))
+    return (IONICE_CLASSES[name] << IOPRIO_CLASS_SHIFT) | int(level or 0)
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate=None):
+        '''Thread-safe token bucket that limits a flow of bytes to a rate:
+        each consumer takes the tokens it needs, possibly going into debt,
+        and waits until the debt is paid back. Up to one second of unused
+        rate can be saved for bursts.
+
+        Parameters
+        ----------
+        rate : float, optional
+            Rate, in bytes per second (None for no limit).
+        '''
+        self.rate = rate
+        self.tokens = 0.
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        '''Changes the rate (None for no limit).'''
+        with self.lock:
+            self.rate = rate
+            self.tokens = 0.
+            self.last = time.monotonic()
+
+    def consume(self, n):
+        '''Takes some tokens, waiting for them if needed.
+
+        Parameters
+        ----------
+        n : int
+            Number of tokens (bytes) to take.
+        '''
+        with self.lock:
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens +
+                              (now - self.last) * self.rate) - n
+            self.last = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class DutyCycle(object):
+
+    def __init__(self, limit=None, window=1.):
+        '''Limits the CPU use of the process to a fraction of a CPU, by
+        sleeping between two units of work so that the CPU time stays below
+        the fraction of the elapsed time.
+
+        Parameters
+        ----------
+        limit : float, optional
+            Fraction of a CPU, in ]0, 1] (None for no limit).
+        window : float, optional
+            Duration over which the CPU use is measured, in seconds.
+        '''
+        self.limit = limit
+        self.window = window
+        self._reset()
+
+    def _reset(self):
+        self.cpu = time.process_time()
+        self.start = time.monotonic()
+
+    def tick(self):
+        '''Waits, after a unit of work, if the CPU use is over the limit.'''
+        if self.limit is None:
+            return
+        busy = time.process_time() - self.cpu
+        elapsed = time.monotonic() - self.start
+        if elapsed < busy / self.limit:
+            time.sleep(busy / self.limit - elapsed)
+        if elapsed > self.window:
+            self._reset()
+
+
+class _ThrottledRaw(io.RawIOBase):
+
+    def __init__(self, f, throttle, closefd=False):
+        self.f = f
+        self.throttle = throttle
+        self.closefd = closefd
+
+    def close(self):
+        if self.closefd and not self.closed:
+            self.f.close()
+        super().close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.f.readinto(b)
+        if n:
+            self.throttle.read(n)
+        return n
+
+    def seekable(self):
+        return self.f.seekable()
+
+    def seek(self, position, whence=io.SEEK_SET):
+        return self.f.seek(position, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+
+class _ThrottledWriter(object):
+
+    def __init__(self, f, throttle):
+        self.f = f
+        self.throttle = throttle
+
+    def write(self, data):
+        self.throttle.write(len(data))
+        return self.f.write(data)
+
+
+class Throttle(object):
+
+    def __init__(self, read_rate=None, write_rate=None, cpu_limit=None,
+                 control_file=None, share=1):
+        '''Limits of the I/O and CPU use of the processings, that can be
+        changed while they run through a control file, and counters of the
+        achieved rates.
+
+        Parameters
+        ----------
+        read_rate : int or str, optional
+            Maximum read rate, in bytes per second (e.g. "50M") (None for no
+            limit).
+        write_rate : int or str, optional
+            Maximum write rate, in bytes per second (None for no limit).
+        cpu_limit : float, optional
+            Maximum fraction of a CPU to use, in ]0, 1] (None for no limit).
+        control_file : str, optional
+            Path to a file of "name=value" lines (see `CONTROL_KEYS`, with
+            "none" for no limit) that overrides the limits; it is checked
+            every second while processing (see `reload`).
+        share : int, optional
+            Number of processes the I/O rates are split between (1 by
+            default): the rates of the control file are divided by it.
+        '''
+        self.reads = TokenBucket()
+        self.writes = TokenBucket()
+        self.cpu = DutyCycle()
+        self.control_file = control_file
+        self.share = share
+        self.control_mtime = None
+        self.last_check = time.monotonic()
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.start = time.time()
+        self.configure(read_rate=read_rate, write_rate=write_rate,
+                       cpu_limit=cpu_limit)
+        if control_file is not None:
+            self.reload()
+
+    @property
+    def limits(self):
+        '''Current limits (None for no limit).'''
+        return {'read_rate': self.reads.rate, 'write_rate': self.writes.rate,
+                'cpu_limit': self.cpu.limit}
+
+    def configure(self, **limits):
+        '''Changes some limits (see `CONTROL_KEYS`); none of them is changed
+        if one is invalid (ValueError).'''
+        limits = {k: parse_limit(k, v) for k, v in limits.items()
+                  if k in CONTROL_KEYS}
+        for k, v in limits.items():
+            if k == 'cpu_limit':
+                self.cpu.limit = v
+            else:
+                bucket = self.reads if k == 'read_rate' else self.writes
+                bucket.set_rate(v)
+
+    def reload(self):
+        '''Applies the limits of the control file (if it exists); if one of
+        them is invalid, a warning is printed and the current limits are
+        kept, so that a typo does not stop a running processing.'''
+        if self.control_file is None:
+            return
+        try:
+            self.control_mtime = os.path.getmtime(self.control_file)
+            with open(self.control_file, 'r') as FILE:
+                lines = FILE.read().splitlines()
+        except OSError:
+            return
+        limits = {}
+        for line in lines:
+            if '=' not in line:
+                continue
+            k, v = [x.strip() for x in line.split('=', 1)]
+            if k not in CONTROL_KEYS:
+                continue
+            limits[k] = None if v.lower() == 'none' else v
+        try:
+            limits = {k: parse_limit(k, v) for k, v in limits.items()}
+        except ValueError as e:
+            print('[Medusa - Warning] Ignoring the control file "{}": {}'.format(
+                self.control_file, e))
+            return
+        for k in ['read_rate', 'write_rate']:
+            if limits.get(k) is not None:
+                limits[k] /= self.share
+        self.configure(**limits)
+
+    def _check_control(self):
+        if self.control_file is None:
+            return
+        now = time.monotonic()
+        if now - self.last_check < CONTROL_INTERVAL:
+            return
+        self.last_check = now
+        try:
+            mtime = os.path.getmtime(self.control_file)
+        except OSError:
+            return
+        if mtime != self.control_mtime:
+            self.reload()
+
+    def read(self, n):
+        '''Accounts for (and waits for) some bytes read.'''
+        self._check_control()
+        self.read_bytes += n
+        self.reads.consume(n)
+
+    def write(self, n):
+        '''Accounts for (and waits for) some bytes written.'''
+        self.written_bytes += n
+        self.writes.consume(n)
+
+    def tick(self):
+        '''Waits, after processing a chunk, if the CPU use is over the limit.'''
+        self.cpu.tick()
+
+    def reader(self, f, closefd=False):
+        '''Wraps a binary stream so that its reads are throttled (the stream is
+        only closed with the wrapper if `closefd` is true).'''
+        return io.BufferedReader(_ThrottledRaw(f, self, closefd=closefd))
+
+    def writer(self, f):
+        '''Wraps a stream (with a `write` method) so that its writes are
+        throttled.'''
+        return _ThrottledWriter(f, self)
+
+    def merge(self, counts):
+        '''Adds the counters of another process (see `counts`).'''
+        self.read_bytes += counts['read_bytes']
+        self.written_bytes += counts['written_bytes']
+
+    def counts(self):
+        '''Current counters of bytes read and written.'''
+        return {'read_bytes': self.read_bytes,
+                'written_bytes': self.written_bytes}
+
+    def summary(self):
+        '''Describes the achieved rates, and the limits.'''
+        elapsed = max(time.time() - self.start, 1e-6)
+        limits = self.limits
+        log = 'I/O: read {}/s, written {}/s'.format(
+            format_size(int(self.read_bytes / elapsed)),
+            format_size(int(self.written_bytes / elapsed)))
+        log += ' (limits: read {}, write {}, CPU {})'.format(
+            format_size(int(limits['read_rate'] * self.share)) + '/s'
+            if limits['read_rate'] is not None else 'none',
+            format_size(int(limits['write_rate'] * self.share)) + '/s'
+            if limits['write_rate'] is not None else 'none',
+            '{:.0%}'.format(limits['cpu_limit'])
+            if limits['cpu_limit'] is not None else 'none')
+        return log
+
+
+def set_priority(nice=None, ionice=None):
+    '''Lowers the CPU and I/O priorities of the current process.
+
+    Parameters
+    ----------
+    nice : int, optional
+        Target niceness (see `os.setpriority`); an absolute value, so that
+        applying it again (e.g. in a worker that inherited it) has no effect,
+        and never lower than the current one.
+    ionice : str, optional
+        I/O scheduling class, optionally followed by a level (e.g. "idle" or
+        "best-effort:7", see `IONICE_CLASSES`); only on Linux.
+    '''
+    if nice is not None:
+        try:
+            if nice > os.getpriority(os.PRIO_PROCESS, 0):
+                os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except OSError as e:
+            print('[Medusa - Warning] Could not set the niceness: {}'.format(e))
+    if ionice is None:
+        return
+    value = parse_ionice(ionice)
+    syscall = IOPRIO_SET.get(platform.machine())
+    if syscall is None:
+        print('[Medusa - Warning] Could not set the I/O priority: not '
+              'supported on this platform.')
+        return
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0, value) < 0:
+        print('[Medusa - Warning] Could not set the I/O priority: {}'.format(
+            os.strerror(ctypes.get_errno())))
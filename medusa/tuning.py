@@ -0,0 +1,278 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import math
+import os
+import tempfile
+import time
+
+from .memory import IN_FLIGHT_FACTOR, format_size
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+# (cgroup v1 reports "no limit" as a huge page-aligned value)
+CGROUP_V1_NO_LIMIT = 1 << 60
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# chunks should take about this long to be written to the target, and at
+# most this long to be processed
+CHUNK_IO_TIME = 0.05
+CHUNK_CIPHER_TIME = 0.25
+CALIBRATION_TIME = 0.2
+CALIBRATION_SIZE = 256 * 1024
+IO_CALIBRATION_SIZE = 8 * 1024 * 1024
+# algorithms whose processing releases the GIL (in C code), so that they can
+# be run in threads rather than processes
+THREADED_ALGORITHMS = ['aes']
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as FILE:
+            return FILE.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _cgroup_paths(root, controller):
+    # (the cgroup of this process, then the root one, as seen in a container)
+    paths = []
+    lines = _read('/proc/self/cgroup') or ''
+    for line in lines.split('\n'):
+        parts = line.split(':', 2)
+        if len(parts) != 3:
+            continue
+        if (controller is None and parts[0] == '0') or \
+                (controller is not None and controller in parts[1].split(',')):
+            base = root if controller is None \
+                else os.path.join(root, controller)
+            paths.append(os.path.join(base, parts[2].lstrip('/')))
+    paths.append(root if controller is None else os.path.join(root, controller))
+    return paths
+
+
+def cgroup_cpu_limit(root=CGROUP_ROOT):
+    '''Reads the CPU quota of the cgroup (v2 or v1) of this process.
+
+    Parameters
+    ----------
+    root : str, optional
+        Mount point of the cgroup filesystem.
+
+    Returns
+    -------
+    float
+        Number of CPUs allowed by the quota (or None if there is no quota).
+    '''
+    for path in _cgroup_paths(root, None):
+        value = _read(os.path.join(path, 'cpu.max'))
+        if value is not None:
+            quota, period = (value.split() + ['100000'])[:2]
+            if quota == 'max':
+                return None
+            return int(quota) / int(period)
+    for path in _cgroup_paths(root, 'cpu'):
+        quota = _read(os.path.join(path, 'cpu.cfs_quota_us'))
+        period = _read(os.path.join(path, 'cpu.cfs_period_us'))
+        if quota is not None and period is not None:
+            if int(quota) <= 0:
+                return None
+            return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory_limit(root=CGROUP_ROOT):
+    '''Reads the memory limit of the cgroup (v2 or v1) of this process.
+
+    Parameters
+    ----------
+    root : str, optional
+        Mount point of the cgroup filesystem.
+
+    Returns
+    -------
+    int
+        Memory limit in bytes (or None if there is no limit).
+    '''
+    for path in _cgroup_paths(root, None):
+        value = _read(os.path.join(path, 'memory.max'))
+        if value is not None:
+            return None if value == 'max' else int(value)
+    for path in _cgroup_paths(root, 'memory'):
+        value = _read(os.path.join(path, 'memory.limit_in_bytes'))
+        if value is not None:
+            return None if int(value) >= CGROUP_V1_NO_LIMIT else int(value)
+    return None
+
+
+def available_cpus(root=CGROUP_ROOT):
+    '''Returns the number of CPUs this process can actually use: the CPUs it
+    is allowed to run on, capped by the cgroup CPU quota.
+
+    Returns
+    -------
+    int
+        Number of CPUs (at least 1).
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit(root)
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def calibrate_cipher(processor, size=CALIBRATION_SIZE,
+                     duration=CALIBRATION_TIME):
+    '''Measures the encoding throughput of a processor on a single core.
+
+    Parameters
+    ----------
+    processor : Medusa
+        Processor to measure.
+    size : int, optional
+        Size of the sample content.
+    duration : float, optional
+        Minimum duration of the measure, in seconds.
+
+    Returns
+    -------
+    float
+        Throughput, in bytes per second.
+    '''
+    sample = os.urandom(size)
+    if not processor.algo._binary:
+        sample = sample.decode('latin-1')
+    params = processor._get_params('encode')
+    processed, start = 0, time.perf_counter()
+    while True:
+        processor.algo.encode_segment(sample, params, processed)
+        processed += size
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return processed / elapsed
+
+
+def calibrate_io(path, size=IO_CALIBRATION_SIZE):
+    '''Measures the (synced) write throughput of the storage of a path.
+
+    Parameters
+    ----------
+    path : str
+        Target path (its closest existing directory is measured).
+    size : int, optional
+        Number of bytes to write.
+
+    Returns
+    -------
+    float
+        Throughput, in bytes per second.
+    '''
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    block = os.urandom(1024 * 1024)
+    with tempfile.NamedTemporaryFile(dir=path, prefix='.medusa-calibration.') as FILE:
+        start = time.perf_counter()
+        for _ in range(max(1, size // len(block))):
+            FILE.write(block)
+        FILE.flush()
+        os.fsync(FILE.fileno())
+        elapsed = time.perf_counter() - start
+    return max(1, size // len(block)) * len(block) / max(elapsed, 1e-6)
+
+
+def _round_chunk_size(size):
+    size = min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, int(size)))
+    # (powers of 2 are friendlier to the block sizes of the storage)
+    return 1 << (size.bit_length() - 1)
+
+
+def auto_tune(processor, target_path, root=CGROUP_ROOT):
+    '''Picks the execution settings for a processor on this host: the worker
+    count from the usable CPUs and the cipher vs I/O throughputs, the chunk
+    size from the I/O throughput (within the memory limit), the
+    thread-vs-process strategy from the algorithm, and a memory budget from
+    the cgroup memory limit.
+
+    Parameters
+    ----------
+    processor : Medusa
+        Processor to tune (it is only used to measure the cipher).
+    target_path : str
+        Path the outputs will be written to.
+    root : str, optional
+        Mount point of the cgroup filesystem.
+
+    Returns
+    -------
+    (dict, dict)
+        Chosen settings ("workers", "chunk_size", "strategy" and
+        "max_memory"), and measures they are based on.
+    '''
+    cpus = available_cpus(root)
+    memory_limit = cgroup_memory_limit(root)
+    measures = {'cpus': cpus, 'memory_limit': memory_limit,
+                'cipher_throughput': None, 'io_throughput': None}
+    settings = {'workers': 1, 'chunk_size': None,
+                'strategy': 'thread' if processor.algo._name in
+                THREADED_ALGORITHMS else 'process',
+                'max_memory': memory_limit // 2 if memory_limit else None}
+    if processor.algo._max_content_size is not None:
+        # (small contents only: nothing to tune)
+        return settings, measures
+
+    cipher = measures['cipher_throughput'] = calibrate_cipher(processor)
+    io_ = measures['io_throughput'] = calibrate_io(target_path)
+    # enough workers for the cipher to keep up with the storage
+    settings['workers'] = max(1, min(cpus, math.ceil(io_ / cipher)))
+    chunk_size = min(io_ * CHUNK_IO_TIME, cipher * CHUNK_CIPHER_TIME)
+    if settings['max_memory'] is not None:
+        # (room for the chunks of all the workers in half of the budget)
+        chunk_size = min(chunk_size, settings['max_memory'] / 2 /
+                         (IN_FLIGHT_FACTOR * settings['workers']))
+    settings['chunk_size'] = _round_chunk_size(chunk_size)
+    return settings, measures
+
+
+def describe(settings, measures):
+    '''Formats tuned settings and their measures for the logs.'''
+    log = 'Auto-tuning: {} CPU(s), memory limit: {}'.format(
+        measures['cpus'], format_size(measures['memory_limit'])
+        if measures['memory_limit'] else 'none')
+    if measures['cipher_throughput'] is not None:
+        log += ', cipher: {}/s, I/O: {}/s'.format(
+            format_size(measures['cipher_throughput']),
+            format_size(measures['io_throughput']))
+    log += '\n  -> ' + ', '.join(
+        '{}={}'.format(k, format_size(v) if k in ['chunk_size', 'max_memory'] and
+                       v is not None else v)
+        for k, v in sorted(settings.items()))
+    return log
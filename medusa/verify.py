@@ -0,0 +1,145 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .algorithms import ALGORITHMS
+from .pipeline import DEFAULT_CHUNK_SIZE, verify_stream
+from .records import INDEX_SUFFIX, check_index, index_path
+from .scan import scan_dir
+from .scheduler import plan_tasks
+
+STATUSES = ['ok', 'corrupted', 'unchecked']
+
+
+def verify_file(path, chunk_size=DEFAULT_CHUNK_SIZE, on_header=None):
+    '''Checks the integrity of an encoded file without decoding it (nor
+    writing anything), so that no key is needed: its header, and the length
+    and SHA-256 of its content (from its trailer), or the index of a record
+    file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the encoded file.
+    chunk_size : int, optional
+        Size of the chunks to read.
+    on_header : callable, optional
+        Function called with the metadata of the header, that raises a
+        `ValueError` if it is invalid (e.g. to check a wrapped data key).
+
+    Returns
+    -------
+    (str, str)
+        Status of the file: "ok", "corrupted" or "unchecked" (outputs
+        without header have no integrity data), and details.
+    '''
+    try:
+        if os.path.exists(index_path(path)):
+            check_index(index_path(path), os.path.getsize(path))
+            return 'ok', 'record index'
+        with open(path, 'rb') as FILE:
+            meta = verify_stream(FILE, chunk_size=chunk_size,
+                                 on_header=on_header)
+    except (OSError, ValueError) as e:
+        return 'corrupted', str(e)
+    if meta is None:
+        return 'unchecked', 'no header'
+    if meta.get('algo') not in ALGORITHMS:
+        return 'corrupted', 'unknown algorithm "{}"'.format(meta.get('algo'))
+    if meta.get('checksum') is None:
+        return 'unchecked', 'no checksum'
+    return 'ok', meta['algo']
+
+
+def verify_dir(path, workers=1, exclude=[], chunk_size=DEFAULT_CHUNK_SIZE,
+               on_header=None, on_report=None, on_ignore=None, progress=None):
+    '''Checks the integrity of the encoded files of a directory recursively
+    (see `verify_file`). With several workers, the files are verified in
+    threads (reads and hashes release the GIL), largest first and with the
+    small files batched (see `scheduler.plan_tasks`).
+
+    Parameters
+    ----------
+    path : str
+        Absolute path to the encoded directory.
+    workers : int, optional
+        Number of worker threads (1 by default).
+    exclude : list(str), optional
+        Names of the files or folders to ignore (empty list by default).
+    chunk_size : int, optional
+        Size of the chunks to read.
+    on_header : callable, optional
+        Function called with the metadata of each header (see `verify_file`).
+    on_report : callable, optional
+        Function called with the relative path, the status and the details
+        of each verified file.
+    on_ignore : callable, optional
+        Function called with the relative path of each ignored file or folder.
+    progress : tqdm, optional
+        Progress bar to update for each verified file.
+
+    Returns
+    -------
+    dict
+        Status and details of each file (by relative path).
+    '''
+    _, files = scan_dir(path, exclude, on_ignore=on_ignore)
+    # (the indexes of record files are verified along with them)
+    files = [f for f in files if not f.endswith(INDEX_SUFFIX)]
+    reports = {}
+    if progress is not None:
+        progress.total = len(files)
+
+    def _verify(task_files):
+        return [(f,) + verify_file(os.path.join(path, f), chunk_size=chunk_size,
+                                   on_header=on_header)
+                for f in task_files]
+
+    def _report(results):
+        for f, status, message in results:
+            reports[f] = (status, message)
+            if on_report is not None:
+                on_report(f, status, message)
+            if progress is not None:
+                progress.update(1)
+
+    if workers <= 1 or len(files) <= 1:
+        _report(_verify(files))
+        return reports
+
+    sizes = {f: os.path.getsize(os.path.join(path, f)) for f in files}
+    tasks = plan_tasks(files, sizes, workers, 0)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set(pool.submit(_verify, task.files) for task in tasks)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                _report(future.result())
+    return reports
@@ -0,0 +1,387 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import struct
+import time
+
+from .scan import scan_dir
+
+# inotify events and flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct('iIII')
+
+# time without changes after which a file is considered complete, in seconds
+SETTLE_TIME = 0.5
+# interval between two scans of the polling watch, in seconds
+POLL_INTERVAL = 1.
+
+
+def _is_ignored(rel_path, exclude):
+    return any(name.startswith('.') or name in exclude
+               for name in rel_path.split(os.sep))
+
+
+def _file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class InotifySource(object):
+
+    def __init__(self, root, exclude=[]):
+        '''Source of the changed files of a directory, recursively, based on
+        Linux inotify (through the C library).
+
+        Parameters
+        ----------
+        root : str
+            Absolute path to the directory to watch.
+        exclude : list(str), optional
+            Names of the files or folders to ignore (empty list by default).
+
+        Raises
+        ------
+        OSError
+            If inotify is not available.
+        '''
+        name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not available.')
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                                ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'Could not init inotify.')
+        self.root = root
+        self.exclude = exclude
+        self.watches = {}
+
+    def fileno(self):
+        return self.fd
+
+    def _add_dir(self, rel_dir):
+        # watches a folder and its subfolders, and returns their files (that
+        # may have been written before the watches were added)
+        path = os.path.join(self.root, rel_dir)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return []
+        self.watches[wd] = rel_dir
+        try:
+            dirs, files = scan_dir(path, self.exclude)
+        except OSError:
+            return []
+        for d in dirs:
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(os.path.join(path, d)), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = os.path.join(rel_dir, d)
+        return [os.path.join(rel_dir, f) for f in files]
+
+    def scan(self):
+        '''Starts watching the directory.
+
+        Returns
+        -------
+        list(str)
+            Relative paths of the files it holds.
+        '''
+        return self._add_dir('')
+
+    def read(self):
+        '''Reads the pending events (without blocking).
+
+        Returns
+        -------
+        list(str)
+            Relative paths of the files that changed.
+        '''
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT.size:
+                                        offset + EVENT.size + length].rstrip(b'\0'))
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # (some events were lost: everything is checked again)
+                    changed += self._add_dir('')
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                if wd not in self.watches or len(name) == 0:
+                    continue
+                rel_path = os.path.join(self.watches[wd], name)
+                if _is_ignored(rel_path, self.exclude):
+                    continue
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed += self._add_dir(rel_path)
+                else:
+                    changed.append(rel_path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollSource(object):
+
+    def __init__(self, root, exclude=[], interval=POLL_INTERVAL):
+        '''Source of the changed files of a directory, recursively, based on
+        periodic scans (when inotify is not available).
+
+        Parameters
+        ----------
+        root : str
+            Absolute path to the directory to watch.
+        exclude : list(str), optional
+            Names of the files or folders to ignore (empty list by default).
+        interval : float, optional
+            Interval between two scans, in seconds (1s by default).
+        '''
+        self.root = root
+        self.exclude = exclude
+        self.interval = interval
+        self.states = {}
+        self.last_scan = 0.
+
+    def fileno(self):
+        return None
+
+    def scan(self):
+        '''Scans the directory.
+
+        Returns
+        -------
+        list(str)
+            Relative paths of the files that changed since the last scan.
+        '''
+        self.last_scan = time.time()
+        _, files = scan_dir(self.root, self.exclude)
+        states = {f: _file_state(os.path.join(self.root, f)) for f in files}
+        changed = [f for f, state in states.items()
+                   if state is not None and self.states.get(f) != state]
+        self.states = states
+        return changed
+
+    def read(self):
+        '''Scans the directory if the interval is elapsed.
+
+        Returns
+        -------
+        list(str)
+            Relative paths of the files that changed.
+        '''
+        if time.time() - self.last_scan < self.interval:
+            return []
+        return self.scan()
+
+    def close(self):
+        pass
+
+
+class Watcher(object):
+
+    def __init__(self, processor, input_path, output_path, settle=SETTLE_TIME,
+                 move_to=None, delete=False, polling=False,
+                 interval=POLL_INTERVAL, **kwargs):
+        '''Watches a directory and encodes its files as they land in it (see
+        `Medusa.watch_dir`): the created and modified files are encoded once
+        they have not changed for a while, with the same processor (and
+        context) for all of them, but new per-call values (e.g. an IV) for
+        each encoding.
+
+        Parameters
+        ----------
+        processor : Medusa
+            Processor to encode the files with.
+        input_path : str
+            Absolute path to the directory to watch.
+        output_path : str
+            Absolute path to the directory to write the outputs to (with the
+            same relative paths).
+        settle : float, optional
+            Time without changes after which a file is considered complete,
+            in seconds (0.5s by default).
+        move_to : str, optional
+            If given, absolute path to the directory to move the encoded
+            sources to (with the same relative paths).
+        delete : bool, optional
+            If true, the encoded sources are deleted (false by default).
+        polling : bool, optional
+            If true, the directory is scanned periodically instead of being
+            watched with inotify (which is only used if available) (false by
+            default).
+        interval : float, optional
+            Interval between two scans, if polling, in seconds (1s by default).
+        kwargs : dict, optional
+            Additional processing params (override the processor's params).
+        '''
+        self.processor = processor
+        self.input_path = input_path
+        self.output_path = output_path
+        self.settle = settle
+        self.move_to = move_to
+        self.delete = delete
+        self.kwargs = kwargs
+        self.source = None
+        if not polling:
+            try:
+                self.source = InotifySource(input_path, processor.exclude)
+            except (OSError, AttributeError):
+                pass
+        if self.source is None:
+            self.source = PollSource(input_path, processor.exclude,
+                                     interval=interval)
+        # (files waiting to settle: last change time and state, and states of
+        # the encoded sources)
+        self.pending = {}
+        self.done = {}
+        self.n_processed = 0
+        self._wake_r, self._wake_w = os.pipe()
+
+    def _touch(self, rel_path):
+        state = _file_state(os.path.join(self.input_path, rel_path))
+        if state is None or self.done.get(rel_path) == state:
+            self.pending.pop(rel_path, None)
+            return
+        self.pending[rel_path] = (time.time(), state)
+
+    def _is_up_to_date(self, rel_path):
+        # (the outputs of a previous watch are kept if newer than their source)
+        try:
+            return os.path.getmtime(os.path.join(self.output_path, rel_path)) \
+                >= os.path.getmtime(os.path.join(self.input_path, rel_path))
+        except OSError:
+            return False
+
+    def _process(self, rel_path, state):
+        ipath = os.path.join(self.input_path, rel_path)
+        opath = os.path.join(self.output_path, rel_path)
+        os.makedirs(os.path.dirname(opath), exist_ok=True)
+        # (each encoding gets its own per-call context, recorded in its
+        # header)
+        ctx = self.processor.algo.new_context()
+        try:
+            self.processor.process_file(ipath, opath, 'encode',
+                                        header_ctx=ctx,
+                                        **dict(self.kwargs, **ctx))
+        except (OSError, ValueError) as e:
+            print('[Medusa - Warning] Could not encode "{}": {}'.format(
+                rel_path, e))
+            return
+        self.n_processed += 1
+        if self.move_to is not None:
+            dst = os.path.join(self.move_to, rel_path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.move(ipath, dst)
+        elif self.delete:
+            os.remove(ipath)
+        else:
+            self.done[rel_path] = state
+
+    def _process_settled(self):
+        # processes the settled files, and returns the time to wait for the
+        # next ones (None if there are none)
+        now = time.time()
+        timeout = None
+        for rel_path, (last_change, state) in sorted(self.pending.items()):
+            wait = last_change + self.settle - now
+            if wait <= 0:
+                current = _file_state(os.path.join(self.input_path, rel_path))
+                if current != state:
+                    # (changed without an event, e.g. polling)
+                    self._touch(rel_path)
+                    wait = self.settle
+                else:
+                    del self.pending[rel_path]
+                    if current is not None:
+                        self._process(rel_path, state)
+                    continue
+            timeout = wait if timeout is None else min(timeout, wait)
+        return timeout
+
+    def run(self):
+        '''Watches the directory until stopped (see `stop`): the files it holds
+        are encoded first (unless their outputs are up to date).'''
+        for rel_path in self.source.scan():
+            if not self._is_up_to_date(rel_path):
+                self._touch(rel_path)
+        fds = [self._wake_r]
+        if self.source.fileno() is not None:
+            fds.append(self.source.fileno())
+        try:
+            while True:
+                timeout = self._process_settled()
+                if isinstance(self.source, PollSource):
+                    timeout = self.source.interval if timeout is None \
+                        else min(timeout, self.source.interval)
+                # (blocks without using the CPU until something happens)
+                ready, _, _ = select.select(fds, [], [], timeout)
+                if self._wake_r in ready:
+                    return
+                for rel_path in self.source.read():
+                    self._touch(rel_path)
+        finally:
+            self.source.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+
+    def stop(self):
+        '''Stops the watch (from another thread or a signal handler).'''
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
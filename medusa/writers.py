@@ -0,0 +1,487 @@
+# Copyright 2020 Mina Pêcheux (mina.pecheux@gmail.com)
+# ---------------------------
+# Distributed under the MIT License:
+# ==================================
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+# [Medusa] Mini Encoding/Decoding Utility with Simple Algorithms
+# ------------------------------------------------------------------------------
+
+__author__ = 'Mina Pêcheux'
+__copyright__ = 'Copyright 2020, Mina Pêcheux'
+
+import errno
+import hashlib
+import os
+import tempfile
+import threading
+
+DURABILITY_POLICIES = ['none', 'file', 'batch']
+
+
+def fsync_dir(path):
+    '''Flushes a directory entry to disk (so that renames in it are durable).
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# errors of the in-kernel copies that mean another method should be tried
+COPY_FALLBACK_ERRORS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSUP,
+                        errno.EOPNOTSUPP, errno.EBADF)
+
+
+def copy_fd(src_fd, dst_fd, buffer_size=1024 * 1024, on_copy=None):
+    '''Copies the rest of a file to another one, from their current positions,
+    in the kernel when possible (with `os.copy_file_range`, or else
+    `os.sendfile`), so that the data never goes through Python; falls back to
+    a buffered copy.
+
+    Parameters
+    ----------
+    src_fd : int
+        File descriptor to read from.
+    dst_fd : int
+        File descriptor to write to.
+    buffer_size : int, optional
+        Maximum size of each copy (1MB by default).
+    on_copy : callable, optional
+        Function called with the size of each copy (e.g. to throttle them).
+
+    Returns
+    -------
+    int
+        Number of bytes copied.
+    '''
+    size = 0
+    for method in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, method):
+            continue
+        try:
+            while True:
+                if method == 'copy_file_range':
+                    n = os.copy_file_range(src_fd, dst_fd, buffer_size)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, None, buffer_size)
+                if n == 0:
+                    return size
+                size += n
+                if on_copy is not None:
+                    on_copy(n)
+        except OSError as e:
+            # (nothing is copied by a call that fails, so the next method
+            # starts where this one stopped)
+            if e.errno not in COPY_FALLBACK_ERRORS:
+                raise
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = os.readv(src_fd, [buffer])
+        if n == 0:
+            return size
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, view[written:n])
+        size += n
+        if on_copy is not None:
+            on_copy(n)
+
+
+# suffix of the backups of the bytes overwritten by `patch_file`
+PATCH_SUFFIX = '.medusa-patch'
+
+
+def create_temp_file(dir_path, prefix):
+    '''Creates a new temporary file, with the same permissions as a file
+    created with `open()` (unlike `tempfile.mkstemp`, that only lets its
+    owner read it): the umask is applied by the system, instead of being
+    read by changing it for the whole process.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory of the file.
+    prefix : str
+        Prefix of the file name.
+
+    Returns
+    -------
+    tuple(int, str)
+        File descriptor (open for reading and writing) and path of the file.
+    '''
+    while True:
+        path = os.path.join(dir_path, '{}{}.tmp'.format(
+            prefix, os.urandom(6).hex()))
+        try:
+            return os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL,
+                           0o666), path
+        except FileExistsError:
+            continue
+
+
+def patch_path(path):
+    '''Gets the path to the backup of a file patch (see `patch_file`).'''
+    return os.path.join(os.path.dirname(path),
+                        '.{}{}'.format(os.path.basename(path), PATCH_SUFFIX))
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while len(view) > 0:
+        n = os.pwrite(fd, view, offset)
+        view, offset = view[n:], offset + n
+
+
+def recover_patch(path):
+    '''Restores the bytes of a file that an interrupted `patch_file` was
+    overwriting, if any (so that the file is left as it was before).
+
+    Parameters
+    ----------
+    path : str
+        Path to the patched file.
+
+    Returns
+    -------
+    bool
+        Whether a patch was undone.
+    '''
+    backup = patch_path(path)
+    if not os.path.exists(backup):
+        return False
+    with open(backup, 'rb') as FILE:
+        data = FILE.read()
+    offset = int.from_bytes(data[:8], 'big')
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        _pwrite_all(fd, data[8:], offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.unlink(backup)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+    return True
+
+
+def patch_file(path, data, offset=0):
+    '''Overwrites some bytes of a file in place, without tearing them: the
+    old bytes are first saved to a backup next to the file (written
+    atomically and fsynced), so that if the write is interrupted,
+    `recover_patch` puts them back. The backup is removed once the new bytes
+    are on disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    data : bytes
+        New bytes.
+    offset : int, optional
+        Position of the bytes in the file (0 by default).
+    '''
+    backup = patch_path(path)
+    dir_path = os.path.dirname(os.path.abspath(path))
+    fd = os.open(path, os.O_RDWR)
+    try:
+        old = os.pread(fd, len(data), offset)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp',
+                                            prefix=os.path.basename(backup))
+        try:
+            os.write(tmp_fd, offset.to_bytes(8, 'big') + old)
+            os.fsync(tmp_fd)
+        finally:
+            os.close(tmp_fd)
+        os.replace(tmp_path, backup)
+        fsync_dir(dir_path)
+        _pwrite_all(fd, data, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.unlink(backup)
+    fsync_dir(dir_path)
+
+
+class AtomicFile(object):
+
+    def __init__(self, writer, path):
+        '''Output file that is written to a temporary file in the destination
+        directory and only renamed to its final path once complete, so that
+        an interrupted run never leaves a truncated output behind. Use it as
+        a context manager (see `OutputWriter.open`).
+
+        Parameters
+        ----------
+        writer : OutputWriter
+            Writer that owns the buffer and the durability policy.
+        path : str
+            Final path of the file.
+        '''
+        self.writer = writer
+        self.path = path
+        self.dir_path = os.path.dirname(os.path.abspath(path))
+        self.fd, self.tmp_path = create_temp_file(
+            self.dir_path, '.{}.'.format(os.path.basename(path)))
+        self.size = 0
+        self.hash = hashlib.sha256() if writer.on_commit is not None else None
+
+    def _write_all(self, data):
+        view = memoryview(data)
+        while len(view) > 0:
+            n = os.write(self.fd, view)
+            view = view[n:]
+
+    def _flush_buffer(self):
+        buffer = self.writer.buffer
+        if len(buffer) > 0:
+            self._write_all(buffer)
+            del buffer[:]
+
+    def write(self, data):
+        '''Writes some data (str contents are encoded in UTF-8).
+
+        Parameters
+        ----------
+        data : str or bytes
+            Data to write.
+        '''
+        if isinstance(data, str):
+            data = data.encode()
+        self.size += len(data)
+        if self.hash is not None:
+            self.hash.update(data)
+        buffer = self.writer.buffer
+        if len(buffer) + len(data) <= self.writer.buffer_size:
+            buffer += data
+            return
+        self._flush_buffer()
+        if len(data) >= self.writer.buffer_size:
+            # large writes skip the buffer copy
+            self._write_all(data)
+        else:
+            buffer += data
+
+    def copy_from(self, path, on_copy=None):
+        '''Writes the content of a file as is, copied in the kernel when
+        possible (see `copy_fd`).
+
+        Parameters
+        ----------
+        path : str
+            Path to the file to copy.
+        on_copy : callable, optional
+            Function called with the size of each copied part.
+        '''
+        self._flush_buffer()
+        with open(path, 'rb') as FILE:
+            if self.hash is not None:
+                # (the digest of the output needs its data)
+                for chunk in iter(lambda: FILE.read(self.writer.buffer_size), b''):
+                    self.write(chunk)
+                    if on_copy is not None:
+                        on_copy(len(chunk))
+                return
+            self.size += copy_fd(FILE.fileno(), self.fd,
+                                 buffer_size=self.writer.buffer_size,
+                                 on_copy=on_copy)
+
+    def commit(self):
+        '''Completes the file: it is renamed to its final path (immediately or
+        with the next batch, depending on the durability policy).'''
+        self._flush_buffer()
+        if self.writer.durability == 'file':
+            os.fsync(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        if self.writer.durability == 'batch':
+            self.writer._defer(self)
+        else:
+            os.replace(self.tmp_path, self.path)
+            if self.writer.durability == 'file':
+                fsync_dir(self.dir_path)
+            self.writer._committed(self)
+
+    def abort(self):
+        '''Drops the file (its final path is left untouched).'''
+        del self.writer.buffer[:]
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class OutputWriter(object):
+
+    def __init__(self, durability='none', buffer_size=1024 * 1024,
+                 batch_size=256, on_commit=None):
+        '''Writing layer for the processed outputs: files are written through
+        a large reusable buffer, into temporary files that are atomically
+        renamed on success.
+
+        Parameters
+        ----------
+        durability : str, optional
+            Durability policy: "none" (no fsync), "file" (fsync each file
+            and its directory before moving on) or "batch" (renames are
+            deferred and done by batches per directory, with a single
+            directory fsync per batch) ("none" by default).
+        buffer_size : int, optional
+            Size of the write buffer, in bytes (1MB by default).
+        batch_size : int, optional
+            Maximum number of pending files per directory, for the "batch"
+            policy (256 by default).
+        on_commit : callable, optional
+            Function called with each output path and the hex SHA-256 of its
+            content once it is in place.
+
+        A writer can be shared by several threads: each thread gets its own
+        write buffer.
+        '''
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError('Invalid durability policy: "{}"'.format(durability))
+        self.durability = durability
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def buffer(self):
+        '''Write buffer of the current thread.'''
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray()
+        return buffer
+
+    def open(self, path):
+        '''Opens an output file for writing.
+
+        Parameters
+        ----------
+        path : str
+            Final path of the file.
+
+        Returns
+        -------
+        AtomicFile
+            File to write to (commits on a successful exit of the context).
+        '''
+        return AtomicFile(self, path)
+
+    def _committed(self, f):
+        if self.on_commit is not None:
+            self.on_commit(f.path, f.hash.hexdigest() if f.hash else None)
+
+    def _defer(self, f):
+        with self._lock:
+            pending = self._pending.setdefault(f.dir_path, [])
+            pending.append(f)
+            full = len(pending) >= self.batch_size
+        if full:
+            self.flush(f.dir_path)
+
+    def flush(self, dir_path=None):
+        '''Commits the pending files of a directory (or of all directories),
+        for the "batch" durability policy.
+
+        Parameters
+        ----------
+        dir_path : str, optional
+            Directory to flush (all directories if None).
+        '''
+        with self._lock:
+            if dir_path is None:
+                dir_paths = list(self._pending.keys())
+            else:
+                dir_paths = [os.path.abspath(dir_path)]
+            batches = [(path, self._pending.pop(path, []))
+                       for path in dir_paths]
+
+        for path, pending in batches:
+            if len(pending) == 0:
+                continue
+            # the data of the whole batch has had time to be written back, so
+            # these syncs are mostly no-ops compared to one sync per write
+            for f in pending:
+                fd = os.open(f.tmp_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            for f in pending:
+                os.replace(f.tmp_path, f.path)
+            fsync_dir(path)
+            for f in pending:
+                self._committed(f)
+
+    def discard(self):
+        '''Drops all pending files (e.g. after an error).'''
+        with self._lock:
+            batches, self._pending = self._pending, {}
+        for pending in batches.values():
+            for f in pending:
+                if os.path.exists(f.tmp_path):
+                    os.unlink(f.tmp_path)
+
+
+class StreamWriter(object):
+
+    def __init__(self, f):
+        '''Writes processed data to an already open stream (e.g. the standard
+        output), with the same interface as an `AtomicFile`.
+
+        Parameters
+        ----------
+        f : file-like
+            Binary stream, or text stream with a binary `buffer`.
+        '''
+        self.f = getattr(f, 'buffer', f)
+        self.size = 0
+
+    def write(self, data):
+        '''Writes some data (str contents are encoded in UTF-8).'''
+        if isinstance(data, str):
+            data = data.encode()
+        self.size += len(data)
+        self.f.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.f.flush()
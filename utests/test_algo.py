@@ -1,6 +1,8 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 
 from medusa import Medusa, MedusaError
+from medusa import parallel as parallel_module
 
 
 class TestAlgo():
@@ -67,3 +69,47 @@ class TestAlgo():
 
         assert decoded == text
         assert encoded != text
+
+    @pytest.mark.parametrize('shared_memory', [True, False])
+    def test_parallel_segments(self, shared_memory, monkeypatch):
+        text = ''.join(chr(x % 256) for x in range(5000))
+        if not shared_memory:
+            # (as before Python 3.8)
+            monkeypatch.setattr(parallel_module, 'SharedMemory', None)
+
+        for algo, params in [
+                ('caesar', dict(shift=7)),
+                ('vigenere', dict(key='key', complement_key='complement_key'))]:
+            sequential = Medusa(algo=algo, params=params)
+            parallel = Medusa(algo=algo, params=params, workers=3,
+                              segment_size=1000)
+
+            encoded = parallel.encode(text)
+            assert encoded == sequential.encode(text)
+            assert parallel.decode(encoded) == text
+
+    @pytest.mark.parametrize('algo,params', [
+        ('vigenere', dict(key='key', complement_key='complement_key')),
+        ('aes', dict(password='password')),
+        ('rsa', dict()),
+    ])
+    def test_shared_instance(self, algo, params):
+        processor = Medusa(algo=algo, params=params)
+        texts = ['hello world {}'.format(i) for i in range(32)]
+
+        def roundtrip(text):
+            encoded, ctx = processor.encode(text, return_context=True)
+            decoded, _ = processor.decode(encoded, return_context=True, **ctx)
+            return encoded, ctx, decoded
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(roundtrip, texts))
+
+        assert [decoded for _, _, decoded in results] == texts
+        if algo == 'aes':
+            # each call gets its own nonce
+            assert len(set(ctx['iv'] for _, ctx, _ in results)) == len(texts)
+            # and the params given with a call are not returned
+            _, ctx = processor.encode(texts[0], return_context=True,
+                                      password='other')
+            assert 'password' not in ctx
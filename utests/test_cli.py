@@ -1,5 +1,8 @@
 import os
+import re
 import shutil
+import subprocess
+import sys
 import getpass
 
 from medusa import medusa
@@ -54,13 +57,13 @@ class TestCLI():
 
         with open(input_path, 'r') as FILE:
             text = FILE.read()
-        with open(output_path, 'r') as FILE:
+        with open(output_path, 'rb') as FILE:
             encoded = FILE.read()
         with open(reencode_path, 'r') as FILE:
             decoded = FILE.read()
 
         assert decoded == text
-        assert encoded != text
+        assert encoded != text.encode()
 
     def test_cli_dir(self):
         input_path = os.path.join(INPUT_DIR, 'input_dir')
@@ -84,13 +87,13 @@ class TestCLI():
         for f in os.listdir(input_path):
             with open(os.path.join(input_path, f), 'r') as FILE:
                 text = FILE.read()
-            with open(os.path.join(output_path, f), 'r') as FILE:
+            with open(os.path.join(output_path, f), 'rb') as FILE:
                 encoded = FILE.read()
             with open(os.path.join(reencode_path, f), 'r') as FILE:
                 decoded = FILE.read()
 
             assert decoded == text
-            assert encoded != text
+            assert encoded != text.encode()
 
     def test_config(self):
         config_path = os.path.join(os.path.dirname(__file__), '.medusa')
@@ -110,10 +113,39 @@ class TestCLI():
             os.path.dirname(__file__), args_decode['output'])
         with open(input_path, 'r') as FILE:
             text = FILE.read()
-        with open(output_path, 'r') as FILE:
+        with open(output_path, 'rb') as FILE:
             encoded = FILE.read()
         with open(reencode_path, 'r') as FILE:
             decoded = FILE.read()
 
         assert decoded == text
-        assert encoded != text
+        assert encoded != text.encode()
+
+    def test_cli_pipe(self):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        cmd = [sys.executable, '-c', 'from medusa.medusa import main; main()']
+        env = dict(os.environ, MEDUSA_PASSWORD='medusa',
+                   PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+
+        with open(input_path, 'rb') as FILE:
+            text = FILE.read()
+        encoded = subprocess.run(
+            cmd + ['-e', 'cli', '-a', 'aes', '-i', '-', '-o', '-'],
+            input=text, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, check=True)
+        # pass the IV and salt printed on stderr through a file descriptor
+        params = dict(re.findall(r'\[\s*(\w+)\] (\S+)',
+                                 encoded.stderr.decode()))
+        r, w = os.pipe()
+        os.write(w, 'iv={}\nsalt={}\n'.format(
+            params['Iv'], params['Salt']).encode())
+        os.close(w)
+        decoded = subprocess.run(
+            cmd + ['-d', 'cli', '-a', 'aes', '-i', '-', '-o', '-',
+                   '--params-fd', str(r)],
+            input=encoded.stdout, env=env, stdout=subprocess.PIPE,
+            pass_fds=(r,), check=True)
+        os.close(r)
+
+        assert decoded.stdout == text
+        assert encoded.stdout != text
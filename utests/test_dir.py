@@ -1,9 +1,20 @@
+import io
+import json
 import os
 import pytest
 import subprocess
 import shutil
+import sys
+import tarfile
+import threading
+import time
 
-from medusa import Medusa
+from medusa import Medusa, MedusaError, journal, scheduler
+from medusa.algorithms.aes import derive_key_from_pwd
+from medusa.dedup import ChunkStore, hkdf
+from medusa.lease import LeaseDir, batch_id
+from medusa.scheduler import RunStats, plan_tasks
+from medusa.verify import verify_dir
 
 INPUT_DIR = os.path.join(os.path.dirname(__file__), 'data')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
@@ -47,11 +58,638 @@ class TestDir():
             with open(os.path.join(input_path, f), 'r') as FILE:
                 input_content = FILE.read()
 
-            with open(os.path.join(output_path, f), 'r') as FILE:
+            with open(os.path.join(output_path, f), 'rb') as FILE:
                 output_content = FILE.read()
 
             with open(os.path.join(reencode_path, f), 'r') as FILE:
                 reencode_content = FILE.read()
 
             assert input_content == reencode_content
+            assert input_content.encode() != output_content
+
+    def test_resume(self):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'resumed_dir')
+        reencode_path = os.path.join(OUTPUT_DIR, 'resumed_new_dir')
+
+        # interrupt a run after its first file
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           journal=True)
+        process_file = processor.process_file
+        processed = []
+
+        def interrupted(*args, **kwargs):
+            if len(processed) == 1:
+                raise KeyboardInterrupt()
+            processed.append(args[0])
+            process_file(*args, **kwargs)
+
+        processor.process_file = interrupted
+        with pytest.raises(KeyboardInterrupt):
+            processor.encode_dir(input_path, output_path)
+        assert os.path.exists(os.path.join(output_path, '.medusa-journal'))
+
+        # resume it with a new processor: only the remaining file is processed
+        # and the context of the first run is used (and returned)
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        process_file = processor.process_file
+        resumed = []
+
+        def tracked(*args, **kwargs):
+            resumed.append(args[0])
+            process_file(*args, **kwargs)
+
+        processor.process_file = tracked
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    resume=True)
+        assert len(resumed) == len(os.listdir(input_path)) - 1
+        assert processed[0] not in resumed
+        assert not os.path.exists(os.path.join(output_path, '.medusa-journal'))
+
+        processor.process_dir(output_path, reencode_path, 'decode',
+                              iv=ctx['iv'], salt=ctx['salt'])
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'r') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, f), 'r') as FILE:
+                reencode_content = FILE.read()
+            assert input_content == reencode_content
+
+    def test_resume_changed_output(self):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'resumed_changed_dir')
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           journal=True)
+        process_file = processor.process_file
+        processed = []
+
+        def interrupted(*args, **kwargs):
+            if len(processed) == 1:
+                raise KeyboardInterrupt()
+            processed.append(args[1])
+            process_file(*args, **kwargs)
+
+        processor.process_file = interrupted
+        with pytest.raises(KeyboardInterrupt):
+            processor.encode_dir(input_path, output_path)
+
+        # a completed output that changed since is processed again
+        with open(processed[0], 'r+b') as FILE:
+            FILE.truncate(4)
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    resume=True)
+        decoded_path = os.path.join(OUTPUT_DIR, 'resumed_changed_new_dir')
+        processor.process_dir(output_path, decoded_path, 'decode', **ctx)
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(decoded_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    def test_journal_torn(self):
+        path = os.path.join(OUTPUT_DIR, 'torn_journal')
+        j = journal.Journal(path).open({'iv': 1})
+        j.record('a.txt', 'digest_a')
+        j.close()
+        # (the run was killed while writing a record)
+        with open(path, 'a') as FILE:
+            FILE.write('{"path": "b.t')
+
+        # the new records are not glued to the incomplete one
+        j = journal.Journal(path).open({'iv': 1}, resume=True)
+        j.record('c.txt', 'digest_c')
+        j.record('d.txt', 'digest_d')
+        j.close()
+        assert journal.Journal(path).load() == (
+            {'iv': 1}, {'a.txt': 'digest_a', 'c.txt': 'digest_c',
+                        'd.txt': 'digest_d'})
+
+    def test_journal_secrets(self):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'journal_rsa_dir')
+        keys = Medusa(algo='rsa', params={}).get_context()
+
+        # the private key is not journaled: it must be given to journal a run
+        with pytest.raises(MedusaError):
+            Medusa(algo='rsa', params={}, journal=True,
+                   exit_on_error=False).encode_dir(input_path, output_path)
+
+        processor = Medusa(algo='rsa', params=dict(keys), journal=True)
+
+        def interrupted(*args, **kwargs):
+            with open(os.path.join(output_path, '.medusa-journal'), 'r') as FILE:
+                journal = FILE.read()
+            assert keys['d'] not in journal and keys['n'] in journal
+            raise KeyboardInterrupt()
+
+        processor.process_file = interrupted
+        with pytest.raises(KeyboardInterrupt):
+            processor.encode_dir(input_path, output_path)
+
+        # and again to resume it
+        with pytest.raises(MedusaError):
+            Medusa(algo='rsa', params={}, exit_on_error=False).process_dir(
+                input_path, output_path, 'encode', resume=True)
+        other_keys = Medusa(algo='rsa', params={}).get_context()
+        with pytest.raises(MedusaError):
+            Medusa(algo='rsa', params=dict(other_keys),
+                   exit_on_error=False).process_dir(
+                input_path, output_path, 'encode', resume=True)
+        processor = Medusa(algo='rsa', params=dict(keys))
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    resume=True)
+        assert ctx['d'] == keys['d']
+        decoded_path = os.path.join(OUTPUT_DIR, 'journal_rsa_new_dir')
+        processor.process_dir(output_path, decoded_path, 'decode')
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(decoded_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    @pytest.mark.parametrize('algo,params', [
+        ('caesar', dict(shift=1)),
+        ('aes', dict(password='password')),
+    ])
+    def test_dedup(self, algo, params):
+        input_path = os.path.join(OUTPUT_DIR, 'dedup_input')
+        output_path = os.path.join(OUTPUT_DIR, 'dedup_output_' + algo)
+        reencode_path = os.path.join(OUTPUT_DIR, 'dedup_new_' + algo)
+        os.makedirs(os.path.join(input_path, 'sub'), exist_ok=True)
+        content = os.urandom(100 * 1024)
+        for name in ['a.bin', 'b.bin', os.path.join('sub', 'c.bin')]:
+            with open(os.path.join(input_path, name), 'wb') as FILE:
+                FILE.write(content)
+        with open(os.path.join(input_path, 'd.bin'), 'wb') as FILE:
+            FILE.write(content[:50000] + b'other' + content[50000:])
+
+        processor = Medusa(algo=algo, params=params, dedup=True)
+        processor.encode_dir(input_path, output_path)
+
+        # the identical files are only stored once
+        stored = 0
+        for root, _, files in os.walk(os.path.join(output_path, '.medusa-chunks')):
+            stored += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        assert len(content) <= stored < 2 * len(content)
+
+        processor.process_dir(output_path, reencode_path, 'decode',
+                              **processor.get_context())
+        for name in ['a.bin', 'b.bin', os.path.join('sub', 'c.bin'), 'd.bin']:
+            with open(os.path.join(input_path, name), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, name), 'rb') as FILE:
+                reencode_content = FILE.read()
+            assert input_content == reencode_content
+
+    def test_dedup_index_key(self):
+        # the chunk ids are keyed with a subkey of the derived key, never
+        # with the password itself
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           kdf='pbkdf2:1000')
+        params = processor._get_params('encode', **processor.get_context())
+        store = ChunkStore(OUTPUT_DIR, processor.algo)
+        derived = derive_key_from_pwd('password', params['salt'],
+                                      'pbkdf2:1000')
+        assert store.index_key(params) == hkdf(derived, b'medusa-dedup')
+        assert store.index_key(dict(params, password='other')) != \
+            store.index_key(params)
+
+    @pytest.mark.parametrize('algo,params,compression', [
+        ('vigenere', dict(key='key', complement_key='complement_key'), None),
+        ('aes', dict(password='password'), None),
+        ('aes', dict(password='password'), 'zlib'),
+    ])
+    def test_tar(self, algo, params, compression):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        reencode_path = os.path.join(
+            OUTPUT_DIR, 'tar_new_{}_{}'.format(algo, compression))
+
+        processor = Medusa(algo=algo, params=params, compression=compression,
+                           chunk_size=100)
+        stream = io.BytesIO()
+        processor.encode_tar(input_path, stream)
+        stream.seek(0)
+        with tarfile.open(fileobj=stream, mode='r') as tar:
+            assert sorted(tar.getnames()) == sorted(os.listdir(input_path))
+        stream.seek(0)
+
+        processor.decode_tar(stream, reencode_path, **processor.get_context())
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, f), 'rb') as FILE:
+                reencode_content = FILE.read()
+            assert input_content == reencode_content
+
+    def test_scheduler_plan(self):
+        sizes = {'big': 100, 'medium': 30, 'huge': 1000}
+        sizes.update({'small{}'.format(i): 1 for i in range(10)})
+        tasks = plan_tasks(list(sizes), sizes, workers=2, segment_size=300,
+                           splittable=lambda f: True, batch_size=10,
+                           batch_files=4, split_size=500)
+
+        # largest first, the huge file is split and the small files batched
+        assert [t.size for t in tasks] == sorted([t.size for t in tasks],
+                                                 reverse=True)
+        assert [(t.start, t.end) for t in tasks if t.files == ['huge']] == \
+            [(0, 250), (250, 500), (500, 750), (750, 1000)]
+        batches = [t.files for t in tasks if len(t.files) > 1]
+        assert sorted(sum(batches, [])) == sorted(
+            'small{}'.format(i) for i in range(10))
+        assert all(len(b) <= 4 for b in batches)
+
+    @pytest.mark.parametrize('algo,params', [
+        ('vigenere', dict(key='key', complement_key='complement_key')),
+        ('aes', dict(password='password')),
+    ])
+    def test_scheduled(self, algo, params, monkeypatch):
+        input_path = os.path.join(OUTPUT_DIR, 'scheduled_input')
+        output_path = os.path.join(OUTPUT_DIR, 'scheduled_output_' + algo)
+        reencode_path = os.path.join(OUTPUT_DIR, 'scheduled_new_' + algo)
+        os.makedirs(os.path.join(input_path, 'sub'), exist_ok=True)
+        names = ['big.txt'] + [os.path.join('sub', 'small{}.txt'.format(i))
+                               for i in range(8)]
+        for i, name in enumerate(names):
+            with open(os.path.join(input_path, name), 'w') as FILE:
+                FILE.write('hello world {}\n'.format(i) * (5000 if i == 0 else 3))
+
+        monkeypatch.setattr(scheduler, 'BATCH_SIZE', 1000)
+        monkeypatch.setattr(scheduler, 'SPLIT_SIZE', 10000)
+        processor = Medusa(algo=algo, params=params, workers=2,
+                           segment_size=20000, journal=True)
+        stats = RunStats(2)
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    stats=stats)
+        # (only AES outputs can be split)
+        assert len(stats.tasks) == (5 if algo == 'aes' else 2)
+        assert 0 < stats.summary()['utilization']
+        assert not os.path.exists(os.path.join(output_path, '.medusa-journal'))
+
+        kwargs = ctx if algo == 'aes' else {}
+        processor.process_dir(output_path, reencode_path, 'decode', **kwargs)
+        for name in names:
+            with open(os.path.join(input_path, name), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(output_path, name), 'rb') as FILE:
+                output_content = FILE.read()
+            with open(os.path.join(reencode_path, name), 'rb') as FILE:
+                reencode_content = FILE.read()
+            assert input_content == reencode_content
             assert input_content != output_content
+
+    def test_scheduled_resume(self, monkeypatch):
+        input_path = os.path.join(OUTPUT_DIR, 'scheduled_resume_input')
+        output_path = os.path.join(OUTPUT_DIR, 'scheduled_resume_output')
+        os.makedirs(input_path, exist_ok=True)
+        with open(os.path.join(input_path, 'big.bin'), 'wb') as FILE:
+            FILE.write(os.urandom(100000))
+        with open(os.path.join(input_path, 'small.bin'), 'wb') as FILE:
+            FILE.write(os.urandom(100))
+
+        # the run is interrupted once the files (one of them segmented) are
+        # committed
+        close = journal.Journal.close
+
+        def interrupted(self, remove=False):
+            close(self)
+            raise KeyboardInterrupt()
+
+        monkeypatch.setattr(scheduler, 'SPLIT_SIZE', 10000)
+        monkeypatch.setattr(journal.Journal, 'close', interrupted)
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           workers=2, segment_size=20000, journal=True)
+        with pytest.raises(KeyboardInterrupt):
+            processor.encode_dir(input_path, output_path)
+        monkeypatch.setattr(journal.Journal, 'close', close)
+
+        # so none of them is processed again when resuming
+        process_file = processor.process_file
+        resumed = []
+
+        def tracked(*args, **kwargs):
+            resumed.append(args[0])
+            process_file(*args, **kwargs)
+
+        processor.process_file = tracked
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    resume=True)
+        assert resumed == []
+        decoded_path = os.path.join(OUTPUT_DIR, 'scheduled_resume_new')
+        processor.process_dir(output_path, decoded_path, 'decode', **ctx)
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(decoded_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    def test_distributed(self):
+        input_path = os.path.join(OUTPUT_DIR, 'distributed_input')
+        output_path = os.path.join(OUTPUT_DIR, 'distributed_output')
+        reencode_path = os.path.join(OUTPUT_DIR, 'distributed_new')
+        work_dir = os.path.join(OUTPUT_DIR, 'distributed_work')
+        os.makedirs(input_path, exist_ok=True)
+        names = ['file{}.bin'.format(i) for i in range(6)]
+        for name in names:
+            with open(os.path.join(input_path, name), 'wb') as FILE:
+                FILE.write(os.urandom(1100 * 1024))
+
+        # a node died while holding the lease of the first batch
+        sizes = {name: 1100 * 1024 for name in names}
+        batches = [t.files for t in plan_tasks(names, sizes, 1, 0)]
+        assert len(batches) == len(names)
+        os.makedirs(work_dir, exist_ok=True)
+        with open(os.path.join(work_dir, batch_id(batches[0]) + '.lease'), 'w') as FILE:
+            json.dump({'owner': 'dead', 'expires': time.time() - 1}, FILE)
+
+        # several processes share the run
+        script = ('from medusa import Medusa; '
+                  'Medusa(algo="aes", params=dict(password="password"))'
+                  '.process_dir({!r}, {!r}, "encode", work_dir={!r})'.format(
+                      input_path, output_path, work_dir))
+        env = dict(os.environ,
+                   PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+        nodes = [subprocess.Popen([sys.executable, '-c', script], env=env,
+                                  stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+                 for _ in range(3)]
+        assert all(node.wait() == 0 for node in nodes)
+        for batch in batches:
+            assert os.path.exists(os.path.join(work_dir, batch_id(batch) + '.done'))
+            assert not os.path.exists(os.path.join(work_dir, batch_id(batch) + '.lease'))
+
+        # all the outputs use the shared context
+        with open(os.path.join(work_dir, 'context.json'), 'r') as FILE:
+            ctx = json.load(FILE)
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        processor.process_dir(output_path, reencode_path, 'decode', **ctx)
+        for name in names:
+            with open(os.path.join(input_path, name), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, name), 'rb') as FILE:
+                reencode_content = FILE.read()
+            assert input_content == reencode_content
+
+    def test_distributed_secrets(self):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'distributed_rsa_output')
+        reencode_path = os.path.join(OUTPUT_DIR, 'distributed_rsa_new')
+        work_dir = os.path.join(OUTPUT_DIR, 'distributed_rsa_work')
+        keys = Medusa(algo='rsa', params={}).get_context()
+
+        # the private key is not shared: each process needs it in its params
+        with pytest.raises(MedusaError):
+            Medusa(algo='rsa', params={}, exit_on_error=False).process_dir(
+                input_path, output_path, 'encode', work_dir=work_dir)
+        processor = Medusa(algo='rsa', params=dict(keys))
+        ctx = processor.process_dir(input_path, output_path, 'encode',
+                                    work_dir=work_dir)
+        assert ctx['d'] == keys['d']
+        with open(os.path.join(work_dir, 'context.json'), 'r') as FILE:
+            shared = json.load(FILE)
+        assert 'd' not in shared and shared['n'] == keys['n']
+        other_keys = Medusa(algo='rsa', params={}).get_context()
+        with pytest.raises(MedusaError):
+            Medusa(algo='rsa', params=dict(other_keys),
+                   exit_on_error=False).process_dir(
+                input_path, output_path, 'encode', work_dir=work_dir)
+
+        processor.process_dir(output_path, reencode_path, 'decode')
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    def test_distributed_reuse(self):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'distributed_reuse_output')
+        reencode_path = os.path.join(OUTPUT_DIR, 'distributed_reuse_new')
+        work_dir = os.path.join(OUTPUT_DIR, 'distributed_reuse_work')
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           exit_on_error=False)
+        processor.process_dir(input_path, output_path, 'encode',
+                              work_dir=work_dir)
+        with open(os.path.join(work_dir, 'context.json'), 'r') as FILE:
+            ctx = json.load(FILE)
+
+        # the work directory of a run is refused for another one, unless it
+        # is reset
+        with pytest.raises(MedusaError):
+            processor.process_dir(output_path, reencode_path, 'decode',
+                                  work_dir=work_dir, **ctx)
+        processor.process_dir(output_path, reencode_path, 'decode',
+                              work_dir=work_dir, reset_work_dir=True, **ctx)
+        for f in os.listdir(input_path):
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(reencode_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+        # (and a reset run does not reuse the context of the previous one)
+        Medusa(algo='aes', params=dict(password='password')).process_dir(
+            input_path, output_path, 'encode', work_dir=work_dir,
+            reset_work_dir=True)
+        with open(os.path.join(work_dir, 'context.json'), 'r') as FILE:
+            assert json.load(FILE)['iv'] != ctx['iv']
+
+    def test_lease_renew(self):
+        work_dir = os.path.join(OUTPUT_DIR, 'lease_work')
+        leases = LeaseDir(work_dir, owner='node', ttl=60)
+        assert leases.claim('batch')
+        assert not LeaseDir(work_dir, owner='other').claim('batch')
+        assert leases.renew('batch')
+
+        # a lease another node took over is given up
+        lease_path = os.path.join(work_dir, 'batch.lease')
+        with open(lease_path, 'w') as FILE:
+            json.dump({'owner': 'other', 'expires': time.time() + 60}, FILE)
+        assert not leases.renew('batch') and 'batch' not in leases.held
+
+        # and so is a lease about to expire (without overwriting it, since
+        # another node may be taking it over)
+        os.unlink(lease_path)
+        assert leases.claim('batch')
+        record = {'owner': 'node', 'expires': time.time() + 1}
+        with open(lease_path, 'w') as FILE:
+            json.dump(record, FILE)
+        assert not leases.renew('batch') and 'batch' not in leases.held
+        with open(lease_path, 'r') as FILE:
+            assert json.load(FILE) == record
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_verify(self, workers):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        output_path = os.path.join(OUTPUT_DIR, 'verify_output_{}'.format(workers))
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           checksum=True)
+        ctx = processor.process_dir(input_path, output_path, 'encode')
+
+        files = sorted(os.listdir(output_path))
+        with open(os.path.join(output_path, files[0]), 'r+b') as FILE:
+            FILE.seek(-50, os.SEEK_END)
+            byte = FILE.read(1)
+            FILE.seek(-50, os.SEEK_END)
+            FILE.write(bytes([byte[0] ^ 1]))
+        with open(os.path.join(output_path, 'plain.txt'), 'w') as FILE:
+            FILE.write('not encoded')
+
+        # (no key is needed)
+        reports = verify_dir(output_path, workers=workers)
+        assert reports[files[0]][0] == 'corrupted'
+        assert reports['plain.txt'][0] == 'unchecked'
+        assert all(reports[f][0] == 'ok' for f in files[1:])
+
+        # decoding checks the content too
+        with pytest.raises(ValueError):
+            processor.process_file(os.path.join(output_path, files[0]),
+                                   os.path.join(OUTPUT_DIR, 'verify_corrupted'),
+                                   'decode', **ctx)
+
+    @pytest.mark.parametrize('symlinks', ['follow', 'preserve', 'skip'])
+    def test_links(self, symlinks):
+        input_path = os.path.join(OUTPUT_DIR, 'links_input')
+        if not os.path.exists(input_path):
+            shutil.copytree(os.path.join(INPUT_DIR, 'input_dir'), input_path)
+            f = sorted(os.listdir(input_path))[0]
+            os.link(os.path.join(input_path, f),
+                    os.path.join(input_path, 'hardlink'))
+            os.makedirs(os.path.join(input_path, 'sub'))
+            os.symlink('..', os.path.join(input_path, 'sub', 'loop'))
+        output_path = os.path.join(OUTPUT_DIR, 'links_output_' + symlinks)
+        reencode_path = os.path.join(OUTPUT_DIR, 'links_new_' + symlinks)
+
+        processor = Medusa(algo='caesar', params=dict(shift=1),
+                           symlinks=symlinks)
+        processed = []
+        process_file = processor.process_file
+
+        def counted(input_path, *args, **kwargs):
+            processed.append(input_path)
+            return process_file(input_path, *args, **kwargs)
+
+        processor.process_file = counted
+        processor.encode_dir(input_path, output_path)
+        processor.decode_dir(output_path, reencode_path)
+
+        # each inode is processed once, and the links are recreated
+        f = sorted(os.listdir(input_path))[0]
+        assert len(processed) == 2 * (len(os.listdir(input_path)) - 2)
+        for path in [output_path, reencode_path]:
+            assert os.path.samefile(os.path.join(path, f),
+                                    os.path.join(path, 'hardlink'))
+            loop = os.path.join(path, 'sub', 'loop')
+            assert os.path.islink(loop) == (symlinks != 'skip')
+            if symlinks != 'skip':
+                assert os.readlink(loop) == '..'
+        with open(os.path.join(input_path, f), 'rb') as FILE:
+            input_content = FILE.read()
+        with open(os.path.join(reencode_path, 'hardlink'), 'rb') as FILE:
+            assert FILE.read() == input_content
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_passthrough(self, workers):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        encoded_path = os.path.join(OUTPUT_DIR, 'passthrough_input')
+        output_path = os.path.join(OUTPUT_DIR,
+                                   'passthrough_output_{}'.format(workers))
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           checksum=True)
+        processor.process_dir(input_path, encoded_path, 'encode')
+
+        # the already encoded files are copied as is, and so are the
+        # excluded ones
+        files = sorted(os.listdir(encoded_path))
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           exclude=[files[0]], workers=workers,
+                           passthrough=True)
+        processor.process_dir(encoded_path, output_path, 'encode')
+        assert sorted(os.listdir(output_path)) == files
+        for f in files:
+            with open(os.path.join(encoded_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(output_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    @pytest.mark.parametrize('algo', ['vigenere', 'aes'])
+    def test_pipelined(self, algo):
+        input_path = os.path.join(INPUT_DIR, 'input_dir')
+        params = dict(key='key', complement_key='complement') \
+            if algo == 'vigenere' else dict(password='password')
+        processor = Medusa(algo=algo, params=params, chunk_size=16)
+        ctx = processor.process_dir(
+            input_path, os.path.join(OUTPUT_DIR, 'sequential_' + algo),
+            'encode')
+
+        # the files are read ahead and written behind, with the same outputs
+        processor = Medusa(algo=algo, params=params, chunk_size=16,
+                           pipelined=True)
+        encoded_path = os.path.join(OUTPUT_DIR, 'pipelined_' + algo)
+        processor.process_dir(input_path, encoded_path, 'encode', **ctx)
+        output_path = os.path.join(OUTPUT_DIR, 'pipelined_output_' + algo)
+        processor.process_dir(encoded_path, output_path, 'decode', **ctx)
+        for f in os.listdir(input_path):
+            if algo == 'vigenere':
+                with open(os.path.join(OUTPUT_DIR, 'sequential_' + algo, f),
+                          'rb') as FILE:
+                    encoded_content = FILE.read()
+                with open(os.path.join(encoded_path, f), 'rb') as FILE:
+                    assert FILE.read() == encoded_content
+            with open(os.path.join(input_path, f), 'rb') as FILE:
+                input_content = FILE.read()
+            with open(os.path.join(output_path, f), 'rb') as FILE:
+                assert FILE.read() == input_content
+
+    @pytest.mark.parametrize('polling', [False, True])
+    def test_watch(self, polling):
+        watched_path = os.path.join(OUTPUT_DIR, 'watched_{}'.format(polling))
+        output_path = os.path.join(OUTPUT_DIR, 'watch_output_{}'.format(polling))
+        done_path = os.path.join(OUTPUT_DIR, 'watch_done_{}'.format(polling))
+        os.makedirs(os.path.join(watched_path, 'sub'))
+        for f in ['existing.txt', 'copy.txt']:
+            with open(os.path.join(watched_path, f), 'w') as FILE:
+                FILE.write('existing content')
+
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        watchers = []
+        result = {}
+
+        def _watch():
+            result['ctx'] = processor.watch_dir(
+                watched_path, output_path, settle=0.1, move_to=done_path,
+                polling=polling, interval=0.1, on_start=watchers.append)
+
+        thread = threading.Thread(target=_watch)
+        thread.start()
+        try:
+            with open(os.path.join(watched_path, 'sub', 'new.txt'), 'w') as FILE:
+                FILE.write('new content')
+            deadline = time.time() + 10
+            while len(os.listdir(watched_path)) != 1 or \
+                    len(os.listdir(os.path.join(watched_path, 'sub'))) > 0:
+                assert time.time() < deadline
+                time.sleep(0.05)
+        finally:
+            while len(watchers) == 0:
+                time.sleep(0.01)
+            watchers[0].stop()
+            thread.join()
+
+        # each file is encoded with its own IV (recorded in its header)
+        outputs = []
+        for f in ['existing.txt', 'copy.txt']:
+            with open(os.path.join(output_path, f), 'rb') as FILE:
+                outputs.append(FILE.read()[-len('existing content'):])
+        assert outputs[0] != outputs[1]
+
+        # the sources are moved once encoded
+        for f, content in [('existing.txt', 'existing content'),
+                           ('copy.txt', 'existing content'),
+                           (os.path.join('sub', 'new.txt'), 'new content')]:
+            with open(os.path.join(done_path, f), 'r') as FILE:
+                assert FILE.read() == content
+            processor.process_file(os.path.join(output_path, f),
+                                   os.path.join(OUTPUT_DIR, 'watch_decoded'),
+                                   'decode', **result['ctx'])
+            with open(os.path.join(OUTPUT_DIR, 'watch_decoded'), 'r') as FILE:
+                assert FILE.read() == content
@@ -1,9 +1,15 @@
+import io
 import os
 import pytest
 import subprocess
+import sys
 import shutil
+import threading
+import time
 
-from medusa import Medusa
+from medusa import Medusa, MedusaError, records, writers
+from medusa.algorithms.aes import calibrate_kdf, parse_kdf
+from medusa.memory import MemoryBudget, parse_size
 
 INPUT_DIR = os.path.join(os.path.dirname(__file__), 'data')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
@@ -44,11 +50,408 @@ class TestFile():
         with open(input_path, 'r') as FILE:
             input_content = FILE.read()
 
-        with open(output_path, 'r') as FILE:
+        with open(output_path, 'rb') as FILE:
             output_content = FILE.read()
 
         with open(reencode_path, 'r') as FILE:
             reencode_content = FILE.read()
 
         assert input_content == reencode_content
-        assert input_content != output_content
+        assert input_content.encode() != output_content
+
+    @pytest.mark.parametrize('durability', ['none', 'file', 'batch'])
+    def test_durability(self, durability):
+        processor = Medusa(algo='caesar', params=dict(shift=1),
+                           durability=durability)
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'durable.txt')
+        reencode_path = os.path.join(OUTPUT_DIR, 'durable_new.txt')
+
+        processor.encode_file(input_path, output_path)
+        processor.decode_file(output_path, reencode_path)
+
+        with open(input_path, 'r') as FILE:
+            input_content = FILE.read()
+        with open(reencode_path, 'r') as FILE:
+            reencode_content = FILE.read()
+        assert input_content == reencode_content
+        # no temporary file is left behind
+        assert not any(f.endswith('.tmp') for f in os.listdir(OUTPUT_DIR))
+
+    def test_atomic_write(self):
+        processor = Medusa(algo='caesar', params=dict(shift=1))
+        output_path = os.path.join(OUTPUT_DIR, 'atomic.txt')
+        with open(output_path, 'w') as FILE:
+            FILE.write('previous')
+
+        with pytest.raises(RuntimeError):
+            with processor.writer.open(output_path) as FILE_WRITE:
+                FILE_WRITE.write('partial')
+                raise RuntimeError()
+
+        with open(output_path, 'r') as FILE:
+            assert FILE.read() == 'previous'
+        assert not any(f.endswith('.tmp') for f in os.listdir(OUTPUT_DIR))
+
+    def test_output_mode(self):
+        # the outputs get the permissions of the umask, which is left as is
+        processor = Medusa(algo='caesar', params=dict(shift=1))
+        output_path = os.path.join(OUTPUT_DIR, 'mode.txt')
+        umask = os.umask(0o027)
+        try:
+            with processor.writer.open(output_path) as FILE_WRITE:
+                FILE_WRITE.write('content')
+            assert os.umask(0o027) == 0o027
+        finally:
+            os.umask(umask)
+        assert os.stat(output_path).st_mode & 0o777 == 0o640
+
+    @pytest.mark.parametrize('compression', ['zlib', 'lzma', 'bz2'])
+    def test_compression(self, compression):
+        processor = Medusa(algo='vigenere',
+                           params=dict(key='key', complement_key='complement_key'),
+                           compression=compression, chunk_size=100)
+        input_path = os.path.join(OUTPUT_DIR, 'compressible.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'compressed.txt')
+        reencode_path = os.path.join(OUTPUT_DIR, 'decompressed.txt')
+        with open(input_path, 'w') as FILE:
+            FILE.write('hello world\n' * 1000)
+
+        processor.encode_file(input_path, output_path)
+        assert os.path.getsize(output_path) < os.path.getsize(input_path) / 10
+
+        processor.decode_file(output_path, reencode_path)
+        with open(input_path, 'r') as FILE:
+            input_content = FILE.read()
+        with open(reencode_path, 'r') as FILE:
+            reencode_content = FILE.read()
+        assert input_content == reencode_content
+
+    @pytest.mark.parametrize('algo,params,compression', [
+        ('vigenere', dict(key='key', complement_key='complement_key'), None),
+        ('aes', dict(password='password'), None),
+        ('aes', dict(password='password'), 'zlib'),
+        ('rsa', dict(), None),
+    ])
+    def test_open(self, algo, params, compression):
+        output_path = os.path.join(
+            OUTPUT_DIR, 'open_{}_{}.bin'.format(algo, compression))
+        content = b'medusa,file,object\n' * 10
+        processor = Medusa(algo=algo, params=params, compression=compression,
+                           chunk_size=64)
+
+        with processor.open(output_path, 'wb') as FILE:
+            for i in range(0, len(content), 7):
+                FILE.write(content[i:i + 7])
+        with open(output_path, 'rb') as FILE:
+            assert content not in FILE.read()
+
+        with processor.open(output_path, 'rb', **processor.get_context()) as FILE:
+            assert FILE.read() == content
+            if compression is None and algo != 'rsa':
+                assert FILE.seekable()
+                FILE.seek(100)
+                assert FILE.read(50) == content[100:150]
+                FILE.seek(-10, io.SEEK_END)
+                assert FILE.read() == content[-10:]
+            else:
+                assert not FILE.seekable()
+
+    @pytest.mark.parametrize('encoding', ['raw', 'base64', 'base85', 'hex'])
+    def test_output_encoding(self, encoding):
+        input_path = os.path.join(OUTPUT_DIR, 'encoding_input.bin')
+        output_path = os.path.join(OUTPUT_DIR, 'encoding_{}.bin'.format(encoding))
+        reencode_path = os.path.join(OUTPUT_DIR, 'encoding_{}.dec'.format(encoding))
+        content = bytes(range(256)) * 100
+        with open(input_path, 'wb') as FILE:
+            FILE.write(content)
+
+        processor = Medusa(algo='caesar', params=dict(shift=3),
+                           output_encoding=encoding, chunk_size=1000)
+        processor.encode_file(input_path, output_path)
+        with open(output_path, 'rb') as FILE:
+            output_content = FILE.read()
+        if encoding == 'raw':
+            # (no UTF-8 inflation of the characters above 127)
+            assert len(output_content) < len(content) + 200
+        else:
+            assert output_content.decode('ascii').isprintable()
+
+        # the encoding is detected when decoding
+        processor = Medusa(algo='caesar', params=dict(shift=3), chunk_size=777)
+        processor.decode_file(output_path, reencode_path)
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == content
+
+    def test_memory_budget(self):
+        budget = MemoryBudget(100)
+        assert budget.acquire(1000) == 100
+        assert not budget.try_acquire(1)
+
+        # admission blocks until the memory is released
+        acquired = threading.Event()
+        thread = threading.Thread(
+            target=lambda: (budget.acquire(60), acquired.set()))
+        thread.start()
+        assert not acquired.wait(0.1)
+        budget.release(100)
+        assert acquired.wait(1)
+        thread.join()
+        assert budget.used == 60 and budget.peak == 100
+
+        assert parse_size('512M') == 512 * 1024 ** 2
+        assert parse_size('64k') == 64 * 1024
+
+    def test_max_memory(self):
+        input_path = os.path.join(OUTPUT_DIR, 'memory_input.bin')
+        output_path = os.path.join(OUTPUT_DIR, 'memory_output.bin')
+        reencode_path = os.path.join(OUTPUT_DIR, 'memory_new.bin')
+        content = os.urandom(1024 * 1024)
+        with open(input_path, 'wb') as FILE:
+            FILE.write(content)
+
+        # the file does not fit in the budget: it is streamed in small chunks
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           max_memory='256K', chunk_size=16 * 1024)
+        processor.encode_file(input_path, output_path)
+        processor.process_file(output_path, reencode_path, 'decode',
+                               **processor.get_context())
+        assert processor.memory.peak <= 256 * 1024
+        assert processor.memory.used == 0
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == content
+
+    def test_throttle(self):
+        input_path = os.path.join(OUTPUT_DIR, 'throttle_input.bin')
+        output_path = os.path.join(OUTPUT_DIR, 'throttle_output.bin')
+        reencode_path = os.path.join(OUTPUT_DIR, 'throttle_new.bin')
+        control_path = os.path.join(OUTPUT_DIR, 'throttle_control')
+        content = os.urandom(512 * 1024)
+        with open(input_path, 'wb') as FILE:
+            FILE.write(content)
+
+        # the reads are limited to the rate (beyond the first burst)
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           read_rate='1M', chunk_size=64 * 1024)
+        start = time.time()
+        processor.encode_file(input_path, output_path)
+        assert 0.4 < time.time() - start < 2
+        assert processor.throttle.read_bytes == len(content)
+
+        # the control file overrides the limits
+        with open(control_path, 'w') as FILE:
+            FILE.write('read_rate=none\ncpu_limit=0.5\n')
+        processor.throttle.control_file = control_path
+        processor.throttle.reload()
+        assert processor.throttle.limits == {
+            'read_rate': None, 'write_rate': None, 'cpu_limit': 0.5}
+        start = time.time()
+        processor.process_file(output_path, reencode_path, 'decode',
+                               **processor.get_context())
+        assert time.time() - start < 0.4
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == content
+
+        # an invalid control file is ignored (the limits are kept)
+        with open(control_path, 'w') as FILE:
+            FILE.write('read_rate=10M\ncpu_limit=0\n')
+        processor.throttle.reload()
+        assert processor.throttle.limits == {
+            'read_rate': None, 'write_rate': None, 'cpu_limit': 0.5}
+
+        # invalid limits are refused
+        for limits in [dict(cpu_limit=0), dict(cpu_limit=-1),
+                       dict(read_rate='fast'), dict(ionice='idle:x'),
+                       dict(ionice='best-effort:8')]:
+            with pytest.raises(MedusaError):
+                Medusa(algo='aes', params=dict(password='password'),
+                       exit_on_error=False, **limits)
+
+    def test_priority(self):
+        # the niceness is a target, not an increment (in a child process, so
+        # that the tests keep their priority)
+        script = ('import os; from medusa.throttle import set_priority; '
+                  'base = os.getpriority(os.PRIO_PROCESS, 0); '
+                  'set_priority(nice=base + 5); set_priority(nice=base + 5); '
+                  'print(os.getpriority(os.PRIO_PROCESS, 0) - base)')
+        env = dict(os.environ,
+                   PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+        out = subprocess.check_output([sys.executable, '-c', script], env=env)
+        assert out.strip() == b'5'
+
+    @pytest.mark.parametrize('name', ['pbkdf2', 'scrypt'])
+    def test_kdf(self, name):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'kdf_{}.bin'.format(name))
+        reencode_path = os.path.join(OUTPUT_DIR, 'kdf_{}.txt'.format(name))
+
+        kdf, elapsed = calibrate_kdf(name, target=0.01)
+        assert kdf.startswith(name + ':') and elapsed < 0.5
+        processor = Medusa(algo='aes', params=dict(password='password'),
+                           kdf=kdf)
+        processor.encode_file(input_path, output_path)
+        ctx = processor.get_context()
+        assert ctx['kdf'] == kdf
+
+        # the key derivation is read from the header
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        processor.process_file(output_path, reencode_path, 'decode',
+                               iv=ctx['iv'], salt=ctx['salt'])
+        with open(input_path, 'r') as FILE:
+            input_content = FILE.read()
+        with open(reencode_path, 'r') as FILE:
+            assert FILE.read() == input_content
+
+        with pytest.raises(ValueError):
+            parse_kdf('scrypt:1000:8:1')
+
+    @pytest.mark.parametrize('algo,params', [
+        ('caesar', dict(shift=3)),
+        ('vigenere', dict(key='key', complement_key='complement_key')),
+        ('aes', dict(password='password')),
+        ('rsa', dict()),
+    ])
+    def test_records(self, algo, params):
+        input_path = os.path.join(OUTPUT_DIR, 'records_input.jsonl')
+        output_path = os.path.join(OUTPUT_DIR, 'records_{}.enc'.format(algo))
+        reencode_path = os.path.join(OUTPUT_DIR, 'records_{}.jsonl'.format(algo))
+        records = [('{"id": %d, "msg": "%s"}\n' % (i, 'x' * (i % 7))).encode()
+                   for i in range(300)]
+        with open(input_path, 'wb') as FILE:
+            FILE.write(b''.join(records[:-1]) + records[-1].rstrip(b'\n'))
+
+        processor = Medusa(algo=algo, params=params, records='\n',
+                           chunk_size=100)
+        processor.encode_file(input_path, output_path)
+        assert os.path.exists(output_path + '.idx')
+        ctx = processor.get_context()
+
+        # records are decoded on their own, from the index
+        assert processor.read_records(output_path, 42, **ctx) == [records[42]]
+        assert processor.read_records(output_path, 100, 110, **ctx) == \
+            records[100:110]
+        with pytest.raises(IndexError):
+            processor.read_records(output_path, 300, **ctx)
+
+        processor.process_file(output_path, reencode_path, 'decode', **ctx)
+        with open(input_path, 'rb') as FILE:
+            input_content = FILE.read()
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == input_content
+
+    def test_record_batches(self, monkeypatch):
+        # (a delimiter cut between two chunks, and records longer than them)
+        data = b'a||bb||' + b'c' * 50 + b'||' + b'd' * 10
+        batches = list(records.iter_record_batches(io.BytesIO(data), b'||', 4))
+        assert sum(batches, []) == [b'a||', b'bb||', b'c' * 50 + b'||',
+                                    b'd' * 10]
+
+        # a record can only be so long
+        with pytest.raises(ValueError):
+            list(records.iter_record_batches(io.BytesIO(b'x' * 100), b'\n', 8,
+                                             max_record_size=50))
+        input_path = os.path.join(OUTPUT_DIR, 'records_long.txt')
+        with open(input_path, 'wb') as FILE:
+            FILE.write(b'x' * 1000)
+        monkeypatch.setattr(records, 'MAX_RECORD_SIZE', 500)
+        processor = Medusa(algo='caesar', params=dict(shift=1), records='\n',
+                           chunk_size=100, exit_on_error=False)
+        with pytest.raises(MedusaError):
+            processor.encode_file(input_path, input_path + '.enc')
+        assert not os.path.exists(input_path + '.enc')
+
+    def test_envelope(self):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'envelope.bin')
+        reencode_path = os.path.join(OUTPUT_DIR, 'envelope.txt')
+        with open(input_path, 'rb') as FILE:
+            input_content = FILE.read()
+
+        processor = Medusa(algo='aes', params=dict(password='old'),
+                           envelope='password', exit_on_error=False)
+        processor.encode_file(input_path, output_path)
+        size = os.path.getsize(output_path)
+        with open(output_path, 'rb') as FILE:
+            content = FILE.read()[-len(input_content):]
+
+        # rotating the password only rewrites the header
+        assert processor.rekey(output_path, dict(password='new')) == 1
+        assert os.path.getsize(output_path) == size
+        with open(output_path, 'rb') as FILE:
+            assert FILE.read()[-len(input_content):] == content
+        with pytest.raises(ValueError):
+            processor.decode_file(output_path, reencode_path)
+
+        # the data key can also be wrapped with an RSA key
+        rsa = Medusa(algo='rsa', params=dict()).get_context()
+        processor = Medusa(algo='aes', params=dict(password='new'),
+                           envelope='password')
+        processor.rekey(output_path, dict(n=rsa['n'], e=rsa['e']),
+                        new_envelope='rsa')
+        processor = Medusa(algo='aes', params=rsa, envelope='rsa')
+        processor.decode_file(output_path, reencode_path)
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == input_content
+
+    def test_interrupted_rekey(self, monkeypatch):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'interrupted_rekey.bin')
+        reencode_path = os.path.join(OUTPUT_DIR, 'interrupted_rekey.txt')
+        with open(input_path, 'rb') as FILE:
+            input_content = FILE.read()
+        processor = Medusa(algo='aes', params=dict(password='old'),
+                           envelope='password')
+        processor.encode_file(input_path, output_path)
+
+        # the header is torn by a crash while it is rewritten
+        def _torn(fd, data, offset):
+            os.pwrite(fd, data[:len(data) // 2], offset)
+            raise KeyboardInterrupt()
+
+        monkeypatch.setattr(writers, '_pwrite_all', _torn)
+        with pytest.raises(KeyboardInterrupt):
+            processor.rekey(output_path, dict(password='new'))
+        monkeypatch.undo()
+        assert os.path.exists(writers.patch_path(output_path))
+
+        # the next rekey restores the old header first
+        assert processor.rekey(output_path, dict(password='new')) == 1
+        assert not os.path.exists(writers.patch_path(output_path))
+        processor = Medusa(algo='aes', params=dict(password='new'),
+                           envelope='password')
+        processor.decode_file(output_path, reencode_path)
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == input_content
+
+    def test_recipients(self):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'recipients.bin')
+        reencode_path = os.path.join(OUTPUT_DIR, 'recipients.txt')
+        with open(input_path, 'rb') as FILE:
+            input_content = FILE.read()
+
+        keys = [Medusa(algo='rsa', params=dict()).get_context()
+                for _ in range(3)]
+        processor = Medusa(algo='aes', params=dict(),
+                           recipients=[(k['n'], k['e']) for k in keys[:2]])
+        processor.encode_file(input_path, output_path)
+        # (the content is encrypted once, whatever the number of recipients)
+        assert os.path.getsize(output_path) < len(input_content) + 4096
+
+        for key in keys[:2]:
+            processor = Medusa(algo='aes', params=key, envelope='rsa')
+            processor.decode_file(output_path, reencode_path)
+            with open(reencode_path, 'rb') as FILE:
+                assert FILE.read() == input_content
+        processor = Medusa(algo='aes', params=keys[2], envelope='rsa')
+        with pytest.raises(ValueError):
+            processor.decode_file(output_path, reencode_path)
+
+        # recipients can be changed by rekeying
+        processor = Medusa(algo='aes', params=keys[0], envelope='rsa')
+        processor.rekey(output_path, dict(),
+                        recipients=[(keys[2]['n'], keys[2]['e'])])
+        processor = Medusa(algo='aes', params=keys[2], envelope='rsa')
+        processor.decode_file(output_path, reencode_path)
+        with open(reencode_path, 'rb') as FILE:
+            assert FILE.read() == input_content
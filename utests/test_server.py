@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from medusa import MedusaClient, MedusaServer
+from medusa.algorithms import aes
+from medusa.server import MAX_PROCESSORS
+
+INPUT_DIR = os.path.join(os.path.dirname(__file__), 'data')
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
+SOCKET_DIR = tempfile.mkdtemp()
+SOCKET_PATH = os.path.join(SOCKET_DIR, 'medusa.sock')
+
+server = None
+
+
+def setup_module(module):
+    global server
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+    server = MedusaServer(socket_path=SOCKET_PATH, workers=2).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def teardown_module(module):
+    server.shutdown()
+    shutil.rmtree(SOCKET_DIR, ignore_errors=True)
+    if os.path.exists(OUTPUT_DIR):
+        shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+
+
+class TestServer():
+
+    def test_socket(self):
+        # only the owner can connect (and the private directory the socket is
+        # bound in is removed)
+        assert os.stat(SOCKET_PATH).st_mode & 0o777 == 0o600
+        assert os.listdir(SOCKET_DIR) == ['medusa.sock']
+
+    def test_inline(self):
+        with MedusaClient(SOCKET_PATH) as client:
+            encoded, _ = client.encode('caesar', dict(shift=1), 'hello world')
+            assert encoded == 'ifmmp!xpsme'
+            decoded = client.decode('caesar', dict(shift=1), encoded)
+            assert decoded == 'hello world'
+
+    def test_inline_aes(self):
+        text = 'hello world'
+        params = dict(password='password')
+        with MedusaClient(SOCKET_PATH) as client:
+            encoded_1, ctx_1 = client.encode('aes', params, text)
+            encoded_2, ctx_2 = client.encode('aes', params, text)
+            # each job gets its own IV
+            assert ctx_1['iv'] != ctx_2['iv']
+            assert encoded_1 != encoded_2
+
+            decoded = client.decode('aes', params, encoded_1,
+                                    iv=ctx_1['iv'], salt=ctx_1['salt'])
+            assert decoded == text
+
+            # a password given with the job is not sent back
+            response = client._job('encode', 'aes', params, content=text,
+                                   extra=dict(password='other'))
+            assert sorted(response['context']) == ['iv', 'salt']
+
+    def test_file(self):
+        input_path = os.path.join(INPUT_DIR, 'input.txt')
+        output_path = os.path.join(OUTPUT_DIR, 'daemon_output.txt')
+        reencode_path = os.path.join(OUTPUT_DIR, 'daemon_new.txt')
+
+        with MedusaClient(SOCKET_PATH) as client:
+            client.encode_file('caesar', dict(shift=3), input_path, output_path)
+            client.decode_file('caesar', dict(shift=3), output_path,
+                               reencode_path)
+
+        with open(input_path, 'r') as FILE:
+            text = FILE.read()
+        with open(reencode_path, 'r') as FILE:
+            decoded = FILE.read()
+        assert decoded == text
+
+    def test_error(self):
+        with MedusaClient(SOCKET_PATH) as client:
+            try:
+                client.encode('gloubi', {}, 'hello world')
+            except RuntimeError:
+                pass
+            else:
+                assert False, 'unknown algorithm should fail'
+            # the connection is still usable after a failed job
+            encoded, _ = client.encode('caesar', dict(shift=1), 'a')
+            assert encoded == 'b'
+
+    def test_processors_cache(self):
+        with MedusaClient(SOCKET_PATH) as client:
+            for shift in range(1, MAX_PROCESSORS + 3):
+                encoded, _ = client.encode('caesar', dict(shift=shift), 'a')
+                assert encoded == chr(ord('a') + shift)
+        # only the most recently used instances are kept, without their
+        # params in the cache keys
+        assert len(server._processors) <= MAX_PROCESSORS
+        for key in server._processors:
+            assert isinstance(key, bytes) and b'shift' not in key
+
+    def test_key_cache(self):
+        with MedusaClient(SOCKET_PATH) as client:
+            for i in range(aes.KEY_CACHE_SIZE + 2):
+                client.encode('aes', dict(password='secret{}'.format(i)), 'a')
+        # the derived keys are kept without their passwords
+        assert len(aes._KEY_CACHE) <= aes.KEY_CACHE_SIZE
+        for key in aes._KEY_CACHE:
+            assert isinstance(key, bytes) and b'secret' not in key
@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from medusa import Medusa
+from medusa.tuning import (auto_tune, available_cpus, cgroup_cpu_limit,
+                           cgroup_memory_limit)
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
+
+
+def setup_module(module):
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+
+def teardown_module(module):
+    if os.path.exists(OUTPUT_DIR):
+        shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+
+
+def write_files(root, files):
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as FILE:
+            FILE.write(content + '\n')
+
+
+class TestTuning():
+
+    def test_cgroup_v2(self):
+        root = os.path.join(OUTPUT_DIR, 'cgroup_v2')
+        write_files(root, {'cpu.max': '200000 100000',
+                           'memory.max': str(4 * 1024 ** 3)})
+        assert cgroup_cpu_limit(root) == 2
+        assert cgroup_memory_limit(root) == 4 * 1024 ** 3
+        assert available_cpus(root) <= 2
+
+        write_files(root, {'cpu.max': 'max 100000', 'memory.max': 'max'})
+        assert cgroup_cpu_limit(root) is None
+        assert cgroup_memory_limit(root) is None
+
+    def test_cgroup_v1(self):
+        root = os.path.join(OUTPUT_DIR, 'cgroup_v1')
+        write_files(root, {'cpu/cpu.cfs_quota_us': '150000',
+                           'cpu/cpu.cfs_period_us': '100000',
+                           'memory/memory.limit_in_bytes': str(1024 ** 3)})
+        assert cgroup_cpu_limit(root) == 1.5
+        assert cgroup_memory_limit(root) == 1024 ** 3
+
+        write_files(root, {'cpu/cpu.cfs_quota_us': '-1',
+                           'memory/memory.limit_in_bytes': '9223372036854771712'})
+        assert cgroup_cpu_limit(root) is None
+        assert cgroup_memory_limit(root) is None
+
+    def test_auto_tune(self):
+        root = os.path.join(OUTPUT_DIR, 'cgroup_tune')
+        write_files(root, {'cpu.max': '100000 100000',
+                           'memory.max': str(64 * 1024 ** 2)})
+        processor = Medusa(algo='aes', params=dict(password='password'))
+        settings, measures = auto_tune(processor, OUTPUT_DIR, root=root)
+        assert settings['workers'] == 1
+        assert settings['strategy'] == 'thread'
+        assert settings['max_memory'] == 32 * 1024 ** 2
+        assert settings['chunk_size'] <= 16 * 1024 ** 2
+        assert measures['cipher_throughput'] > 0
+
+        # explicit settings are kept
+        settings = processor.tune(OUTPUT_DIR, workers=3, chunk_size='128K')
+        assert processor.workers == 3
+        assert processor.chunk_size == 128 * 1024